@@ -0,0 +1,227 @@
+'''Índice local de texto completo de los anuncios obtenidos.
+Cada anuncio se guarda en SQLite con un índice FTS5 sobre el título, la descripción,
+el nombre, la provincia, el municipio y la subcategoría, y con índices normales sobre
+el precio y la provincia. Los anuncios se acumulan en memoria y se escriben por lotes
+en una sola transacción, fuera del bucle de eventos del bot, para que indexarlos no
+retrase el scraping ni los envíos. Las búsquedas recorren el índice desde los anuncios
+más nuevos y se detienen al completar la página pedida, por lo que son rápidas aunque
+el índice tenga millones de anuncios.
+'''
+__version__ = '1.0'
+__author__ = 'Santiago Orellana Perez'
+__created__ = '18/octubre/2026'
+__tested__ = 'Python 3.10'
+
+import sqlite3
+import threading
+
+FILE_AD_INDEX = './ads_index.db'
+
+# Cantidad de anuncios acumulados a partir de la cual se escriben en el índice.
+AD_INDEX_BATCH = 200
+
+# Segundos entre escrituras del índice aunque no se haya completado un lote.
+AD_INDEX_FLUSH_SECONDS = 30
+
+SEARCH_PAGE_SIZE = 10
+
+FIELDS_TEXT = ['title', 'description', 'name', 'province', 'municipality', 'subcategory']
+
+
+def fts_query(words, column=None):
+    '''Convierte palabras del usuario en una consulta FTS5 que busca todas las palabras.
+    Una palabra terminada en * se busca como prefijo, lo que es bastante más lento.
+    Las comillas evitan que los caracteres especiales de FTS5 se interpreten como operadores.
+    '''
+    terms = []
+    for word in words:
+        prefix = '*' if word.endswith('*') else ''
+        word = word.rstrip('*').replace('"', '""')
+        if word.strip('"') != '':
+            terms.append('"{}"{}'.format(word, prefix))
+    if len(terms) == 0:
+        return None
+    query = ' '.join(terms)
+    if column is not None:
+        query = '{} : ({})'.format(column, query)
+    return query
+
+
+def parse_price(value):
+    '''Convierte un rango de precios MIN-MAX, MIN- o -MAX (o un solo precio máximo) en (mínimo, máximo).
+    Los extremos que no se indican son None. Lanza ValueError si no son números.
+    '''
+    low, dash, high = value.partition('-')
+    minPrice = float(low) if low != '' else None
+    maxPrice = float(high) if high != '' else None
+    if dash == '':
+        minPrice, maxPrice = None, float(low)
+    return minPrice, maxPrice
+
+
+def parse_search(text):
+    '''Separa el texto de /search en palabras y filtros.
+    Filtros: precio:MIN-MAX (o precio:MIN- y precio:-MAX), provincia:NOMBRE y pagina:N.
+    En el nombre de la provincia los espacios se escriben con _, ej: provincia:santiago_de_cuba
+    Devuelve un diccionario con 'words', 'minPrice', 'maxPrice', 'province' y 'page'.
+    '''
+    search = {'words':[], 'minPrice':None, 'maxPrice':None, 'province':None, 'page':1}
+    for token in text.split():
+        key, separator, value = token.partition(':')
+        key = key.lower()
+        if separator and key in ['precio', 'price']:
+            try:
+                minPrice, maxPrice = parse_price(value)
+            except ValueError:
+                continue
+            if minPrice is not None:
+                search['minPrice'] = minPrice
+            if maxPrice is not None:
+                search['maxPrice'] = maxPrice
+        elif separator and key in ['provincia', 'province']:
+            search['province'] = value.replace('_', ' ')
+        elif separator and key in ['pagina', 'página', 'page']:
+            try:
+                search['page'] = max(1, int(value))
+            except ValueError:
+                pass
+        else:
+            search['words'].append(token)
+    return search
+
+
+
+class AdIndex():
+    '''Índice de anuncios en SQLite FTS5 con escritura por lotes.'''
+    def __init__(self, fileName=FILE_AD_INDEX, batchSize=AD_INDEX_BATCH):
+        self.fileName = fileName
+        self.batchSize = batchSize
+        self._pending = []
+        self._lock = threading.Lock()
+        self.indexed = 0
+        self.connection = sqlite3.connect(fileName, isolation_level=None, check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.execute('''CREATE TABLE IF NOT EXISTS ads (
+            ad_id INTEGER PRIMARY KEY,
+            title TEXT, description TEXT, name TEXT,
+            province TEXT, municipality TEXT, subcategory TEXT,
+            subcategory_id INTEGER, price REAL, currency TEXT,
+            permalink TEXT, updated TEXT)''')
+        self.connection.execute('CREATE INDEX IF NOT EXISTS ads_price ON ads (price)')
+        self.connection.execute('CREATE INDEX IF NOT EXISTS ads_province ON ads (province)')
+        self.connection.execute('''CREATE VIRTUAL TABLE IF NOT EXISTS ads_fts USING fts5(
+            {}, content='ads', content_rowid='ad_id', tokenize='unicode61 remove_diacritics 2')'''.format(', '.join(FIELDS_TEXT)))
+        # Los disparadores mantienen el índice FTS5 igual a la tabla de anuncios.
+        columns = ', '.join(FIELDS_TEXT)
+        newValues = ', '.join(['new.' + field for field in FIELDS_TEXT])
+        oldValues = ', '.join(['old.' + field for field in FIELDS_TEXT])
+        self.connection.execute('''CREATE TRIGGER IF NOT EXISTS ads_insert AFTER INSERT ON ads BEGIN
+            INSERT INTO ads_fts (rowid, {0}) VALUES (new.ad_id, {1}); END'''.format(columns, newValues))
+        self.connection.execute('''CREATE TRIGGER IF NOT EXISTS ads_delete AFTER DELETE ON ads BEGIN
+            INSERT INTO ads_fts (ads_fts, rowid, {0}) VALUES ('delete', old.ad_id, {1}); END'''.format(columns, oldValues))
+        self.connection.execute('''CREATE TRIGGER IF NOT EXISTS ads_update AFTER UPDATE ON ads BEGIN
+            INSERT INTO ads_fts (ads_fts, rowid, {0}) VALUES ('delete', old.ad_id, {1});
+            INSERT INTO ads_fts (rowid, {0}) VALUES (new.ad_id, {2}); END'''.format(columns, oldValues, newValues))
+
+
+    @staticmethod
+    def to_row(ad):
+        try:
+            price = float(ad.get('price')) if ad.get('price') is not None else None
+        except (TypeError, ValueError):
+            price = None
+        return (int(ad['id']), ad.get('title'), ad.get('description'), ad.get('name'),
+                ad.get('provinceName'), ad.get('municipalityName'), ad.get('subcategoryName'),
+                ad.get('subcategoryID'), price, ad.get('currency'), ad.get('permalink'), ad.get('updatedOnByUser'))
+
+
+    def add(self, ad):
+        '''Agrega el anuncio al lote pendiente. Devuelve True si el lote está completo y se debe llamar a flush().'''
+        with self._lock:
+            self._pending.append(self.to_row(ad))
+            return len(self._pending) >= self.batchSize
+
+
+    def flush(self):
+        '''Escribe en el índice todos los anuncios pendientes en una sola transacción.
+        Devuelve la cantidad de anuncios escritos. Puede llamarse desde otro hilo.
+        '''
+        with self._lock:
+            rows = self._pending
+            self._pending = []
+            if len(rows) == 0:
+                return 0
+            with self.connection:
+                self.connection.execute('BEGIN IMMEDIATE')
+                self.connection.executemany('INSERT OR REPLACE INTO ads VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', rows)
+            self.indexed += len(rows)
+            return len(rows)
+
+
+    def add_many(self, ads):
+        '''Agrega muchos anuncios, escribiéndolos por lotes. Se usa para importar un archivo.'''
+        count = 0
+        for ad in ads:
+            if self.add(ad):
+                count += self.flush()
+        return count + self.flush()
+
+
+    def search(self, words, minPrice=None, maxPrice=None, province=None, page=1, pageSize=SEARCH_PAGE_SIZE):
+        '''Busca los anuncios que contienen todas las palabras, del más nuevo al más viejo.
+        Devuelve la lista de anuncios de la página pedida y si hay más páginas.
+        '''
+        conditions = []
+        params = []
+        matches = []
+        query = fts_query(words)
+        if query is not None:
+            matches.append(query)
+        if province:
+            matches.append(fts_query(province.split(), 'province'))
+        if len(matches) > 0:
+            conditions.append('ads_fts MATCH ?')
+            params.append(' AND '.join(['({})'.format(match) for match in matches]))
+        if minPrice is not None:
+            conditions.append('ads.price >= ?')
+            params.append(minPrice)
+        if maxPrice is not None:
+            conditions.append('ads.price <= ?')
+            params.append(maxPrice)
+        where = 'WHERE ' + ' AND '.join(conditions) if len(conditions) > 0 else ''
+        if len(matches) > 0:
+            sql = '''SELECT ads.ad_id, ads.title, ads.price, ads.currency, ads.province, ads.municipality, ads.permalink
+                     FROM ads_fts JOIN ads ON ads.ad_id = ads_fts.rowid {} ORDER BY ads_fts.rowid DESC LIMIT ? OFFSET ?'''.format(where)
+        else:
+            sql = '''SELECT ad_id, title, price, currency, province, municipality, permalink
+                     FROM ads {} ORDER BY ad_id DESC LIMIT ? OFFSET ?'''.format(where)
+        params = params + [pageSize + 1, (max(1, page) - 1) * pageSize]
+        with self._lock:
+            rows = self.connection.execute(sql, params).fetchall()
+        keys = ['id', 'title', 'price', 'currency', 'provinceName', 'municipalityName', 'permalink']
+        ads = [dict(zip(keys, row)) for row in rows[:pageSize]]
+        return ads, len(rows) > pageSize
+
+
+    def __len__(self):
+        with self._lock:
+            return self.connection.execute('SELECT COUNT(*) FROM ads').fetchone()[0]
+
+
+    def close(self):
+        self.flush()
+        self.connection.close()
+
+
+
+#TEST CODE
+def import_archive(folder, fileName=FILE_AD_INDEX):
+    '''Agrega al índice los anuncios de un archivo creado con backfill.py.'''
+    from backfill import read_archive
+    index = AdIndex(fileName)
+    count = index.add_many(read_archive(folder))
+    print('{} ads indexed, {} in the index.'.format(count, len(index)))
+    index.close()
+
+#import_archive('./archive')
@@ -0,0 +1,195 @@
+'''Extracción de los datos de los anuncios a partir de las páginas de revolico.com.
+Las funciones son de módulo para poder ejecutarlas en otros procesos: ParserPool reparte
+lotes de páginas entre varios procesos, de forma que el análisis de las páginas (sobre
+todo la decodificación del JSON de __APOLLO_STATE__) no compite con el bucle de eventos
+del bot y aprovecha todos los núcleos al recorrer ventanas grandes de IDs.
+'''
+__version__ = '1.0'
+__author__ = 'Santiago Orellana Perez'
+__created__ = '18/octubre/2026'
+__tested__ = 'Python 3.10'
+
+import os
+import json
+import math
+import asyncio
+import itertools
+from concurrent.futures import ProcessPoolExecutor
+from bs4 import BeautifulSoup
+
+# Procesos que analizan páginas. Se deja un núcleo libre para el bucle de eventos del bot.
+PARSE_WORKERS = max(1, (os.cpu_count() or 1) - 1)
+
+# Máximo de páginas que se envían juntas a un proceso, para repartir el costo de la comunicación.
+PARSE_BATCH_SIZE = 16
+
+# Con menos páginas que estas, se analizan en el mismo proceso porque no compensa enviarlas.
+PARSE_MIN_PAGES = 8
+
+NEXT_DATA_MARKER = b'id="__NEXT_DATA__"'
+SCRIPT_END = b'</script>'
+
+
+def extract_next_data(page):
+    '''Obtiene el JSON del nodo <script id="__NEXT_DATA__"> cortándolo directamente de
+    los bytes de la página, sin construir el DOM. Devuelve None si no lo encuentra.
+    '''
+    if isinstance(page, str):
+        page = page.encode('utf-8')
+    start = page.rfind(NEXT_DATA_MARKER)
+    if start < 0:
+        return None
+    start = page.find(b'>', start + len(NEXT_DATA_MARKER))
+    if start < 0:
+        return None
+    end = page.find(SCRIPT_END, start)
+    if end < 0:
+        return None
+    return json.loads(page[start + 1:end])
+
+
+def extract_next_data_soup(page):
+    '''Obtiene el JSON del nodo __NEXT_DATA__ construyendo el DOM completo con BeautifulSoup.
+    Es mucho más lento que extract_next_data() y solo se usa cuando este falla.
+    '''
+    content = BeautifulSoup(page, 'html.parser')
+    data = content.find_all(id='__NEXT_DATA__')
+    return json.loads(data[0].get_text())
+
+
+def parse_ad_page(pageAsText, adID):
+    '''Recibe una página de anuncio de revolico y devuelve en un JSON los datos del anuncio
+    que se encuentran al final de la página. Si la página no tiene anuncio, devuelve None.
+    Si la página no tiene el formato esperado, lanza una excepción.
+    '''
+    try:
+        dataAsJSON = extract_next_data(pageAsText)
+    except ValueError:
+        dataAsJSON = None
+    if dataAsJSON is None:
+        dataAsJSON = extract_next_data_soup(pageAsText)
+    adTypeKey = 'AdType:{}'.format(dataAsJSON['props']['pageProps']['id'])
+    apollo_state = dataAsJSON['props']['pageProps']['__APOLLO_STATE__']
+    if adTypeKey in apollo_state:
+        resultJSON = {}
+        resultJSON['id'] = adID
+        resultJSON['viewCount'] = apollo_state[adTypeKey]['viewCount']
+        resultJSON['permalink'] = apollo_state[adTypeKey]['permalink']
+        resultJSON['phone'] = apollo_state[adTypeKey]['phone']
+        resultJSON['title'] = apollo_state[adTypeKey]['title']
+        resultJSON['price'] = apollo_state[adTypeKey]['price']
+        resultJSON['currency'] = apollo_state[adTypeKey]['currency']
+        resultJSON['name'] = apollo_state[adTypeKey]['name']
+        resultJSON['status'] = apollo_state[adTypeKey]['status']
+        resultJSON['isAuto'] = apollo_state[adTypeKey]['isAuto']
+        resultJSON['updatedOnToOrder'] = apollo_state[adTypeKey]['updatedOnToOrder']
+        resultJSON['updatedOnByUser'] = apollo_state[adTypeKey]['updatedOnByUser']
+        try:
+            keyProvince = apollo_state[adTypeKey]['province']['__ref']
+            if keyProvince:
+                resultJSON['provinceID'] = apollo_state[keyProvince]['id']
+                resultJSON['provinceName'] = apollo_state[keyProvince]['name']
+        except Exception as e:
+            pass
+        try:
+            keyMunicipality = apollo_state[adTypeKey]['municipality']['__ref']
+            if keyMunicipality:
+                resultJSON['municipalityID'] = apollo_state[keyMunicipality]['id']
+                resultJSON['municipalityName'] = apollo_state[keyMunicipality]['name']
+        except Exception as e:
+            pass
+        try:
+            keySubcategory = apollo_state[adTypeKey]['subcategory']['__ref']
+            if keySubcategory:
+                resultJSON['subcategoryID'] = apollo_state[keySubcategory]['id']
+                resultJSON['subcategoryName'] = apollo_state[keySubcategory]['title']
+                try:
+                    keyParentCategory = apollo_state[keySubcategory]['parentCategory']['__ref']
+                    if keyParentCategory:
+                        resultJSON['categoryID'] = apollo_state[keyParentCategory]['id']
+                        resultJSON['categoryName'] = apollo_state[keyParentCategory]['title']
+                except:
+                    pass
+        except:
+            pass
+        resultJSON['description'] = apollo_state[adTypeKey]['description']
+        resultJSON['imagesCount'] = apollo_state[adTypeKey]['imagesCount']
+        if int(resultJSON['imagesCount']) > 0:
+            try:
+                resultJSON['images'] = []
+                imagesList = apollo_state[adTypeKey]['images']['edges']
+                if imagesList:
+                    for image in imagesList:
+                        imageKey = image['node']['__ref']
+                        images = {}
+                        if 'high' in apollo_state[imageKey]['urls']:
+                            images['high'] = apollo_state[imageKey]['urls']['high']
+                        if 'thumb' in apollo_state[imageKey]['urls']:
+                            images['thumb'] = apollo_state[imageKey]['urls']['thumb']
+                        resultJSON['images'].append(images)
+            except:
+                pass
+        return resultJSON
+    return None
+
+
+def parse_ad_batch(pages):
+    '''Analiza un lote de páginas [(ID, página), ...]. Se ejecuta en los procesos de ParserPool.
+    Devuelve una lista de (datos del anuncio o None, texto del error o None) en el mismo orden.
+    '''
+    results = []
+    for adID, pageAsText in pages:
+        try:
+            results.append((parse_ad_page(pageAsText, adID), None))
+        except Exception as e:
+            results.append((None, str(e)))
+    return results
+
+
+
+class ParserPool():
+    '''Procesos que analizan lotes de páginas. Los procesos se crean la primera vez que se usan.'''
+    def __init__(self, workers=PARSE_WORKERS, batchSize=PARSE_BATCH_SIZE, minPages=PARSE_MIN_PAGES):
+        self.workers = workers
+        self.batchSize = batchSize
+        self.minPages = minPages
+        self._executor = None
+
+
+    def get_executor(self):
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        return self._executor
+
+
+    def batches(self, pages):
+        '''Divide las páginas en lotes de forma que todos los procesos reciban trabajo.'''
+        size = max(1, min(self.batchSize, math.ceil(len(pages) / self.workers)))
+        return [pages[index:index + size] for index in range(0, len(pages), size)]
+
+
+    def scrape_many(self, pages):
+        '''Analiza las páginas [(ID, página), ...] y devuelve [(datos o None, error o None), ...].'''
+        pages = list(pages)
+        if len(pages) < self.minPages or self.workers <= 1:
+            return parse_ad_batch(pages)
+        return list(itertools.chain.from_iterable(self.get_executor().map(parse_ad_batch, self.batches(pages))))
+
+
+    async def scrape_many_async(self, pages):
+        '''Igual que scrape_many() pero sin bloquear el bucle de eventos mientras se analizan.
+        Los lotes pequeños se analizan en un hilo, pues no vale la pena enviarlos a los procesos.
+        '''
+        pages = list(pages)
+        if len(pages) < self.minPages or self.workers <= 1:
+            return await asyncio.to_thread(parse_ad_batch, pages)
+        loop = asyncio.get_running_loop()
+        executor = self.get_executor()
+        results = await asyncio.gather(*[loop.run_in_executor(executor, parse_ad_batch, batch) for batch in self.batches(pages)])
+        return list(itertools.chain.from_iterable(results))
+
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
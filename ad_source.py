@@ -0,0 +1,110 @@
+'''Interfaz común de las fuentes de anuncios y esquema normalizado de los anuncios.
+Cada sitio de anuncios se implementa como una subclase de AdSource (AsyncScraperRevolico es
+la de revolico.com). El motor de ingestión (ingestion.py) les asigna el transporte HTTP
+compartido y decide cuándo consultar cada una. Los anuncios de todas las fuentes se
+convierten al mismo esquema, que es el de revolico, para que el formateador, el índice
+de búsqueda y el enrutamiento funcionen igual con cualquier fuente. Las categorías de
+cada sitio se traducen a subcategorías de revolico, que son las que agrupan las
+categorías de SetV+, y los IDs se separan por fuente para que no coincidan.
+'''
+__version__ = '1.0'
+__author__ = 'Santiago Orellana Perez'
+__created__ = '18/octubre/2026'
+__tested__ = 'Python 3.10'
+
+import abc
+import copy
+
+# Cantidad de IDs reservados para cada fuente. El ID global de un anuncio es
+# sourceNumber * SOURCE_ID_SPAN + ID en su sitio, así revolico (fuente 0) conserva sus IDs.
+SOURCE_ID_SPAN = 10 ** 12
+
+# Subcategoría que se asigna a los anuncios de una categoría sin traducción.
+# Solo la reciben los receptores de la categoría 'todos'.
+UNKNOWN_SUBCATEGORY = 0
+
+# Campos del anuncio normalizado y sus valores cuando la fuente no los tiene.
+# Los textos que el formateador concatena no pueden quedar en None.
+AD_SCHEMA = {
+    'id':None,
+    'source':None,
+    'sourceID':None,
+    'title':'',
+    'description':'',
+    'price':None,
+    'currency':None,
+    'phone':None,
+    'name':None,
+    'provinceName':'',
+    'municipalityName':'',
+    'subcategoryID':UNKNOWN_SUBCATEGORY,
+    'subcategoryName':None,
+    'categoryName':None,
+    'imagesCount':0,
+    'images':[],
+    'isAuto':False,
+    'permalink':None,
+    'updatedOnByUser':None,
+    'updatedOnToOrder':None
+    }
+
+
+def normalize_ad(ad, sourceName, sourceNumber=0, categoryMap=None):
+    '''Devuelve el anuncio con todos los campos del esquema, su ID global y el nombre de la fuente.
+    Si se indica categoryMap (categoría del sitio -> subcategoría de revolico), la categoría
+    del anuncio, que la fuente deja en 'category', se traduce a subcategoryID.
+    Los campos propios de la fuente que no están en el esquema se conservan.
+    '''
+    result = dict(ad)
+    for field, default in AD_SCHEMA.items():
+        if result.get(field) is None:
+            result[field] = copy.copy(default)
+    if ad.get('sourceID') is None:
+        result['sourceID'] = ad['id']
+        result['id'] = int(sourceNumber) * SOURCE_ID_SPAN + int(ad['id'])
+    result['source'] = sourceName
+    if categoryMap is not None:
+        result['subcategoryID'] = categoryMap.get(ad.get('category'), UNKNOWN_SUBCATEGORY)
+    return result
+
+
+
+class AdSource(abc.ABC):
+    '''Fuente de anuncios que puede ejecutar IngestionEngine.
+    Las subclases implementan next_ad() y next_interval(), y pueden indicar en categoryMap
+    cómo se traducen sus categorías a subcategorías de revolico.
+    '''
+    sourceName = 'source'
+    sourceNumber = 0
+    categoryMap = None
+    sharedTransport = False
+
+
+    def attach(self, transport):
+        '''Hace que la fuente utilice el transporte HTTP del motor. La fuente no lo cierra.'''
+        self._transport = transport
+        self.sharedTransport = True
+
+
+    def normalize(self, result):
+        '''Normaliza el anuncio de un resultado {'ad':..., 'hours':..., 'tags':...}.'''
+        if result.get('ad') is not None:
+            result['ad'] = normalize_ad(result['ad'], self.sourceName, self.sourceNumber, self.categoryMap)
+        return result
+
+
+    @abc.abstractmethod
+    async def next_ad(self):
+        '''Devuelve el próximo resultado normalizado de la fuente: el anuncio en 'ad',
+        None en 'ad' si no hay anuncio para enviar, o el tipo de error en 'error'.
+        '''
+
+
+    @abc.abstractmethod
+    def next_interval(self):
+        '''Devuelve los segundos que se deben esperar antes de volver a llamar a next_ad().'''
+
+
+    async def close(self):
+        '''Libera los recursos propios de la fuente. El motor lo espera al cerrarse.'''
+        pass
@@ -4,7 +4,7 @@ El scraping obtiene los anuncios más recientes y los embellece dándoles format
 El bot tiene comandos útiles para ver la lista, agregar o quitar receptores o administradores.
 El bot solo responde a los comandos del usuario ROOT y de los administradores agregados.
 Los anuncios obtenidos, según su subcategoría,  son reclasificados.
-Las listas de receptores y administradores se guardan en ficheros locales como txt.
+Las listas de receptores y administradores se guardan en una base de datos SQLite local.
 '''
 
 __version__ = '1.0'
@@ -19,10 +19,25 @@ from telegram.constants import ChatAction
 import datetime
 import asyncio
 import threading
+import html
 from functools import wraps
 from data_out import *
 from const import *
 from scraper_revolico import *
+from scheduler import *
+from ledger import *
+from similarity import *
+from routing import *
+from fanout import *
+from media import *
+from delivery_queue import *
+from metrics import *
+from state_store import *
+from holding import *
+from ad_index import *
+from shard_worker import ShardLeases
+from ingestion import IngestionEngine
+from filters import parse_filter, describe_filter, is_empty_filter
 
 
 #-----------------------------------------------------------------------
@@ -30,13 +45,26 @@ from scraper_revolico import *
 #-----------------------------------------------------------------------
 
 TOKEN = 'YOUR_TOKEN'
+TELEGRAM_BASE_URL = None  # Para utilizar un servidor local de la API de Telegram, ej: 'http://127.0.0.1:8081/bot'
 ADMIN_ROOT_ID = 715046259  #Santiago Orellana
-FILE_RECEIVERS = './receivers.txt'
-FILE_ADMINS = './admins.txt'
+FILE_RECEIVERS = './receivers.txt'  # Solo se lee para importar la lista anterior al almacén de estado.
+FILE_ADMINS = './admins.txt'        # Solo se lee para importar la lista anterior al almacén de estado.
+DELIVERY_INTERVAL_SECONDS = 2
+SCRAPE_IN_BOT = True  # Si es False, el scraping lo hacen los procesos de shard_worker.py y el bot solo envía.
 
 _scraper = None
+_engine = None
+_poller = None
+_ledger = None
+_reposts = None
+_router = None
+_sender = None
+_media = None
+_queue = None
+_store = None
+_index = None
 _receivers = None
-_admins = None
+_shards = None
 
 _bot_status = STATUS_PAUSED
 _bot_submenu = ''
@@ -59,49 +87,102 @@ async def get_argument(context, index, errorMessage, userID):
         return None
 
 
-async def to_file(fileName, data):
-    '''Crea un fichero nuevo y escribe los datos a la primera linea.'''
-    try:
-        fileOut = open(fileName, 'w')
-        fileOut.write(data)
-        fileOut.close()
-        return True
-    except Exception as e:
-        await to_cmd('ERROR', 'to_file(): {}'.format(str(e)))
-        return False
-
-
-async def from_file(fileName):
-    '''Lee los datos de la primera linea de un fichero.'''
-    try:
-        fileIn = open(fileName, "r")
-        line = fileIn.readline()
-        fileIn.close()
-        return line
-    except Exception as e:
-        return None
-
-
 #-----------------------------------------------------------------------
 # Para establecer o quitar las tareas de trading que se ejecutan.
 #-----------------------------------------------------------------------
 
 async def job_execute_scraping(context) -> None:
-    '''Execute the bot scraping and send ads messages.'''
-    global _scraper
+    '''Execute the bot scraping and queue ads messages.
+    Cada ejecución consulta las fuentes del motor de ingestión a las que les toca y programa
+    la siguiente para cuando le toque a la próxima fuente.
+    Si la cola de envíos está muy llena, no se obtienen anuncios nuevos hasta que se vacíe.
+    '''
+    global _engine
+    global _ledger
+    global _reposts
+    global _router
+    global _queue
+    global _index
     global _bot_status
     global _receivers
-    if _scraper:
+    interval = POLL_DEFAULT_SECONDS
+    try:
+        if _engine:
+            if _bot_status == STATUS_RUNING:
+                depth = _queue.depth()
+                if depth > DELIVERY_QUEUE_MAX_DEPTH:
+                    await to_cmd('WARNING', 'Delivery queue is full ({} pending), scraping delayed.'.format(depth))
+                else:
+                    for source, result in await _engine.poll_due():
+                        if result.get('ad') is not None and _index.add(result['ad']):
+                            await asyncio.to_thread(_index.flush)
+                        await enqueue_messages_ad(_queue, _receivers, result, ledger=_ledger, reposts=_reposts, router=_router)
+                    interval = _engine.seconds_to_next()
+    finally:
+        await job_set(context, 'job_execute_scraping', interval, job_execute_scraping, repeating=False)
+
+
+async def job_deliver_ads(context) -> None:
+    '''Envía los anuncios pendientes de la cola de envíos.'''
+    global _queue
+    global _ledger
+    global _reposts
+    global _sender
+    global _media
+    global _bot_status
+    if _queue:
         if _bot_status == STATUS_RUNING:
-            await show_messages_ad(context, _receivers, _scraper.get_next_page()) 
+            # Con el scraping repartido, los anuncios repetidos solo se pueden detectar aquí.
+            reposts = None if SCRAPE_IN_BOT else _reposts
+            await deliver_messages_ad(context, _queue, ledger=_ledger, sender=_sender, media=_media, reposts=reposts)
+            if _sender:
+                await apply_chat_migrations(_sender.pop_migrations())
 
 
-async def job_set(context, jobName, jobSeconds, jobHandler):
-    '''Agrega una nueva tarea en la cola de tareas. Se utiliza para ejecutar periódicamente el procesador de scraping.'''
+async def apply_chat_migrations(migrations):
+    '''Pasa al nuevo ID las categorías y el filtro de los grupos que pasaron a ser supergrupos.'''
+    global _store
+    global _receivers
+    global _router
+    for oldID, newID in migrations.items():
+        try:
+            rule = _store.filters().get(str(oldID))
+            categories = [receiver['category'] for receiver in _store.receivers_by_id(oldID)]
+            for category in categories:
+                if _store.add_receiver(newID, category):
+                    _router.add_receiver(str(newID), category)
+            if rule is not None:
+                _store.set_filter(newID, rule)
+                _router.filters.set_rule(str(newID), rule)
+            if _store.remove_receiver(oldID) > 0:
+                _router.remove_receiver(str(oldID))
+            _receivers = _store.receivers()
+            await to_cmd('INFO', 'Receiver {} migrated to {}.'.format(oldID, newID))
+        except Exception as e:
+            await to_cmd('ERROR', 'Receiver {} not migrated to {}. {}'.format(oldID, newID, str(e)))
+
+
+async def job_flush_index(context) -> None:
+    '''Escribe en el índice de búsqueda los anuncios pendientes, fuera del bucle de eventos.'''
+    global _index
+    if _index:
+        try:
+            await asyncio.to_thread(_index.flush)
+        except Exception as e:
+            await to_cmd('ERROR', 'Ads not indexed. {}'.format(str(e)))
+
+
+async def job_set(context, jobName, jobSeconds, jobHandler, repeating=True):
+    '''Agrega una nueva tarea en la cola de tareas. Se utiliza para ejecutar periódicamente el procesador de scraping.
+    Si repeating es False, la tarea se ejecuta una sola vez y debe volver a agregarse a sí misma.
+    '''
     try:
         if context.job_queue.get_jobs_by_name(jobName):
             return False
-        context.job_queue.run_repeating(jobHandler, jobSeconds, name=jobName)
+        if repeating:
+            context.job_queue.run_repeating(jobHandler, jobSeconds, name=jobName)
+        else:
+            context.job_queue.run_once(jobHandler, jobSeconds, name=jobName)
         return True
     except Exception as e:
         await to_cmd('ERROR', 'on: job_set(): '.format(str(e)))
@@ -121,7 +202,7 @@ def check_user(func):
             userID = update.effective_user.id
         except:
             return        
-        if userID == ADMIN_ROOT_ID or userID in [admin['id'] for admin in _admins]:
+        if userID == ADMIN_ROOT_ID or _store.is_admin(userID):
             return await func(update, context, *args, **kwargs)
         else:
             await to_cmd('REJECTED', 'Usuario no autorizado: {}'.format(userID))
@@ -145,7 +226,9 @@ def send_action(action):
 @check_user
 async def handler_start(update, context, restart=False):
     '''Muestra un mensaje de bienvenida y reinicia las variables del bot para que pueda ser utilizado.'''
+    global _store
     global _receivers
+    global _router
     global _bot_status
     if restart:
         await to_cmd('INFO', 'RESTART')
@@ -153,29 +236,22 @@ async def handler_start(update, context, restart=False):
         await to_cmd('INFO', 'START')
     _bot_status = STATUS_RUNING
     
-    # Intenta cargar la lista de receptores de publicidad.
-    line = await from_file(FILE_RECEIVERS)
-    if line is not None:
-        try:
-            _receivers = json.loads(line)
-        except Exception as e:
-            _receivers = []
-            await to_cmd('WARNING', 'Failed to load Receivers List. {}'.format(str(e)))
-    else:
+    # Recarga las listas de receptores y administradores desde el almacén de estado.
+    try:
+        _store.load()
+    except Exception as e:
+        await to_cmd('WARNING', 'Failed to load receivers and admins. {}'.format(str(e)))
+    _receivers = _store.receivers()
+    if len(_receivers) == 0:
         await to_cmd('INFO', 'No receivers assigned.')
-        
-    # Intenta cargar la lista de administradores.
-    line = await from_file(FILE_ADMINS)
-    if line is not None:
-        try:
-            _admins = json.loads(line)
-        except Exception as e:
-            _admins = []
-            await to_cmd('WARNING', 'Failed to load Admins List. {}'.format(str(e)))
-    else:
+    if len(_store.admins()) == 0:
         await to_cmd('INFO', 'No admins assigned.')
+    _router.build(_receivers, _store.filters())
         
-    await job_set(context, 'job_execute_scraping', 10, job_execute_scraping)  
+    if SCRAPE_IN_BOT:
+        await job_set(context, 'job_execute_scraping', POLL_MIN_SECONDS, job_execute_scraping, repeating=False)
+    await job_set(context, 'job_deliver_ads', DELIVERY_INTERVAL_SECONDS, job_deliver_ads)
+    await job_set(context, 'job_flush_index', AD_INDEX_FLUSH_SECONDS, job_flush_index)
     await show_presentation(context)
     #await show_main_menu(update, context)
 
@@ -212,6 +288,7 @@ async def handler_restart(update, context):
 async def handler_view(update, context):
     '''Muestra los grupos, canales y usuarios que reciben la publicidad del bot.'''
     global _receivers
+    global _store
     userID = update.effective_user.id
     msg = f'{EMOJI_OK} Receptores de publicidad:\n'
     if _receivers is not None:
@@ -220,6 +297,9 @@ async def handler_view(update, context):
             for receive in _receivers:
                 try:
                     msg = msg + '\n{} - {}'.format(str(receive['id']), str(receive['category']))
+                    rule = _store.filters().get(receive['id'])
+                    if rule is not None:
+                        msg = msg + ' - {}'.format(html.escape(describe_filter(rule)))
                 except Exception as e:
                     await to_cmd('ERROR', 'Error in ad receiver list. {}'.format(str(e)))
                     return
@@ -231,7 +311,9 @@ async def handler_view(update, context):
 @check_user
 async def handler_new(update, context):
     '''Permite agregar un nuevo grupo, canal o usuario a la lista de receptores de publicidad.'''
+    global _store
     global _receivers
+    global _router
     userID = update.effective_user.id
     msg = f'{EMOJI_ERROR} Falta el primer parámetro: \nDebe indicar el link con @ de un grupo o canal o indicar el ID de un usuario.'
     receiver = await get_argument(context, 0, msg, userID)
@@ -241,9 +323,18 @@ async def handler_new(update, context):
     if category is None: return
     category = str(category).lower()
     if category in SETVMAS_CATEGORIES:
-        _receivers.append({'id':receiver, 'category':category})
-        await to_file(FILE_RECEIVERS, json.dumps(_receivers))
-        await show_message(context, userID, f'{EMOJI_OK} Receptor establecido.')
+        try:
+            added = _store.add_receiver(receiver, category)
+        except Exception as e:
+            await to_cmd('ERROR', 'Receiver not saved. {}'.format(str(e)))
+            await show_message(context, userID, f'{EMOJI_ERROR} No se pudo guardar el receptor.')
+            return
+        if added:
+            _receivers = _store.receivers()
+            _router.add_receiver(receiver, category)
+            await show_message(context, userID, f'{EMOJI_OK} Receptor establecido.')
+        else:
+            await show_message(context, userID, f'{EMOJI_NONE} El receptor ya tiene esa categoría.')
     else:
         await show_message(context, userID, f'{EMOJI_ERROR} Esa categoría no existe o está mal escrita.')
 
@@ -251,14 +342,66 @@ async def handler_new(update, context):
 @check_user
 async def handler_del(update, context):
     '''Permite eliminar un grupo, canal o usuario de la lista de receptores de publicidad.'''
+    global _store
     global _receivers
+    global _router
+    userID = update.effective_user.id
+    msg = f'{EMOJI_ERROR} Falta el primer parámetro: \nDebe indicar el link con @ de un grupo o canal o indicar el ID de un usuario.'
+    receiverID = await get_argument(context, 0, msg, userID)
+    if receiverID is None: return
+    try:
+        removed = _store.remove_receiver(receiverID)
+    except Exception as e:
+        await to_cmd('ERROR', 'Receiver not removed. {}'.format(str(e)))
+        await show_message(context, userID, f'{EMOJI_ERROR} No se pudo eliminar el receptor.')
+        return
+    if removed > 0:
+        _receivers = _store.receivers()
+        _router.remove_receiver(receiverID)
+        await show_message(context, userID, f'{EMOJI_OK} Receptor eliminado.')
+    else:
+        await show_message(context, userID, f'{EMOJI_NONE} Ese receptor no existe.')
+
+
+@check_user
+async def handler_filter(update, context):
+    '''Establece, muestra o quita el filtro de anuncios de un receptor.'''
+    global _store
+    global _router
     userID = update.effective_user.id
     msg = f'{EMOJI_ERROR} Falta el primer parámetro: \nDebe indicar el link con @ de un grupo o canal o indicar el ID de un usuario.'
     receiverID = await get_argument(context, 0, msg, userID)
     if receiverID is None: return
-    _receivers = [element for element in _receivers if element['id'] != receiverID]
-    await to_file(FILE_RECEIVERS, json.dumps(_receivers))
-    await show_message(context, userID, f'{EMOJI_OK} Receptor eliminado.')
+    if len(_store.receivers_by_id(receiverID)) == 0:
+        await show_message(context, userID, f'{EMOJI_NONE} Ese receptor no existe.')
+        return
+    text = ' '.join(context.args[1:]).strip()
+    if text == '':
+        rule = _store.filters().get(receiverID)
+        if rule is None:
+            await show_message(context, userID, f'{EMOJI_NONE} El receptor no tiene filtro, recibe todos los anuncios de sus categorías.')
+        else:
+            await show_message(context, userID, f'{EMOJI_OK} Filtro del receptor: \n' + html.escape(describe_filter(rule)))
+        return
+    try:
+        if text.lower() in ['borrar', 'ninguno']:
+            if _store.remove_filter(receiverID):
+                _router.filters.remove(receiverID)
+                await show_message(context, userID, f'{EMOJI_OK} Filtro eliminado.')
+            else:
+                await show_message(context, userID, f'{EMOJI_NONE} El receptor no tiene filtro.')
+            return
+        rule = parse_filter(text)
+        if is_empty_filter(rule):
+            await show_message(context, userID, f'{EMOJI_ERROR} El filtro no tiene condiciones. \nInfórmese con el comando /help')
+            return
+        _store.set_filter(receiverID, rule)
+    except Exception as e:
+        await to_cmd('ERROR', 'Filter not saved. {}'.format(str(e)))
+        await show_message(context, userID, f'{EMOJI_ERROR} No se pudo guardar el filtro.')
+        return
+    _router.filters.set_rule(receiverID, rule)
+    await show_message(context, userID, f'{EMOJI_OK} Filtro establecido: \n' + html.escape(describe_filter(rule)))
 
 
 @send_action(ChatAction.TYPING)
@@ -277,12 +420,13 @@ async def handler_help(update, context):
 @check_user
 async def handler_admins(update, context):
     '''Muestra la lista de administradores del bot.'''
-    global _admins
+    global _store
     userID = update.effective_user.id
     msg = f'{EMOJI_OK} Administradores de publicidad:\n'
-    if _admins is not None:
-        if len(_admins) > 0:
-            for admin in _admins:
+    if _store is not None:
+        admins = _store.admins()
+        if len(admins) > 0:
+            for admin in admins:
                 msg = msg + '\n{}'.format(str(admin))
             await show_message(context, userID, msg)
             return
@@ -292,27 +436,40 @@ async def handler_admins(update, context):
 @check_user
 async def handler_add(update, context):
     '''Permite agregar un nuevo administrador.'''
-    global _admins
+    global _store
     userID = update.effective_user.id
     newAdminID = await get_argument(context, 0, f'{EMOJI_ERROR} Falta el primer parámetro: \nDebe indicar el ID de un usuario.', userID)
     if newAdminID is None: return
     newAdminName = await get_argument(context, 1, f'{EMOJI_ERROR} Falta el segundo parámetro: \nDebe indicar un nombre para el administrador.', userID)
     if newAdminName is None: return
-    _admins.append({'id':newAdminID, 'name':newAdminName})
-    await to_file(FILE_ADMINS, json.dumps(_admins))
+    try:
+        if not _store.add_admin(newAdminID, newAdminName):
+            await show_message(context, userID, f'{EMOJI_ERROR} El ID del usuario debe ser un número.')
+            return
+    except Exception as e:
+        await to_cmd('ERROR', 'Admin not saved. {}'.format(str(e)))
+        await show_message(context, userID, f'{EMOJI_ERROR} No se pudo guardar el administrador.')
+        return
     await show_message(context, userID, f'{EMOJI_OK} Administrador establecido.')
 
 
 @check_user
 async def handler_ban(update, context):
     '''Permite eliminar un administrador.'''
-    global _admins
+    global _store
     userID = update.effective_user.id
     adminID = await get_argument(context, 0, f'{EMOJI_ERROR} Falta un parámetro: \nDebe indicar el ID de un usuario.', userID)
     if adminID is None: return
-    _admins = [admin for admin in _admins if admin['id'] != adminID]
-    await to_file(FILE_ADMINS, json.dumps(_admins))
-    await show_message(context, userID, f'{EMOJI_OK} Administrador eliminado.')
+    try:
+        removed = _store.remove_admin(adminID)
+    except Exception as e:
+        await to_cmd('ERROR', 'Admin not removed. {}'.format(str(e)))
+        await show_message(context, userID, f'{EMOJI_ERROR} No se pudo eliminar el administrador.')
+        return
+    if removed:
+        await show_message(context, userID, f'{EMOJI_OK} Administrador eliminado.')
+    else:
+        await show_message(context, userID, f'{EMOJI_NONE} Ese administrador no existe.')
 
 
 @send_action(ChatAction.TYPING)
@@ -345,6 +502,63 @@ async def handler_status(update, context):
     msg = f'{EMOJI_PAUSED} PAUSED \nNo se están enviando anuncios.'
     if _bot_status == STATUS_RUNING:
         msg = f'{EMOJI_RUNING} RUNING \nSe están enviando anuncios.'
+    if _reposts is not None:
+        msg = msg + '\nAnuncios repetidos: {} \nEnvíos ahorrados: {}'.format(_reposts.reposts, _reposts.savedSends)
+    if _queue is not None:
+        msg = msg + '\nEnvíos pendientes: {} \nEnvíos fallidos: {}'.format(_queue.depth(), _queue.dead())
+    if _scraper is not None and _scraper.holding is not None:
+        msg = msg + '\nAnuncios retenidos: {}'.format(len(_scraper.holding))
+    if _shards is not None:
+        shards = _shards.status()
+        msg = msg + '\nFragmentos activos: {} de {}'.format(len([shard for shard in shards if shard['alive']]), len(shards))
+        for shard in shards:
+            msg = msg + '\n  {}: {} ({})'.format(shard['shard'], shard['owner'] if shard['alive'] else '-', shard['lastID'])
+    elif _scraper is not None:
+        gaps = _scraper.gaps
+        msg = msg + '\nIDs vacíos conocidos: {} en {} rangos \nPedidos evitados: {} ({}%)'.format(
+            len(gaps), gaps.ranges(), gaps.hits, round(gaps.hit_rate() * 100, 1))
+    await show_message(context, userID, msg)
+
+
+@check_user
+async def handler_metrics(update, context):
+    '''Muestra al usuario un resumen de las métricas de funcionamiento del bot.'''
+    userID = update.effective_user.id
+    lines = summary_lines()
+    if len(lines) == 0:
+        await show_message(context, userID, f'{EMOJI_ERROR} Aún no hay métricas.')
+        return
+    await show_message(context, userID, '\n'.join(lines))
+
+
+@send_action(ChatAction.TYPING)
+@check_user
+async def handler_search(update, context):
+    '''Busca en el índice local los anuncios que contienen las palabras indicadas.'''
+    global _index
+    userID = update.effective_user.id
+    search = parse_search(' '.join(context.args))
+    if len(search['words']) == 0 and search['province'] is None and search['minPrice'] is None and search['maxPrice'] is None:
+        await show_message(context, userID, f'{EMOJI_ERROR} Debe indicar las palabras a buscar. \nEjemplo: /search iphone precio:100-300 provincia:habana')
+        return
+    try:
+        ads, more = await asyncio.to_thread(_index.search, search['words'], search['minPrice'], search['maxPrice'],
+                                            search['province'], search['page'])
+    except Exception as e:
+        await to_cmd('ERROR', 'Search failed. {}'.format(str(e)))
+        await show_message(context, userID, f'{EMOJI_ERROR} No se pudo hacer la búsqueda.')
+        return
+    if len(ads) == 0:
+        await show_message(context, userID, f'{EMOJI_NONE} No se encontraron anuncios.')
+        return
+    msg = f'{EMOJI_OK} Anuncios encontrados (página {search["page"]}):\n'
+    for ad in ads:
+        price = '' if ad['price'] is None else ' - {:g} {}'.format(ad['price'], ad['currency'] or '')
+        place = '' if ad['provinceName'] is None else ' - {}'.format(html.escape(ad['provinceName']))
+        msg = msg + '\n<a href="{}{}">{}</a>{}{}'.format(URL_REVOLICO_BASE, html.escape(ad['permalink'] or ''),
+                                                     html.escape(ad['title'] or str(ad['id'])), price, place)
+    if more:
+        msg = msg + '\n\nPara ver más agregue pagina:{}'.format(search['page'] + 1)
     await show_message(context, userID, msg)
 
 
@@ -366,6 +580,35 @@ async def handler_send(update, context):
     await show_message(context, ADMIN_ROOT_ID, f'{userID} {name}')
 
 
+async def on_shutdown(application):
+    '''Libera los recursos del scraper cuando se detiene el bot.'''
+    global _scraper
+    global _engine
+    global _ledger
+    global _media
+    global _queue
+    global _store
+    global _index
+    global _shards
+    if _engine:
+        await _engine.close()
+    if _scraper:
+        if _scraper.holding:
+            _scraper.holding.close()
+    if _ledger:
+        _ledger.close()
+    if _media:
+        await _media.close()
+    if _queue:
+        _queue.close()
+    if _store:
+        _store.close()
+    if _index:
+        _index.close()
+    if _shards:
+        _shards.close()
+
+
 async def error_handler(update, context):
     '''muestra las excepciones que se producen mientras se manejas las actualizaciones.'''
     await to_cmd('ERROR', 'Exception while handling an update: {}'.format(str(context.error)))
@@ -376,17 +619,59 @@ async def error_handler(update, context):
 #-----------------------------------------------------------------------
 def main():
     global _scraper
+    global _engine
+    global _poller
+    global _ledger
+    global _reposts
+    global _router
+    global _sender
+    global _media
+    global _queue
+    global _store
+    global _index
     global _receivers
-    global _admins
+    global _shards
     print('>>> AdFiller Telegram Bot <<<')
 
     #Crea el scraper e inicia las variables globales.
-    _scraper = ScraperRevolico(0.5, False)
-    _receivers = []
-    _admins = []
+    _scraper = AsyncScraperRevolico(0.5, False)
+    _poller = AdaptivePoller()
+    _scraper.poller = _poller
+    _scraper.holding = HoldingHeap()
+    _engine = IngestionEngine([_scraper])
+    _ledger = DeliveredLedger()
+    _reposts = RepostIndex()
+    _router = RoutingIndex()
+    _sender = FanoutSender()
+    _media = MediaCache()
+    _queue = DeliveryQueue()
+    _index = AdIndex()
+    if not SCRAPE_IN_BOT:
+        _shards = ShardLeases()
+
+    #Carga los receptores y administradores, importando los ficheros anteriores si hace falta.
+    _store = StateStore()
+    try:
+        countReceivers, countAdmins = _store.migrate(FILE_RECEIVERS, FILE_ADMINS)
+        if countReceivers > 0 or countAdmins > 0:
+            sync_to_file_cmd('INFO', 'Imported {} receivers and {} admins.'.format(countReceivers, countAdmins))
+    except Exception as e:
+        sync_to_file_cmd('WARNING', 'Failed to import receivers and admins. {}'.format(str(e)))
+    _receivers = _store.receivers()
+    _router.build(_receivers, _store.filters())
+
+    #Publica las métricas en un servidor HTTP local.
+    if METRICS_PORT:
+        try:
+            start_metrics_server(METRICS_HOST, METRICS_PORT)
+        except Exception as e:
+            sync_to_file_cmd('WARNING', 'Metrics server not started: {}'.format(str(e)))
 
     #Crea la aplicacion del bot de telegram.
-    application = Application.builder().token(TOKEN).build()
+    builder = Application.builder().token(TOKEN).post_shutdown(on_shutdown).connection_pool_size(TELEGRAM_POOL_SIZE)
+    if TELEGRAM_BASE_URL:
+        builder = builder.base_url(TELEGRAM_BASE_URL)
+    application = builder.build()
 
     #Manejadores para los comandos a los que responde el bot.
     application.add_handler(CommandHandler('start', handler_start))
@@ -396,12 +681,15 @@ def main():
     application.add_handler(CommandHandler('view', handler_view))
     application.add_handler(CommandHandler('new', handler_new))
     application.add_handler(CommandHandler('del', handler_del))
+    application.add_handler(CommandHandler('filter', handler_filter))
     application.add_handler(CommandHandler('categories', handler_categories))
     application.add_handler(CommandHandler('admins', handler_admins))
     application.add_handler(CommandHandler('add', handler_add))
     application.add_handler(CommandHandler('ban', handler_ban))
     application.add_handler(CommandHandler('help', handler_help))
     application.add_handler(CommandHandler('status', handler_status))
+    application.add_handler(CommandHandler('metrics', handler_metrics))
+    application.add_handler(CommandHandler('search', handler_search))
     application.add_handler(CommandHandler('sendname', handler_send))
     
     #Recibe todos los textos y debe ser declarado despues de los otros controladores.
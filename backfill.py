@@ -0,0 +1,267 @@
+'''Recorrido histórico de un rango de IDs de revolico para guardar sus anuncios.
+Pide las páginas en paralelo por ventanas de IDs, sin pasar de un máximo de pedidos por
+segundo, y guarda los anuncios en un archivo de ficheros JSONL comprimidos con gzip, de
+solo agregar y divididos en partes. Después de guardar cada ventana se escribe un punto
+de control, por lo que si el proceso se detiene, al volver a ejecutarlo continúa donde
+se quedó. Los anuncios del archivo se leen de uno en uno con read_archive(), sin cargar
+el archivo completo en memoria.
+
+Uso: python backfill.py 41000000 41925759 --folder ./archive --rps 4
+'''
+__version__ = '1.0'
+__author__ = 'Santiago Orellana Perez'
+__created__ = '18/octubre/2026'
+__tested__ = 'Python 3.10'
+
+import os
+import json
+import gzip
+import time
+import asyncio
+import argparse
+from rate_limit import TokenBucket
+from ad_parser import ParserPool
+from scraper_revolico import AsyncScraperRevolico
+
+BACKFILL_FOLDER = './archive'
+BACKFILL_WINDOW = 200
+BACKFILL_MAX_IN_FLIGHT = 8
+BACKFILL_REQUESTS_PER_SECOND = 4
+BACKFILL_MAX_ATTEMPTS = 5
+BACKFILL_RETRY_SECONDS = 5
+
+# Cantidad de anuncios de cada parte del archivo.
+ARCHIVE_CHUNK_ADS = 50000
+ARCHIVE_CHUNK_PATTERN = 'ads-{:06d}.jsonl.gz'
+FILE_CHECKPOINT = 'checkpoint.json'
+FILE_FAILED = 'failed.txt'
+
+
+class AdArchive():
+    '''Archivo de anuncios en partes JSONL comprimidas con gzip.
+    Cada llamada a write() agrega un miembro gzip al final de la parte actual, por lo que
+    nunca se reescribe lo ya guardado. La posición de la última escritura confirmada se
+    guarda en el punto de control y, al continuar, se descarta lo escrito después.
+    '''
+    def __init__(self, folder=BACKFILL_FOLDER, chunkAds=ARCHIVE_CHUNK_ADS):
+        self.folder = folder
+        self.chunkAds = chunkAds
+        self.chunk = 1
+        self.chunkBytes = 0
+        self.chunkCount = 0
+        os.makedirs(folder, exist_ok=True)
+
+
+    def file_name(self, chunk):
+        return os.path.join(self.folder, ARCHIVE_CHUNK_PATTERN.format(chunk))
+
+
+    def restore(self, chunk, chunkBytes, chunkCount):
+        '''Vuelve a la posición de la última escritura confirmada, descartando lo escrito después.'''
+        self.chunk = chunk
+        self.chunkBytes = chunkBytes
+        self.chunkCount = chunkCount
+        fileName = self.file_name(chunk)
+        if os.path.exists(fileName) and os.path.getsize(fileName) > chunkBytes:
+            with open(fileName, 'r+b') as fileOut:
+                fileOut.truncate(chunkBytes)
+        # Las partes posteriores son de escrituras no confirmadas.
+        later = chunk + 1
+        while os.path.exists(self.file_name(later)):
+            os.remove(self.file_name(later))
+            later += 1
+
+
+    def write(self, ads):
+        '''Agrega los anuncios a la parte actual y los lleva al disco.'''
+        if len(ads) == 0:
+            return
+        if self.chunkCount >= self.chunkAds:
+            self.chunk += 1
+            self.chunkBytes = 0
+            self.chunkCount = 0
+        data = gzip.compress(''.join([json.dumps(ad, ensure_ascii=False) + '\n' for ad in ads]).encode('utf-8'))
+        with open(self.file_name(self.chunk), 'ab') as fileOut:
+            fileOut.truncate(self.chunkBytes)
+            fileOut.write(data)
+            fileOut.flush()
+            os.fsync(fileOut.fileno())
+        self.chunkBytes += len(data)
+        self.chunkCount += len(ads)
+
+
+    def position(self):
+        return {'chunk':self.chunk, 'chunkBytes':self.chunkBytes, 'chunkCount':self.chunkCount}
+
+
+
+def read_archive(folder=BACKFILL_FOLDER):
+    '''Devuelve uno a uno los anuncios guardados en el archivo, en el orden en que se guardaron.
+    Si la última parte quedó cortada por una escritura interrumpida, se ignora lo cortado.
+    '''
+    chunk = 1
+    while True:
+        fileName = os.path.join(folder, ARCHIVE_CHUNK_PATTERN.format(chunk))
+        if not os.path.exists(fileName):
+            return
+        try:
+            with gzip.open(fileName, 'rt', encoding='utf-8') as fileIn:
+                for line in fileIn:
+                    if line.endswith('\n'):
+                        yield json.loads(line)
+        except (EOFError, gzip.BadGzipFile):
+            pass
+        chunk += 1
+
+
+def load_checkpoint(folder):
+    '''Devuelve el punto de control guardado en la carpeta, o None si no existe.'''
+    fileName = os.path.join(folder, FILE_CHECKPOINT)
+    if not os.path.exists(fileName):
+        return None
+    with open(fileName, 'r') as fileIn:
+        return json.load(fileIn)
+
+
+def save_checkpoint(folder, checkpoint):
+    '''Guarda el punto de control de forma atómica.'''
+    fileName = os.path.join(folder, FILE_CHECKPOINT)
+    with open(fileName + '.tmp', 'w') as fileOut:
+        json.dump(checkpoint, fileOut)
+        fileOut.flush()
+        os.fsync(fileOut.fileno())
+    os.replace(fileName + '.tmp', fileName)
+
+
+
+class Backfill():
+    '''Recorre el rango [startID, endID) por ventanas y guarda sus anuncios en un AdArchive.'''
+    def __init__(self, startID, endID, folder=BACKFILL_FOLDER, windowSize=BACKFILL_WINDOW,
+                 maxInFlight=BACKFILL_MAX_IN_FLIGHT, requestsPerSecond=BACKFILL_REQUESTS_PER_SECOND,
+                 maxRequests=None, parser=None, scraper=None):
+        self.startID = int(startID)
+        self.endID = int(endID)
+        self.folder = folder
+        self.windowSize = windowSize
+        self.maxInFlight = maxInFlight
+        self.maxRequests = maxRequests
+        self.budget = TokenBucket(requestsPerSecond)
+        self.archive = AdArchive(folder)
+        if scraper is None:
+            scraper = AsyncScraperRevolico(0, False, os.path.join(folder, 'lastid.txt'), self.startID)
+        self.scraper = scraper
+        self.scraper.parser = parser
+        self.checkpoint = {'startID':self.startID, 'endID':self.endID, 'nextID':self.startID,
+                           'ads':0, 'requests':0, 'failed':0, 'seconds':0.0}
+        self.checkpoint.update(self.archive.position())
+
+
+    def resume(self):
+        '''Continúa desde el punto de control de la carpeta si es del mismo rango.
+        Devuelve False si existe un punto de control de otro rango.
+        '''
+        checkpoint = load_checkpoint(self.folder)
+        if checkpoint is None:
+            self.archive.restore(1, 0, 0)
+            return True
+        if checkpoint['startID'] != self.startID or checkpoint['endID'] != self.endID:
+            return False
+        self.checkpoint = checkpoint
+        self.archive.restore(checkpoint['chunk'], checkpoint['chunkBytes'], checkpoint['chunkCount'])
+        return True
+
+
+    async def crawl_window(self, firstID, lastID):
+        '''Pide en paralelo las páginas [firstID, lastID) y devuelve los anuncios encontrados
+        y los IDs que siguieron fallando después de todos los reintentos.
+        '''
+        semaphore = asyncio.Semaphore(self.maxInFlight)
+
+        async def probe(pageID):
+            async with semaphore:
+                await self.budget.acquire()
+                return await self.scraper.fetch_raw(pageID)
+
+        ads = []
+        pending = list(range(firstID, lastID))
+        for attempt in range(BACKFILL_MAX_ATTEMPTS):
+            if len(pending) == 0:
+                break
+            if attempt > 0:
+                await asyncio.sleep(BACKFILL_RETRY_SECONDS * attempt)
+            responses = await asyncio.gather(*[probe(pageID) for pageID in pending])
+            self.checkpoint['requests'] += len(responses)
+            results = await self.scraper.process_many(responses)
+            pending = []
+            for (pageID, statusCode, content), result in zip(responses, results):
+                if 'error' in result:
+                    pending.append(pageID)
+                elif result['ad'] is not None:
+                    ads.append(result['ad'])
+        ads.sort(key=lambda ad: ad['id'])
+        return ads, pending
+
+
+    async def run(self):
+        '''Recorre las ventanas pendientes. Devuelve el punto de control final.'''
+        try:
+            while self.checkpoint['nextID'] < self.endID:
+                if self.maxRequests is not None and self.checkpoint['requests'] >= self.maxRequests:
+                    print('Request budget reached at ID {}.'.format(self.checkpoint['nextID']))
+                    break
+                start = time.perf_counter()
+                firstID = self.checkpoint['nextID']
+                lastID = min(self.endID, firstID + self.windowSize)
+                ads, failed = await self.crawl_window(firstID, lastID)
+                self.archive.write(ads)
+                if len(failed) > 0:
+                    with open(os.path.join(self.folder, FILE_FAILED), 'a') as fileOut:
+                        fileOut.write(''.join(['{}\n'.format(pageID) for pageID in failed]))
+                self.checkpoint['nextID'] = lastID
+                self.checkpoint['ads'] += len(ads)
+                self.checkpoint['failed'] += len(failed)
+                self.checkpoint['seconds'] += time.perf_counter() - start
+                self.checkpoint.update(self.archive.position())
+                save_checkpoint(self.folder, self.checkpoint)
+                print('{} / {}  ads: {}  failed: {}  requests: {}'.format(
+                    lastID - self.startID, self.endID - self.startID, self.checkpoint['ads'],
+                    self.checkpoint['failed'], self.checkpoint['requests']))
+        finally:
+            await self.scraper.close()
+        return self.checkpoint
+
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Guarda los anuncios de un rango de IDs de revolico.')
+    parser.add_argument('start', type=int, help='Primer ID del rango.')
+    parser.add_argument('end', type=int, help='ID final del rango (no se incluye).')
+    parser.add_argument('--folder', default=BACKFILL_FOLDER, help='Carpeta del archivo y del punto de control.')
+    parser.add_argument('--window', type=int, default=BACKFILL_WINDOW, help='IDs que se piden en cada ventana.')
+    parser.add_argument('--in-flight', type=int, default=BACKFILL_MAX_IN_FLIGHT, help='Pedidos simultáneos.')
+    parser.add_argument('--rps', type=float, default=BACKFILL_REQUESTS_PER_SECOND, help='Pedidos por segundo.')
+    parser.add_argument('--max-requests', type=int, default=None, help='Se detiene después de estos pedidos.')
+    parser.add_argument('--workers', type=int, default=None, help='Procesos que analizan las páginas.')
+    parser.add_argument('--restart', action='store_true', help='Descarta el punto de control y el archivo anteriores.')
+    args = parser.parse_args()
+
+    if args.restart:
+        os.makedirs(args.folder, exist_ok=True)
+        for name in os.listdir(args.folder):
+            if name == FILE_CHECKPOINT or name == FILE_FAILED or name.startswith('ads-'):
+                os.remove(os.path.join(args.folder, name))
+    pool = ParserPool() if args.workers is None else ParserPool(args.workers)
+    backfill = Backfill(args.start, args.end, args.folder, args.window, args.in_flight, args.rps, args.max_requests, pool)
+    if not backfill.resume():
+        print('The folder has a checkpoint for another range. Use --restart or another --folder.')
+        return
+    try:
+        asyncio.run(backfill.run())
+    except KeyboardInterrupt:
+        print('Stopped. Run again with the same arguments to resume.')
+    finally:
+        pool.close()
+
+
+if __name__ == '__main__':
+    main()
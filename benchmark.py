@@ -0,0 +1,428 @@
+'''Banco de pruebas de extremo a extremo del bot.
+Levanta en la propia máquina un sustituto de revolico.com, que sirve páginas de anuncios
+por su ID con latencia, huecos (404) y rechazos (429) configurables, y un sustituto de la
+API de bots de Telegram que registra los envíos. Luego hace funcionar el scraper y
+show_messages_ad() reales contra ellos y mide anuncios por segundo, envíos por segundo,
+latencias p50/p99 de cada etapa y memoria. Los resultados se agregan a un fichero para
+poder comparar entre versiones.
+
+Uso: python benchmark.py --ads 500 --receivers 20 --latency 0.02 --gaps 0.1 --throttle 0.01
+'''
+__version__ = '1.0'
+__author__ = 'Santiago Orellana Perez'
+__created__ = '18/octubre/2026'
+__tested__ = 'Python 3.10'
+
+import os
+import re
+import sys
+import json
+import time
+import types
+import random
+import asyncio
+import argparse
+import datetime
+import tempfile
+import shutil
+import threading
+import subprocess
+import tracemalloc
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from telegram import Bot
+from telegram.request import HTTPXRequest
+from scraper_revolico import AsyncScraperRevolico, REVOLICO_BASE_ID
+from data_out import LOG, show_messages_ad
+from log_writer import level_of
+from routing import RoutingIndex
+from fanout import FanoutSender, TELEGRAM_POOL_SIZE
+from metrics import STAGE_SECONDS, HTTP_RESPONSES, SENDS, reset_metrics
+
+FILE_BENCHMARK_RESULTS = './benchmark_results.jsonl'
+BENCHMARK_TOKEN = '123456:BENCHMARK'
+BENCHMARK_STAGES = ['fetch', 'parse', 'render', 'fanout']
+BENCHMARK_SUBCATEGORIES = [(31, 'Celulares/Líneas/Accesorios', 30, 'Compra / Venta'),
+                           (121, 'Autos', 120, 'Autos'),
+                           (101, 'Compra/Venta', 100, 'Vivienda'),
+                           (72, 'Clases/Cursos', 70, 'Servicios')]
+BENCHMARK_TITLES = ['Vendo iPhone 12 nuevo', 'Se vende Moskvich en buen estado', 'Casa en Playa con patio',
+                    'Clases de matemática a domicilio', 'Laptop Dell i5 8GB', 'Split 1 tonelada con garantía']
+
+
+def make_ad_page(adID, hours, seed=0):
+    '''Construye una página de anuncio con el mismo formato que las de revolico.com
+    (el JSON de Next.js dentro de <script id="__NEXT_DATA__">), publicada hace las horas indicadas.
+    '''
+    rand = random.Random(adID * 31 + seed)
+    subcategoryID, subcategoryName, categoryID, categoryName = rand.choice(BENCHMARK_SUBCATEGORIES)
+    updated = (datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(hours=hours)).isoformat()
+    phone = '5{} o 5{}'.format(rand.randint(1000000, 9999999), rand.randint(1000000, 9999999))
+    title = '{} {}'.format(rand.choice(BENCHMARK_TITLES), adID)
+    state = {
+        'AdType:{}'.format(adID): {
+            'viewCount': rand.randint(0, 500), 'permalink': '/x/{}.html'.format(adID), 'phone': phone,
+            'title': title, 'price': rand.randint(10, 5000), 'currency': rand.choice(['USD', 'CUP', 'MLC']),
+            'name': 'Vendedor {}'.format(adID % 97), 'status': 'ACTIVE', 'isAuto': False,
+            'updatedOnToOrder': updated, 'updatedOnByUser': updated,
+            'province': {'__ref': 'ProvinceType:1'}, 'municipality': {'__ref': 'MunicipalityType:2'},
+            'subcategory': {'__ref': 'SubcategoryType:{}'.format(subcategoryID)},
+            'description': ' '.join([title] * rand.randint(3, 20)) + ' Llamar al {}'.format(phone),
+            'imagesCount': 1, 'images': {'edges': [{'node': {'__ref': 'ImageType:9'}}]}
+            },
+        'ProvinceType:1': {'id': 1, 'name': 'La Habana'},
+        'MunicipalityType:2': {'id': 2, 'name': 'Plaza'},
+        'SubcategoryType:{}'.format(subcategoryID): {'id': subcategoryID, 'title': subcategoryName,
+                                                    'parentCategory': {'__ref': 'CategoryType:{}'.format(categoryID)}},
+        'CategoryType:{}'.format(categoryID): {'id': categoryID, 'title': categoryName},
+        'ImageType:9': {'urls': {'high': 'http://x/h.jpg', 'thumb': 'http://x/t.jpg'}}
+        }
+    data = {'props': {'pageProps': {'id': adID, '__APOLLO_STATE__': state}}}
+    # Relleno para que la página tenga un tamaño parecido al de las reales (unos 100 KB).
+    filler = "<div class='c'><span>texto</span></div>" * 2500
+    return ('<html><head><title>{}</title></head><body>{}<script id="__NEXT_DATA__" type="application/json">{}'
+            '</script></body></html>').format(title, filler, json.dumps(data)).encode('utf-8')
+
+
+
+class RevolicoStandIn():
+    '''Sustituto local de revolico.com. Responde a cualquier URL terminada en /<ID>.html,
+    como las que genera ScraperRevolico.get_random_url(). Si se indica una carpeta con páginas
+    grabadas (<ID>.html), las sirve; si no, genera páginas con make_ad_page().
+    Los IDs desde firstID hasta firstID + count tienen anuncio salvo los huecos (gapRate),
+    que responden 404. Una fracción de los pedidos (throttleRate) responde 429.
+    '''
+    def __init__(self, firstID=REVOLICO_BASE_ID, count=1000, latency=0.0, gapRate=0.0, throttleRate=0.0,
+                 hours=48, folder=None, seed=0, port=0):
+        self.firstID = firstID
+        self.count = count
+        self.latency = latency
+        self.throttleRate = throttleRate
+        self.hours = hours
+        self.folder = folder
+        self.seed = seed
+        self.requests = 0
+        self.throttled = 0
+        rand = random.Random(seed)
+        self.gaps = set([adID for adID in range(firstID, firstID + count) if rand.random() < gapRate])
+        self._pages = {}
+        self._lock = threading.Lock()
+        self._rand = random.Random(seed + 1)
+        self.server = ThreadingHTTPServer(('127.0.0.1', port), self.make_handler())
+        self.server.daemon_threads = True
+        self.port = self.server.server_address[1]
+
+
+    def get_url(self, pageID):
+        return 'http://127.0.0.1:{}/item/{}.html'.format(self.port, pageID)
+
+
+    def get_page(self, pageID):
+        '''Devuelve el código de estado y el contenido que corresponde al ID.'''
+        with self._lock:
+            self.requests += 1
+            if self._rand.random() < self.throttleRate:
+                self.throttled += 1
+                return 429, b'Too Many Requests'
+        if pageID in self.gaps or not (self.firstID <= pageID < self.firstID + self.count):
+            return 404, b'<html><body>Not found</body></html>'
+        if self.folder is not None:
+            fileName = os.path.join(self.folder, '{}.html'.format(pageID))
+            if os.path.exists(fileName):
+                with open(fileName, 'rb') as fileIn:
+                    return 200, fileIn.read()
+        page = self._pages.get(pageID)
+        if page is None:
+            # Los anuncios más antiguos tienen los IDs más bajos, igual que en revolico.
+            age = self.hours * (1 - (pageID - self.firstID) / (2 * self.count))
+            page = make_ad_page(pageID, age, self.seed)
+            self._pages[pageID] = page
+        return 200, page
+
+
+    def make_handler(self):
+        standIn = self
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self, withBody=True):
+                if standIn.latency > 0:
+                    time.sleep(standIn.latency)
+                match = re.search(r'/(\d+)\.html$', self.path.split('?')[0])
+                if match is None:
+                    status, body = 404, b''
+                else:
+                    status, body = standIn.get_page(int(match.group(1)))
+                self.send_response(status)
+                if status == 429:
+                    self.send_header('Retry-After', '1')
+                self.send_header('Content-Type', 'text/html; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                if withBody:
+                    self.wfile.write(body)
+
+            def do_HEAD(self):
+                self.do_GET(withBody=False)
+
+            def log_message(self, format, *args):
+                pass
+        return Handler
+
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, name='RevolicoStandIn', daemon=True).start()
+        return self
+
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+
+class TelegramStandIn():
+    '''Sustituto local de la API de bots de Telegram. Responde a getMe, sendMessage, sendPhoto
+    y sendMediaGroup, y registra cada envío en sends como (método, chat_id).
+    Una fracción de los envíos (throttleRate) responde 429 con retry_after igual a 1.
+    '''
+    def __init__(self, latency=0.0, throttleRate=0.0, seed=0, port=0):
+        self.latency = latency
+        self.throttleRate = throttleRate
+        self.sends = []
+        self.throttled = 0
+        self._lock = threading.Lock()
+        self._rand = random.Random(seed)
+        self._messageID = 0
+        self.server = ThreadingHTTPServer(('127.0.0.1', port), self.make_handler())
+        self.server.daemon_threads = True
+        self.port = self.server.server_address[1]
+
+
+    def get_base_url(self):
+        return 'http://127.0.0.1:{}/bot'.format(self.port)
+
+
+    def answer(self, method, params):
+        '''Devuelve el JSON de la respuesta de la API al método indicado.'''
+        if method == 'getMe':
+            return {'ok': True, 'result': {'id': 123456, 'is_bot': True, 'first_name': 'Benchmark', 'username': 'benchmark_bot'}}
+        with self._lock:
+            if self._rand.random() < self.throttleRate:
+                self.throttled += 1
+                return {'ok': False, 'error_code': 429, 'description': 'Too Many Requests: retry after 1',
+                        'parameters': {'retry_after': 1}}
+            self._messageID += 1
+            messageID = self._messageID
+            self.sends.append((method, params.get('chat_id')))
+        try:
+            chatID = int(params.get('chat_id'))
+            chat = {'id': chatID, 'type': 'private' if chatID > 0 else 'supergroup', 'title': 'Benchmark'}
+        except (TypeError, ValueError):
+            chat = {'id': -1, 'type': 'channel', 'title': str(params.get('chat_id'))}
+        message = {'message_id': messageID, 'date': int(time.time()), 'chat': chat}
+        if method in ['sendPhoto', 'sendMediaGroup']:
+            message['photo'] = [{'file_id': 'photo{}'.format(messageID), 'file_unique_id': 'u{}'.format(messageID),
+                                 'width': 320, 'height': 240}]
+        if method == 'sendMediaGroup':
+            return {'ok': True, 'result': [message]}
+        message['text'] = params.get('text', '')
+        return {'ok': True, 'result': message}
+
+
+    def make_handler(self):
+        standIn = self
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_POST(self):
+                if standIn.latency > 0:
+                    time.sleep(standIn.latency)
+                body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                contentType = self.headers.get('Content-Type', '')
+                if contentType.startswith('application/json'):
+                    params = json.loads(body or b'{}')
+                elif contentType.startswith('application/x-www-form-urlencoded'):
+                    params = dict(urllib.parse.parse_qsl(body.decode('utf-8')))
+                else:
+                    # Los envíos con ficheros llegan como multipart, solo interesa el chat_id.
+                    match = re.search(rb'name="chat_id"\r\n\r\n([^\r]*)', body)
+                    params = {'chat_id': match.group(1).decode('utf-8') if match else None}
+                answer = json.dumps(standIn.answer(self.path.rsplit('/', 1)[-1], params)).encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(answer)))
+                self.end_headers()
+                self.wfile.write(answer)
+
+            def do_GET(self):
+                self.do_POST()
+
+            def log_message(self, format, *args):
+                pass
+        return Handler
+
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, name='TelegramStandIn', daemon=True).start()
+        return self
+
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+
+def get_revision():
+    '''Devuelve el commit actual del repositorio, o una cadena vacía si no se puede obtener.'''
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except Exception:
+        return ''
+
+
+def get_max_rss_mb():
+    '''Devuelve el máximo de memoria residente del proceso en MB, o None si no se puede obtener.'''
+    try:
+        import resource
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return round(rss / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+    except Exception:
+        return None
+
+
+async def run_benchmark(ads=500, receivers=20, latency=0.0, gapRate=0.0, throttleRate=0.0,
+                        botLatency=0.0, botThrottleRate=0.0, telegramLimits=False, folder=None, seed=0, traceMemory=False):
+    '''Hace funcionar el scraper y el envío de anuncios reales contra los sustitutos locales
+    hasta recorrer todos los IDs. Si traceMemory es True, mide además el pico de memoria
+    reservada con tracemalloc, que hace más lento todo el proceso. Devuelve un diccionario con los parámetros y los resultados.
+    '''
+    params = {'ads': ads, 'receivers': receivers, 'latency': latency, 'gapRate': gapRate,
+              'throttleRate': throttleRate, 'botLatency': botLatency, 'botThrottleRate': botThrottleRate,
+              'telegramLimits': telegramLimits, 'folder': folder, 'seed': seed}
+    revolico = RevolicoStandIn(REVOLICO_BASE_ID, ads, latency, gapRate, throttleRate, folder=folder, seed=seed).start()
+    telegram = TelegramStandIn(botLatency, botThrottleRate, seed).start()
+    LOG.toConsole = False
+    LOG.level = level_of('WARNING')
+    reset_metrics()
+    folderTemp = tempfile.mkdtemp(prefix='adfiller-benchmark-')
+    scraper = AsyncScraperRevolico(0.5, False, os.path.join(folderTemp, 'lastid.txt'), REVOLICO_BASE_ID)
+    scraper.get_random_url = revolico.get_url
+    # Comienza en el primer ID y avanza de uno en uno, sin localizar la frontera.
+    scraper._frontierKnown = True
+    scraper._maxNones = ads
+    listReceivers = [{'id': -1000000000000 - n, 'category': 'todos'} for n in range(receivers)]
+    router = RoutingIndex(listReceivers)
+    if telegramLimits:
+        sender = FanoutSender()
+    else:
+        sender = FanoutSender(globalRate=1000000, privateRate=1000000, groupRate=1000000)
+    request = HTTPXRequest(connection_pool_size=TELEGRAM_POOL_SIZE)
+    bot = Bot(BENCHMARK_TOKEN, base_url=telegram.get_base_url(), request=request)
+    await bot.initialize()
+    context = types.SimpleNamespace(bot=bot)
+
+    if traceMemory:
+        tracemalloc.start()
+    delivered = 0
+    start = time.perf_counter()
+    try:
+        while scraper.revolicoAdID < REVOLICO_BASE_ID + ads:
+            result = await scraper.get_next_page(useSleep=False)
+            if await show_messages_ad(context, listReceivers, result, router=router, sender=sender):
+                delivered += 1
+    finally:
+        seconds = time.perf_counter() - start
+        memoryPeak = None
+        if traceMemory:
+            memoryCurrent, memoryPeak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+        await bot.shutdown()
+        await scraper.close()
+        revolico.stop()
+        telegram.stop()
+        shutil.rmtree(folderTemp, ignore_errors=True)
+
+    results = {'seconds': round(seconds, 3),
+               'ads': delivered,
+               'adsPerSecond': round(delivered / seconds, 2),
+               'sends': len(telegram.sends),
+               'sendsPerSecond': round(len(telegram.sends) / seconds, 2),
+               'sendsFailed': SENDS.get(outcome='failed'),
+               'requests': revolico.requests,
+               'responses': dict([(dict(key)['status'], value) for key, value in HTTP_RESPONSES.snapshot()]),
+               'tracemallocPeakMB': round(memoryPeak / (1024 * 1024), 2) if memoryPeak is not None else None,
+               'maxRssMB': get_max_rss_mb()}
+    for stage in BENCHMARK_STAGES:
+        p50 = STAGE_SECONDS.quantile(0.5, stage=stage)
+        if p50 is not None:
+            results['{}P50ms'.format(stage)] = round(p50 * 1000, 2)
+            results['{}P99ms'.format(stage)] = round(STAGE_SECONDS.quantile(0.99, stage=stage) * 1000, 2)
+    return {'date': datetime.datetime.now().isoformat(timespec='seconds'), 'revision': get_revision(),
+            'python': sys.version.split()[0], 'params': params, 'results': results}
+
+
+def load_results(fileName=FILE_BENCHMARK_RESULTS):
+    '''Devuelve la lista de resultados guardados. Ignora las líneas que no se pueden leer.'''
+    records = []
+    if not os.path.exists(fileName):
+        return records
+    with open(fileName, 'r', encoding='utf-8') as fileIn:
+        for line in fileIn:
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                pass
+    return records
+
+
+def save_result(record, fileName=FILE_BENCHMARK_RESULTS):
+    '''Agrega el resultado al final del fichero de resultados (una línea JSON por medición).'''
+    with open(fileName, 'a', encoding='utf-8') as fileOut:
+        fileOut.write(json.dumps(record) + '\n')
+
+
+def show_result(record, previous=None):
+    '''Muestra el resultado y, si se indica, la variación respecto a una medición anterior
+    hecha con los mismos parámetros.
+    '''
+    print('Benchmark {} ({})'.format(record['revision'] or '-', record['date']))
+    for key, value in record['results'].items():
+        line = '  {:<20} {}'.format(key, value)
+        if previous is not None:
+            before = previous['results'].get(key)
+            if isinstance(value, (int, float)) and isinstance(before, (int, float)) and before != 0:
+                line = line + '  ({:+.1f}% vs {})'.format((value - before) * 100 / before, previous['revision'] or '-')
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Banco de pruebas de extremo a extremo del bot.')
+    parser.add_argument('--ads', type=int, default=500, help='Cantidad de IDs a recorrer.')
+    parser.add_argument('--receivers', type=int, default=20, help='Cantidad de receptores.')
+    parser.add_argument('--latency', type=float, default=0.0, help='Latencia de revolico en segundos.')
+    parser.add_argument('--gaps', type=float, default=0.0, help='Fracción de IDs sin página (404).')
+    parser.add_argument('--throttle', type=float, default=0.0, help='Fracción de pedidos rechazados (429).')
+    parser.add_argument('--bot-latency', type=float, default=0.0, help='Latencia de la API de Telegram en segundos.')
+    parser.add_argument('--bot-throttle', type=float, default=0.0, help='Fracción de envíos rechazados (429).')
+    parser.add_argument('--telegram-limits', action='store_true', help='Respeta los límites de envío de Telegram.')
+    parser.add_argument('--pages', default=None, help='Carpeta con páginas grabadas (<ID>.html).')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--trace-memory', action='store_true', help='Mide el pico de memoria con tracemalloc (más lento).')
+    parser.add_argument('--results', default=FILE_BENCHMARK_RESULTS, help='Fichero donde se guardan los resultados.')
+    parser.add_argument('--no-save', action='store_true', help='No guarda el resultado.')
+    args = parser.parse_args()
+
+    record = asyncio.run(run_benchmark(args.ads, args.receivers, args.latency, args.gaps, args.throttle,
+                                       args.bot_latency, args.bot_throttle, args.telegram_limits, args.pages, args.seed,
+                                       args.trace_memory))
+    previous = [old for old in load_results(args.results) if old.get('params') == record['params']]
+    show_result(record, previous[-1] if len(previous) > 0 else None)
+    if not args.no_save:
+        save_result(record, args.results)
+
+
+if __name__ == '__main__':
+    main()
@@ -43,6 +43,13 @@ COMMANDS = [
         'El parámetro es el ID del usuario receptor o el @nombre del grupo o canal al que se enviará la publicidad.',
         'Ejemplo: /del @setvmasinfo'
         ]},
+    {'name':'/filter receptor reglas', 'root':False, 'description':[
+        'Establece el filtro de anuncios de un receptor, que solo recibirá los anuncios de sus categorías que lo cumplan.',
+        'Las palabras que el anuncio debe contener se escriben tal cual y las que no debe contener con - delante. Las palabras de una frase se unen con _.',
+        'Condiciones opcionales: precio:MIN-MAX, moneda:USD, provincia:NOMBRE y municipio:NOMBRE (espacios con _).',
+        'Sin reglas, muestra el filtro del receptor. Con la regla borrar, lo elimina.',
+        'Ejemplo: /filter @setvmasinfo iphone -funda precio:-300 moneda:usd provincia:la_habana'
+        ]},
     {'name':'/categories', 'root':False, 'description':['Muestra la lista de categorías de publicidad.']},
     {'name':'/admins', 'root':True, 'description':['Muestra la lista de administradores del bot.']},
     {'name':'/add userID', 'root':True, 'description':[
@@ -57,6 +64,13 @@ COMMANDS = [
         ]},
     {'name':'/help', 'root':False, 'description':['Muestra la descripción de los comandos del bot.']},
     {'name':'/status', 'root':False, 'description':['Muestra el estado de funcionamiento del bot.']},
+    {'name':'/metrics', 'root':False, 'description':['Muestra las métricas de latencia, respuestas y envíos del bot.']},
+    {'name':'/search palabras', 'root':False, 'description':[
+        'Busca anuncios en el índice local.',
+        'Los parámetros son las palabras a buscar. Una palabra terminada en * se busca como prefijo.',
+        'Filtros opcionales: precio:MIN-MAX, provincia:NOMBRE (espacios con _) y pagina:N.',
+        'Ejemplo: /search iphone precio:100-300 provincia:la_habana'
+        ]},
     {'name':'/send', 'root':False, 'description':[
         'Para enviar mensajes al administrador ROOT.',
         'El parámetro es el texto que se debe enviar al administrador ROOT.'
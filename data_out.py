@@ -7,6 +7,12 @@ import asyncio
 from telegram import (ReplyKeyboardMarkup, Update)
 from telegram.ext import (ContextTypes)
 from const import *
+from fanout import retry_delay
+from media import AdMedia
+from formatter import *
+from log_writer import LOG, create_filename
+from scraper_revolico import parse_timestamp
+from metrics import STAGE_SECONDS, SENDS, FRESHNESS_LAG
 
 
 INSISTENCE_COUNT_MAX = 10
@@ -14,48 +20,30 @@ INSISTENCE_PAUSE_SECONDS = 0.5
 
 
 def sync_create_filename(dateTime):
-    dateTime = datetime.datetime.now()
-    date = dateTime.strftime('%Y-%m-%d')  
-    return './dinamic-grid-bot-{}.log'.format(date)
+    return create_filename(dateTime)
 
 
 def sync_to_file_cmd(msgType, msg):
     '''Escribe mensajes en un fichero y en consola. Si el fichero no existe, lo crea. Se crea un fichero para cada dia.'''
-    try:
-        dateTime = datetime.datetime.now()
-        fileOut = open(sync_create_filename(dateTime), 'a')
-        fileOut.write('{} {} {}\n'.format(str(dateTime), str(msgType), str(msg)))
-        print(str(dateTime), str(msgType), str(msg))
-        fileOut.close()
-    except Exception as e:
-        print(str(dateTime), 'ERROR', 'sync_to_file_cmd(): {}'.format(str(e)))
+    LOG.write(msgType, msg)
 
         
 async def to_file(msgType, msg, dateTime=None):
     '''Escribe mensajes en un fichero. Si el fichero no existe, lo crea. Se crea un fichero para cada dia.'''
-    try:
-        if dateTime is None:
-            dateTime = datetime.datetime.now()
-        fileOut = open(sync_create_filename(dateTime), 'a')
-        fileOut.write('{} {} {}\n'.format(str(dateTime), str(msgType), str(msg)))
-        fileOut.close()
-    except Exception as e:
-        print(str(dateTime), 'ERROR', 'to_file(): {}'.format(str(e)))
+    LOG.write(msgType, msg, dateTime, toConsole=False)
 
 
 async def to_cmd(msgType, msg, toFile=True):
-    '''Escribe mensajes de reporte en la linea de comandos y en un fichero'''
+    '''Escribe mensajes de reporte en la linea de comandos y en un fichero.
+    Los mensajes solo se ponen en la cola de LOG, que los escribe en un hilo aparte.
+    '''
     dateTime = datetime.datetime.now()
     try:
         if isinstance(msg, str):
-            if toFile:
-                await to_file(str(msgType), str(msg), dateTime)
-            print(str(dateTime), str(msgType), str(msg))
+            LOG.write(msgType, msg, dateTime, toFile)
         elif isinstance(msg, list):
             for line in msg:
-                if toFile:
-                    await to_file(str(msgType), str(line), dateTime)
-                print(str(dateTime), str(msgType), str(line))
+                LOG.write(msgType, line, dateTime, toFile)
     except Exception as e:
         print(str(dateTime), 'ERROR', 'to_cmd(): Failed to print message. {}'.format(str(e)))
     else:
@@ -70,119 +58,39 @@ async def show_message(context, chat_id, message):
         try:
             await context.bot.send_message(chat_id, message, parse_mode = 'HTML')
         except Exception as e:
-            await asyncio.sleep(INSISTENCE_PAUSE_SECONDS)
             error = e
+            delay = retry_delay(e, i)
+            if delay is None:
+                break
+            await asyncio.sleep(max(delay, INSISTENCE_PAUSE_SECONDS))
         else:
             return True
     await to_cmd('WARNING', 'show_message(): The message could not be sent to the chat. {}'.format(str(error)))
     return False
 
 
-async def processOne(text):
-    '''Se le pasa el número de teléfono y trata de corregirlo y completarlo.
-    Patron para telefonos de Cuba, Fijos: +537xxxxxxx  Moviles: +535xxxxxxx
+async def select_receivers(listReceivers, adJSON, ledger=None, reposts=None, router=None):
+    '''Devuelve la lista de receptores a los que se debe enviar el anuncio según su categoría.
+    Si se indica el índice de enrutamiento (router), los receptores se obtienen de él
+    en lugar de recorrer toda la lista de receptores, aplicando los filtros de los receptores.
+    Si se indica el registro de envíos (ledger), se quitan los receptores que ya lo recibieron.
+    Si se indica el índice de anuncios repetidos (reposts) y el anuncio es una repetición,
+    devuelve una lista vacía.
     '''
-    phoneText = str(text).replace(' ', '')
-    if len(phoneText) == 7: 
-        return '+535' + phoneText   # Asume que es un celular porque los cubanos al fijo siempre le ponene el 7 delante.
-    if len(phoneText) == 8:
-        return '+53' + phoneText
-    elif len(phoneText) == 9 and phoneText[0] == '3':   # Tiene que ser 3, porque en caso de ser cero, es el codigo antiguo.
-        return '+5' + phoneText
-    elif len(phoneText) == 10 and phoneText[0] == '5' and phoneText[1] == '3':
-        return '+' + phoneText
-    elif len(phoneText) > 10 and phoneText[0] != '+':
-        return '+' + phoneText
+    ad = adJSON['ad']
+    repostOf = None
+    if reposts is not None:
+        phones = get_phone_numbers(ad['phone']) if ad['phone'] is not None else []
+        repostOf = reposts.check_and_add(ad, phones)
+    receivers = []
+    if router is not None:
+        try:
+            receiversID = router.route_ad(ad)
+        except Exception as e:
+            await to_cmd('WARNING', 'show_messages_ad(): no send. {}'.format(str(e)))
+            receiversID = []
     else:
-        return phoneText
-
-
-async def sequential_filter_numbers(phoneText):
-    '''Filtra el texto de manera secuencial e inserta caracter / para separar los numeros.'''
-    filtered = ''
-    count = 0
-    for i in range(len(str(phoneText))):
-        if str(phoneText)[i].isdigit():
-            filtered = filtered + phoneText[i]
-            count += 1
-        elif count > 7:
-            filtered = filtered + '/'
-            count = 0
-    return filtered
-
-    
-async def get_phone_numbers(text):
-    '''Se le pasa una cadena de texto y trata de encontrar los números de teléfono que contiene.'''
-    phoneText = await sequential_filter_numbers(str(text))
-    if len(phoneText) > 12:
-        phonesList = phoneText.rsplit('/')
-        if len(phonesList) > 1:                                 # Si se divide por el splitter...
-            result = []
-            for phone in phonesList:            
-                if len(phone) > 6:                              # Verifica que cada parte tenga espacio para contener un número de teléfono.
-                    result.append(await processOne(phone))
-            if len(result) > 1:
-                return result
-    return [await processOne(phoneText)]
-
-
-async def emoji_of_word(word):
-    '''Devuelve el emoji correspondiente a la palabra'''
-    key = word.lower().rstrip().lstrip()
-    if key in SETVMAS_WORDS_EMOJIS:
-        return SETVMAS_WORDS_EMOJIS[key]
-    return ''
-
-
-async def text_emojis(text, returnText=False):
-    '''Devuelve el texto embellecido con emojis.'''
-    result = ''
-    wordList = str(text).rsplit(' ')
-    for word in wordList:
-        result = result + await emoji_of_word(word)
-        if returnText:
-            result = result + ' ' + word
-    return result
-    
-    
-
-async def show_messages_ad(context, listReceivers, adJSON):
-    '''Envía a cada receptor los anuncios que le corresponden según su categoría.
-    Embellece los anuncios colocandoles emojis y dándoles formato.
-    '''
-    if not 'ad' in adJSON:
-        return False
-    if adJSON['ad'] is not None:
-        ad = adJSON['ad']
-        await to_cmd('INFO', 'ad {}: {}'.format(ad['id'], ad['title']))
-        msg = '{} <b>{}</b>\n'.format(await text_emojis(ad['title']), ad['title'])
-        if ad['price'] is not None:
-            msg = msg + '\n{} {} {}\n'.format(EMOJI_PRICE, ad['price'], ad['currency'])
-        if ad['description'] != ad['title'] and len(ad['description']) > 3:
-            extra = len(ad['description']) + len(msg) + 50 - 4096   # Telegram solo admite mensajes de 4096 caracteres.
-            if extra >0:
-                description = ad['description'][0:-1*extra]  # Limita los textos que son muy largos.
-            else:
-                description = ad['description']
-            msg = msg + '\n{}\n'.format(description)
-        if ad['name'] is not None:
-            msg = msg + '\n{} <b>{}</b>'.format(EMOJI_NAME, ad['name'])
-        if ad['phone'] is not None:
-            phones = await get_phone_numbers(ad['phone'])
-            if len(phones) > 0:
-                for phoneNumber in phones:
-                    msg = msg + '\n{} {}'.format(EMOJI_PHONE, phoneNumber)
-            if len(phones) > 0 and int(ad['imagesCount']) > 0:
-                for phoneNumber in phones:
-                    if phoneNumber.startswith('+535'):
-                        msg = msg + '\n{} <a href="wa.me/{}">WhatsApp</a>'.format(EMOJI_WHATSAPP, phoneNumber[1:])
-            msg = msg + '\n\n{} {}'.format(EMOJI_LOCALIDAD, ad['provinceName'])
-            if 'municipalityName' in ad:
-                msg = msg + '-' + ad['municipalityName']
-            if 'tags' in adJSON:
-                if len(adJSON['tags']) > 0:
-                    msg = msg + '\n{} {}'.format(EMOJI_TAG, ' '.join(adJSON['tags']))
-            
+        receiversID = []
         for receiver in listReceivers:
             category = receiver['category']
             sendAd = False
@@ -193,19 +101,146 @@ async def show_messages_ad(context, listReceivers, adJSON):
             except Exception as e:
                 await to_cmd('WARNING', 'show_messages_ad(): no send. {}'.format(str(e)))
                 sendAd = False
-            if sendAd:
+            if sendAd and receiver['id'] not in receiversID:
+                receiversID.append(receiver['id'])
+    for receiverID in receiversID:
+        if ledger is not None and ledger.contains(ad['id'], receiverID):
+            continue
+        receivers.append(receiverID)
+    if repostOf is not None and len(receivers) > 0:
+        reposts.savedSends += len(receivers)
+        await to_cmd('INFO', 'ad {} is a repost of {}, {} sends saved.'.format(ad['id'], repostOf, len(receivers)))
+        return []
+    return receivers
+
+
+async def send_ad(context, receivers, adJSON, ledger=None, sender=None, media=None):
+    '''Da formato al anuncio y lo envía a los receptores indicados.
+    Si se indica el emisor concurrente (sender), se envía a todos los receptores a la vez
+    respetando los límites de Telegram, en lugar de uno por uno.
+    Si se indica la caché de imágenes (media), la imagen se descarga y se sube una sola vez.
+    Devuelve un diccionario receptor -> (éxito, mensaje enviado o error).
+    '''
+    ad = adJSON['ad']
+    with STAGE_SECONDS.time(stage='render'):
+        msg = render_ad(adJSON)
+
+    adMedia = None
+    if media is not None and int(ad['imagesCount']) > 0 and len(ad.get('images', [])) > 0:
+        adMedia = AdMedia(ad, media)
+
+    async def send(receiverID):
+        if adMedia is not None:
+            return await adMedia.send(context.bot, receiverID, msg)
+        if int(ad['imagesCount']) > 0:
+            return await context.bot.send_photo(receiverID, ad['images'][0]['thumb'], caption=msg, parse_mode = 'HTML')
+        return await context.bot.send_message(receiverID, msg, parse_mode = 'HTML')
+
+    with STAGE_SECONDS.time(stage='fanout'):
+        if sender is not None:
+            results = await sender.send_all(receivers, send)
+        else:
+            results = {}
+            for receiverID in receivers:
                 try:
-                    if int(ad['imagesCount']) > 0:
-                        await context.bot.send_photo(receiver['id'], ad['images'][0]['thumb'], caption=msg, parse_mode = 'HTML')
-                    else:
-                        await context.bot.send_message(receiver['id'], msg, parse_mode = 'HTML')
+                    results[receiverID] = (True, await send(receiverID))
                 except Exception as e:
-                    await to_cmd('WARNING', 'the message could not be sent to {}. {}'.format(str(receiver['id']), str(e)))
+                    results[receiverID] = (False, e)
+    if any([success for success, result in results.values()]):
+        try:
+            lag = datetime.datetime.utcnow() - parse_timestamp(ad['updatedOnByUser'])
+            FRESHNESS_LAG.observe(max(0, lag.total_seconds()))
+        except Exception:
+            pass
+    for receiverID, (success, result) in results.items():
+        SENDS.inc(outcome='sent' if success else 'failed')
+        if success:
+            if ledger is not None:
+                ledger.add(ad['id'], receiverID)
+        else:
+            await to_cmd('WARNING', 'the message could not be sent to {}. {}'.format(str(receiverID), str(result)))
+    return results
+
+
+async def show_messages_ad(context, listReceivers, adJSON, ledger=None, reposts=None, router=None, sender=None, media=None):
+    '''Envía a cada receptor los anuncios que le corresponden según su categoría.
+    Embellece los anuncios colocandoles emojis y dándoles formato.
+    Los parámetros opcionales se describen en select_receivers() y send_ad().
+    '''
+    if not 'ad' in adJSON:
+        return False
+    if adJSON['ad'] is not None:
+        ad = adJSON['ad']
+        await to_cmd('INFO', 'ad {}: {}'.format(ad['id'], ad['title']))
+        receivers = await select_receivers(listReceivers, adJSON, ledger, reposts, router)
+        if len(receivers) > 0:
+            await send_ad(context, receivers, adJSON, ledger, sender, media)
         return True
     else:
         return False                
 
 
+async def enqueue_messages_ad(queue, listReceivers, adJSON, ledger=None, reposts=None, router=None):
+    '''Igual que show_messages_ad(), pero en lugar de enviar el anuncio lo agrega a la cola
+    de envíos, con una entrada por receptor. Luego deliver_messages_ad() lo envía.
+    '''
+    if not 'ad' in adJSON:
+        return False
+    if adJSON['ad'] is not None:
+        ad = adJSON['ad']
+        await to_cmd('INFO', 'ad {}: {}'.format(ad['id'], ad['title']))
+        receivers = await select_receivers(listReceivers, adJSON, ledger, reposts, router)
+        if len(receivers) > 0:
+            queue.enqueue(adJSON, receivers)
+        return True
+    else:
+        return False
+
+
+async def deliver_messages_ad(context, queue, ledger=None, sender=None, media=None, limit=100, reposts=None):
+    '''Toma de la cola de envíos las entradas listas y las envía.
+    Las entradas enviadas se confirman y las fallidas se reintentan más tarde.
+    Si se indica el índice de anuncios repetidos (reposts), las repeticiones se descartan
+    aquí. Se usa cuando varios procesos agregan anuncios a la cola y ninguno los ve todos.
+    Devuelve la cantidad de mensajes enviados.
+    '''
+    count = 0
+    for adJSON, receivers in queue.claim(limit):
+        adID = adJSON['ad']['id']
+        if reposts is not None:
+            ad = adJSON['ad']
+            phones = get_phone_numbers(ad['phone']) if ad['phone'] is not None else []
+            repostOf = reposts.check_and_add(ad, phones)
+            if repostOf is not None:
+                queue.ack(adID, receivers)
+                reposts.savedSends += len(receivers)
+                await to_cmd('INFO', 'ad {} is a repost of {}, {} sends saved.'.format(adID, repostOf, len(receivers)))
+                continue
+        if ledger is not None:
+            # Pudo haberse enviado antes de una caída, sin llegar a confirmarse.
+            delivered = [receiverID for receiverID in receivers if ledger.contains(adID, receiverID)]
+            if len(delivered) > 0:
+                queue.ack(adID, delivered)
+            receivers = [receiverID for receiverID in receivers if receiverID not in delivered]
+        if len(receivers) == 0:
+            continue
+        try:
+            results = await send_ad(context, receivers, adJSON, ledger, sender, media)
+        except Exception as e:
+            # Un anuncio que no se puede enviar no debe bloquear la cola.
+            await to_cmd('ERROR', 'deliver_messages_ad(): ad {} could not be sent. {}'.format(adID, str(e)))
+            for receiverID in receivers:
+                queue.fail(adID, receiverID, e, False)
+            continue
+        sent = [receiverID for receiverID, (success, result) in results.items() if success]
+        queue.ack(adID, sent)
+        count += len(sent)
+        for receiverID, (success, result) in results.items():
+            if not success:
+                queue.fail(adID, receiverID, result, retry_delay(result, 0) is not None)
+    return count
+
+
 
 async def show_keyboard(context, chat_id, message, keyboard):
     '''Envia mensajes al chat e insiste en reenviar si se produce error. Devuelve True si logra enier el mensaje.'''
@@ -246,8 +281,8 @@ numbers = [
     '54488048 ò 76454324',
     '+5377975961 y 53337448',
     ]
-async def test_get_phone_numbers():
+def test_get_phone_numbers():
     for num in numbers:
-        print('text:', num, 'numbers', await get_phone_numbers(num))
+        print('text:', num, 'numbers', get_phone_numbers(num))
         
-#asyncio.run(test_get_phone_numbers())
+#test_get_phone_numbers()
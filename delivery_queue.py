@@ -0,0 +1,140 @@
+'''Cola persistente de envíos entre el scraper y el envío a Telegram.
+El scraper agrega cada anuncio con una entrada por receptor y un consumidor aparte
+las envía. Las entradas se guardan en SQLite (modo WAL), por lo que sobreviven a
+reinicios y caídas. Una entrada tomada por el consumidor queda reservada por un tiempo;
+si el bot se cae antes de confirmarla, la reserva vence y la entrada se vuelve a enviar
+(al menos una vez). Los envíos fallidos se reintentan con espera creciente y, después
+de varios intentos, quedan marcados como muertos. La cantidad de entradas pendientes
+sirve para frenar al scraper cuando Telegram no da abasto.
+'''
+__version__ = '1.0'
+__author__ = 'Santiago Orellana Perez'
+__created__ = '18/octubre/2026'
+__tested__ = 'Python 3.10'
+
+import json
+import time
+import sqlite3
+
+FILE_DELIVERY_QUEUE = './delivery_queue.db'
+
+# Segundos que una entrada queda reservada por el consumidor antes de poder tomarse de nuevo.
+DELIVERY_LEASE_SECONDS = 120
+
+# Reintentos de los envíos fallidos.
+DELIVERY_MAX_ATTEMPTS = 8
+DELIVERY_RETRY_SECONDS = 30
+DELIVERY_MAX_RETRY_SECONDS = 3600
+
+# Cantidad de entradas pendientes a partir de la cual el scraper deja de agregar anuncios.
+DELIVERY_QUEUE_MAX_DEPTH = 5000
+
+STATUS_PENDING = 0
+STATUS_DEAD = 2
+
+
+class DeliveryQueue():
+    '''Cola de envíos por receptor guardada en SQLite.'''
+    def __init__(self, fileName=FILE_DELIVERY_QUEUE, maxAttempts=DELIVERY_MAX_ATTEMPTS):
+        self.fileName = fileName
+        self.maxAttempts = maxAttempts
+        self.connection = sqlite3.connect(fileName, isolation_level=None)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.execute('''CREATE TABLE IF NOT EXISTS ads (
+            ad_id INTEGER PRIMARY KEY,
+            payload TEXT NOT NULL,
+            created REAL NOT NULL)''')
+        self.connection.execute('''CREATE TABLE IF NOT EXISTS deliveries (
+            ad_id INTEGER NOT NULL,
+            receiver TEXT NOT NULL,
+            status INTEGER NOT NULL DEFAULT 0,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt REAL NOT NULL,
+            leased_until REAL NOT NULL DEFAULT 0,
+            last_error TEXT,
+            PRIMARY KEY (ad_id, receiver))''')
+        self.connection.execute('CREATE INDEX IF NOT EXISTS deliveries_ready ON deliveries (status, next_attempt)')
+
+
+    def enqueue(self, adJSON, receivers):
+        '''Agrega el anuncio con una entrada por receptor. Las entradas repetidas se ignoran.
+        Devuelve la cantidad de entradas nuevas.
+        '''
+        now = time.time()
+        adID = int(adJSON['ad']['id'])
+        with self.connection:
+            self.connection.execute('BEGIN IMMEDIATE')
+            self.connection.execute('INSERT OR IGNORE INTO ads (ad_id, payload, created) VALUES (?, ?, ?)',
+                                    (adID, json.dumps(adJSON), now))
+            cursor = self.connection.executemany(
+                'INSERT OR IGNORE INTO deliveries (ad_id, receiver, next_attempt) VALUES (?, ?, ?)',
+                [(adID, str(receiver), now) for receiver in receivers])
+            return cursor.rowcount
+
+
+    def claim(self, limit=100, leaseSeconds=DELIVERY_LEASE_SECONDS):
+        '''Reserva hasta 'limit' entradas listas para enviar.
+        Devuelve una lista de (adJSON, [receptores]) agrupada por anuncio.
+        '''
+        now = time.time()
+        with self.connection:
+            self.connection.execute('BEGIN IMMEDIATE')
+            rows = self.connection.execute(
+                '''SELECT ad_id, receiver FROM deliveries
+                   WHERE status = ? AND next_attempt <= ? AND leased_until <= ?
+                   ORDER BY next_attempt, ad_id LIMIT ?''', (STATUS_PENDING, now, now, limit)).fetchall()
+            self.connection.executemany('UPDATE deliveries SET leased_until = ? WHERE ad_id = ? AND receiver = ?',
+                                        [(now + leaseSeconds, adID, receiver) for adID, receiver in rows])
+        groups = {}
+        for adID, receiver in rows:
+            groups.setdefault(adID, []).append(receiver)
+        result = []
+        for adID, receivers in groups.items():
+            row = self.connection.execute('SELECT payload FROM ads WHERE ad_id = ?', (adID,)).fetchone()
+            if row is not None:
+                result.append((json.loads(row[0]), receivers))
+        return result
+
+
+    def ack(self, adID, receivers):
+        '''Confirma que el anuncio fue enviado a los receptores y borra sus entradas.'''
+        with self.connection:
+            self.connection.execute('BEGIN IMMEDIATE')
+            self.connection.executemany('DELETE FROM deliveries WHERE ad_id = ? AND receiver = ?',
+                                        [(int(adID), str(receiver)) for receiver in receivers])
+            self.connection.execute('''DELETE FROM ads WHERE ad_id = ? AND NOT EXISTS
+                                       (SELECT 1 FROM deliveries WHERE deliveries.ad_id = ads.ad_id)''', (int(adID),))
+
+
+    def fail(self, adID, receiver, error, retryable=True):
+        '''Registra un envío fallido. Se reintenta más tarde o queda muerto si no tiene arreglo.'''
+        now = time.time()
+        with self.connection:
+            self.connection.execute('BEGIN IMMEDIATE')
+            row = self.connection.execute('SELECT attempts FROM deliveries WHERE ad_id = ? AND receiver = ?',
+                                          (int(adID), str(receiver))).fetchone()
+            if row is None:
+                return
+            attempts = row[0] + 1
+            status = STATUS_PENDING
+            if not retryable or attempts >= self.maxAttempts:
+                status = STATUS_DEAD
+            delay = min(DELIVERY_MAX_RETRY_SECONDS, DELIVERY_RETRY_SECONDS * 2 ** (attempts - 1))
+            self.connection.execute(
+                '''UPDATE deliveries SET status = ?, attempts = ?, next_attempt = ?, leased_until = 0, last_error = ?
+                   WHERE ad_id = ? AND receiver = ?''', (status, attempts, now + delay, str(error)[:500], int(adID), str(receiver)))
+
+
+    def depth(self):
+        '''Devuelve la cantidad de entradas pendientes de enviar.'''
+        return self.connection.execute('SELECT COUNT(*) FROM deliveries WHERE status = ?', (STATUS_PENDING,)).fetchone()[0]
+
+
+    def dead(self):
+        '''Devuelve la cantidad de entradas que no se pudieron enviar.'''
+        return self.connection.execute('SELECT COUNT(*) FROM deliveries WHERE status = ?', (STATUS_DEAD,)).fetchone()[0]
+
+
+    def close(self):
+        self.connection.close()
@@ -0,0 +1,137 @@
+'''Envío concurrente de anuncios a muchos receptores respetando los límites de Telegram.
+Telegram permite unos 30 mensajes por segundo en total, 1 mensaje por segundo a cada
+chat privado y 20 mensajes por minuto a cada grupo o canal. Cada límite se controla con
+una cubeta de fichas. Si Telegram pide esperar (RetryAfter) se detienen todos los envíos
+exactamente lo indicado, los errores de red se reintentan con espera exponencial aleatoria y los errores
+que no se arreglan reintentando (chat prohibido, pedido incorrecto) no se reintentan.
+'''
+__version__ = '1.0'
+__author__ = 'Santiago Orellana Perez'
+__created__ = '18/octubre/2026'
+__tested__ = 'Python 3.10'
+
+import asyncio
+import datetime
+import random
+from telegram.error import RetryAfter, BadRequest, Forbidden, ChatMigrated, InvalidToken
+from rate_limit import TokenBucket
+
+# Límites de envío de Telegram en mensajes por segundo.
+TELEGRAM_GLOBAL_RATE = 30
+TELEGRAM_PRIVATE_CHAT_RATE = 1
+TELEGRAM_GROUP_CHAT_RATE = 20 / 60
+
+# Cantidad de conexiones HTTP hacia la API de Telegram y de envíos simultáneos.
+TELEGRAM_POOL_SIZE = 64
+FANOUT_CONCURRENCY = 32
+
+# Reintentos ante errores.
+FANOUT_MAX_ATTEMPTS = 5
+FANOUT_BASE_BACKOFF = 0.5
+FANOUT_MAX_BACKOFF = 30
+
+
+def is_private_chat(chatID):
+    '''Los usuarios tienen ID numérico positivo. Los grupos y canales tienen ID negativo o @nombre.'''
+    try:
+        return int(chatID) > 0
+    except (TypeError, ValueError):
+        return False
+
+
+def retry_delay(error, attempt):
+    '''Devuelve los segundos que se deben esperar antes de reintentar un envío que falló
+    con el error indicado, o None si no tiene sentido reintentar.
+    '''
+    if isinstance(error, RetryAfter):
+        retryAfter = error.retry_after
+        if isinstance(retryAfter, datetime.timedelta):
+            return retryAfter.total_seconds()
+        return float(retryAfter)
+    if isinstance(error, (BadRequest, Forbidden, InvalidToken, ChatMigrated)):
+        return None
+    # Espera exponencial con variación aleatoria completa para no reintentar todos a la vez.
+    return random.uniform(0, min(FANOUT_MAX_BACKOFF, FANOUT_BASE_BACKOFF * 2 ** attempt))
+
+
+class FanoutSender():
+    '''Envía a muchos chats de forma concurrente sin superar los límites de Telegram.'''
+    def __init__(self, globalRate=TELEGRAM_GLOBAL_RATE, privateRate=TELEGRAM_PRIVATE_CHAT_RATE,
+                 groupRate=TELEGRAM_GROUP_CHAT_RATE, concurrency=FANOUT_CONCURRENCY, maxAttempts=FANOUT_MAX_ATTEMPTS):
+        self.globalBucket = TokenBucket(globalRate, globalRate)
+        self.privateRate = privateRate
+        self.groupRate = groupRate
+        self.concurrency = concurrency
+        self.maxAttempts = maxAttempts
+        self._chatBuckets = {}
+        self.sent = 0
+        self.failed = 0
+        self.retries = 0
+        self.migrations = {}
+
+
+    def chat_bucket(self, chatID):
+        '''Devuelve la cubeta de fichas del chat, creándola si no existe.'''
+        bucket = self._chatBuckets.get(chatID)
+        if bucket is None:
+            rate = self.privateRate if is_private_chat(chatID) else self.groupRate
+            bucket = TokenBucket(rate)
+            self._chatBuckets[chatID] = bucket
+        return bucket
+
+
+    async def send_one(self, chatID, sendFunction, semaphore=None):
+        '''Llama a sendFunction(chatID) respetando los límites y reintentando según el error.
+        Devuelve una tupla (True, resultado) si logra enviar o (False, error) si no.
+        Si el chat pasó a tener otro ID, lo anota en migrations (ID anterior -> ID nuevo)
+        para que se actualice el receptor. Ver pop_migrations().
+        '''
+        error = None
+        firstChatID = chatID
+        for attempt in range(self.maxAttempts):
+            await self.chat_bucket(chatID).acquire()
+            try:
+                if semaphore is None:
+                    await self.globalBucket.acquire()
+                    result = await sendFunction(chatID)
+                else:
+                    async with semaphore:
+                        await self.globalBucket.acquire()
+                        result = await sendFunction(chatID)
+            except ChatMigrated as e:
+                # El grupo pasó a ser un supergrupo, se envía al nuevo ID.
+                chatID = e.new_chat_id
+                self.migrations[firstChatID] = chatID
+                error = e
+                self.retries += 1
+                continue
+            except Exception as e:
+                error = e
+                delay = retry_delay(e, attempt)
+                if delay is None or attempt == self.maxAttempts - 1:
+                    break
+                self.retries += 1
+                if isinstance(e, RetryAfter):
+                    # El límite es de todo el bot, así que se detienen todos los envíos.
+                    self.globalBucket.pause(delay)
+                await asyncio.sleep(delay)
+            else:
+                self.sent += 1
+                return True, result
+        self.failed += 1
+        return False, error
+
+
+    async def send_all(self, chatsID, sendFunction):
+        '''Envía a todos los chats de forma concurrente. Devuelve un diccionario chatID -> (éxito, resultado o error).'''
+        chatsID = list(chatsID)
+        semaphore = asyncio.Semaphore(self.concurrency)
+        results = await asyncio.gather(*[self.send_one(chatID, sendFunction, semaphore) for chatID in chatsID])
+        return dict(zip(chatsID, results))
+
+
+    def pop_migrations(self):
+        '''Devuelve y olvida los chats que cambiaron de ID: un diccionario ID anterior -> ID nuevo.'''
+        migrations = self.migrations
+        self.migrations = {}
+        return migrations
@@ -0,0 +1,352 @@
+'''Filtros de anuncios por receptor.
+Además de su categoría, cada receptor puede tener una regla con palabras que el anuncio
+debe contener, palabras excluidas, un rango de precios en una moneda, una provincia y un
+municipio. Las reglas de todos los receptores se compilan en estructuras compartidas:
+un autómata de Aho-Corasick sobre palabras para las frases del título y la descripción,
+un árbol de intervalos por moneda para los precios y diccionarios para los lugares.
+Cada regla se indexa por su condición más selectiva. Las estructuras devuelven los
+receptores cuya condición indexada cumple el anuncio (con varias palabras, se cuenta
+cuántas aparecen) y solo en ellos se comprueba el resto de la regla y las palabras
+excluidas. Así, el costo de revisar un anuncio depende de las coincidencias y no de la
+cantidad de receptores y reglas.
+'''
+__version__ = '1.0'
+__author__ = 'Santiago Orellana Perez'
+__created__ = '18/octubre/2026'
+__tested__ = 'Python 3.10'
+
+import math
+from collections import deque
+from similarity import normalize_text
+from ad_index import parse_price
+
+
+def parse_filter(text):
+    '''Convierte el texto de /filter en una regla.
+    Las palabras que el anuncio debe contener se escriben tal cual y las excluidas con - delante.
+    Para una frase, las palabras se unen con _, ej: iphone_13
+    Condiciones: precio:MIN-MAX (o precio:MIN- y precio:-MAX), moneda:USD, provincia:NOMBRE y
+    municipio:NOMBRE, con los espacios de los nombres escritos como _.
+    '''
+    rule = {'words':[], 'exclude':[], 'minPrice':None, 'maxPrice':None,
+            'currency':None, 'province':None, 'municipality':None}
+    for token in text.split():
+        key, separator, value = token.partition(':')
+        key = key.lower()
+        if separator and key in ['precio', 'price']:
+            try:
+                rule['minPrice'], rule['maxPrice'] = parse_price(value)
+            except ValueError:
+                pass
+        elif separator and key in ['moneda', 'currency']:
+            rule['currency'] = value.upper()
+        elif separator and key in ['provincia', 'province']:
+            rule['province'] = value.replace('_', ' ')
+        elif separator and key in ['municipio', 'municipality']:
+            rule['municipality'] = value.replace('_', ' ')
+        elif token.startswith('-') and len(token) > 1:
+            rule['exclude'].append(token[1:].replace('_', ' '))
+        else:
+            rule['words'].append(token.replace('_', ' '))
+    return rule
+
+
+def is_empty_filter(rule):
+    '''Dice si la regla no tiene ninguna condición.'''
+    return (len(rule.get('words', [])) == 0 and len(rule.get('exclude', [])) == 0 and
+            all([rule.get(key) is None for key in ['minPrice', 'maxPrice', 'currency', 'province', 'municipality']]))
+
+
+def describe_filter(rule):
+    '''Devuelve la regla escrita como los parámetros de /filter.'''
+    parts = [word.replace(' ', '_') for word in rule.get('words', [])]
+    parts = parts + ['-' + word.replace(' ', '_') for word in rule.get('exclude', [])]
+    if rule.get('minPrice') is not None or rule.get('maxPrice') is not None:
+        low = '' if rule.get('minPrice') is None else '{:g}'.format(rule['minPrice'])
+        high = '' if rule.get('maxPrice') is None else '{:g}'.format(rule['maxPrice'])
+        parts.append('precio:{}-{}'.format(low, high))
+    if rule.get('currency') is not None:
+        parts.append('moneda:{}'.format(rule['currency']))
+    if rule.get('province') is not None:
+        parts.append('provincia:{}'.format(rule['province'].replace(' ', '_')))
+    if rule.get('municipality') is not None:
+        parts.append('municipio:{}'.format(rule['municipality'].replace(' ', '_')))
+    return ' '.join(parts)
+
+
+def normalize_place(name):
+    return ' '.join(normalize_text(name or ''))
+
+
+
+class AhoCorasick():
+    '''Autómata de Aho-Corasick sobre palabras. Encuentra en una sola pasada por las palabras
+    del texto todas las frases de la lista que aparecen en él.
+    '''
+    def __init__(self, phrases):
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [[]]
+        for index, phrase in enumerate(phrases):
+            state = 0
+            for word in phrase:
+                nextState = self._goto[state].get(word)
+                if nextState is None:
+                    nextState = len(self._goto)
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append([])
+                    self._goto[state][word] = nextState
+                state = nextState
+            self._out[state].append(index)
+        # Los enlaces de fallo se calculan por niveles, desde la raíz.
+        pending = deque(self._goto[0].values())
+        while len(pending) > 0:
+            state = pending.popleft()
+            for word, nextState in self._goto[state].items():
+                pending.append(nextState)
+                fail = self._fail[state]
+                while fail and word not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[nextState] = self._goto[fail].get(word, 0)
+                self._out[nextState] = self._out[nextState] + self._out[self._fail[nextState]]
+
+
+    def find(self, words):
+        '''Devuelve el conjunto de índices de las frases que aparecen en la lista de palabras.'''
+        found = set()
+        goto = self._goto
+        fail = self._fail
+        state = 0
+        for word in words:
+            while state and word not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(word, 0)
+            if self._out[state]:
+                found.update(self._out[state])
+        return found
+
+
+
+class IntervalIndex():
+    '''Árbol de intervalos centrado. Devuelve los elementos cuyos intervalos cerrados
+    [mínimo, máximo] contienen un valor en O(log n + k).
+    '''
+    def __init__(self, intervals):
+        # Un intervalo con el mínimo mayor que el máximo no contiene ningún valor.
+        self._root = self.build([interval for interval in intervals if interval[0] <= interval[1]])
+
+
+    def build(self, intervals):
+        if len(intervals) == 0:
+            return None
+        points = sorted([value for low, high, item in intervals for value in (low, high) if not math.isinf(value)])
+        center = points[len(points) // 2] if len(points) > 0 else 0.0
+        here = [interval for interval in intervals if interval[0] <= center <= interval[1]]
+        left = [interval for interval in intervals if interval[1] < center]
+        right = [interval for interval in intervals if interval[0] > center]
+        byLow = sorted(here, key=lambda interval: interval[0])
+        byHigh = sorted(here, key=lambda interval: -interval[1])
+        return (center, byLow, byHigh, self.build(left), self.build(right))
+
+
+    def query(self, value):
+        '''Devuelve la lista de elementos cuyos intervalos contienen el valor.'''
+        items = []
+        node = self._root
+        while node is not None:
+            center, byLow, byHigh, left, right = node
+            if value < center:
+                for low, high, item in byLow:
+                    if low > value:
+                        break
+                    items.append(item)
+                node = left
+            elif value > center:
+                for low, high, item in byHigh:
+                    if high < value:
+                        break
+                    items.append(item)
+                node = right
+            else:
+                items.extend([item for low, high, item in byLow])
+                break
+        return items
+
+
+
+class FilterIndex():
+    '''Reglas de todos los receptores compiladas en estructuras compartidas.
+    Las reglas se compilan la primera vez que se revisa un anuncio después de un cambio.
+    '''
+    def __init__(self, rules=None):
+        self._rules = {}
+        self._compiled = False
+        self.version = 0
+        if rules is not None:
+            self.build(rules)
+
+
+    def build(self, rules):
+        '''Reemplaza todas las reglas. rules es un diccionario receptor -> regla.'''
+        self._rules = dict([(receiverID, rule) for receiverID, rule in rules.items() if not is_empty_filter(rule)])
+        self._compiled = False
+        self.version += 1
+
+
+    def set_rule(self, receiverID, rule):
+        if is_empty_filter(rule):
+            self.remove(receiverID)
+            return
+        self._rules[receiverID] = rule
+        self._compiled = False
+        self.version += 1
+
+
+    def remove(self, receiverID):
+        if self._rules.pop(receiverID, None) is not None:
+            self._compiled = False
+            self.version += 1
+
+
+    def has_filter(self, receiverID):
+        return receiverID in self._rules
+
+
+    def __len__(self):
+        return len(self._rules)
+
+
+    def compile(self):
+        '''Compila las reglas. Cada regla se indexa solo por su condición más selectiva
+        (palabras, municipio, provincia o precio, en ese orden) y el resto se comprueba
+        únicamente en los receptores que la cumplen.
+        '''
+        phrases = {}
+        include = []
+        exclude = []
+        intervals = {}
+        self._required = {}
+        self._checks = {}
+        self._provinces = {}
+        self._municipalities = {}
+        self._onlyExclude = []
+
+        def phrase_index(text):
+            phrase = tuple(normalize_text(text))
+            if len(phrase) == 0:
+                return None
+            if phrase not in phrases:
+                phrases[phrase] = len(phrases)
+                include.append([])
+                exclude.append([])
+            return phrases[phrase]
+
+        for receiverID, rule in self._rules.items():
+            price = None
+            if rule.get('minPrice') is not None or rule.get('maxPrice') is not None or rule.get('currency') is not None:
+                low = -math.inf if rule.get('minPrice') is None else float(rule['minPrice'])
+                high = math.inf if rule.get('maxPrice') is None else float(rule['maxPrice'])
+                price = (rule.get('currency'), low, high)
+            province = normalize_place(rule['province']) if rule.get('province') else None
+            municipality = normalize_place(rule['municipality']) if rule.get('municipality') else None
+            self._checks[receiverID] = (price, province, municipality)
+            for index in set([phrase_index(word) for word in rule.get('exclude', [])]):
+                if index is not None:
+                    exclude[index].append(receiverID)
+            required = set([phrase_index(word) for word in rule.get('words', [])]) - set([None])
+            if len(required) > 0:
+                # Con varias palabras se cuenta cuántas aparecen; el receptor es candidato si aparecen todas.
+                for index in required:
+                    include[index].append(receiverID)
+                self._required[receiverID] = len(required)
+            elif municipality is not None:
+                self._municipalities.setdefault(municipality, []).append(receiverID)
+            elif province is not None:
+                self._provinces.setdefault(province, []).append(receiverID)
+            elif price is not None:
+                # Las reglas sin moneda se guardan con la clave None y aceptan cualquier moneda.
+                intervals.setdefault(price[0], []).append((price[1], price[2], receiverID))
+            else:
+                self._onlyExclude.append(receiverID)
+        self._automaton = AhoCorasick(list(phrases))
+        self._include = include
+        self._exclude = exclude
+        self._prices = dict([(currency, IntervalIndex(items)) for currency, items in intervals.items()])
+        self._compiled = True
+
+
+    def match(self, ad):
+        '''Devuelve el conjunto de receptores con regla que aceptan el anuncio.'''
+        if not self._compiled:
+            self.compile()
+        counts = {}
+        excluded = set()
+        words = normalize_text('{} {}'.format(ad.get('title') or '', ad.get('description') or ''))
+        for index in self._automaton.find(words):
+            for receiverID in self._include[index]:
+                counts[receiverID] = counts.get(receiverID, 0) + 1
+            excluded.update(self._exclude[index])
+        candidates = [receiverID for receiverID, count in counts.items() if count == self._required[receiverID]]
+        try:
+            price = float(ad.get('price')) if ad.get('price') is not None else None
+        except (TypeError, ValueError):
+            price = None
+        currency = str(ad.get('currency') or '').upper()
+        if price is not None:
+            for key in set([currency, None]):
+                if key in self._prices:
+                    candidates.extend(self._prices[key].query(price))
+        province = normalize_place(ad.get('provinceName'))
+        municipality = normalize_place(ad.get('municipalityName'))
+        candidates.extend(self._provinces.get(province, ()))
+        candidates.extend(self._municipalities.get(municipality, ()))
+        candidates.extend(self._onlyExclude)
+        matched = set()
+        for receiverID in candidates:
+            if receiverID in excluded:
+                continue
+            rulePrice, ruleProvince, ruleMunicipality = self._checks[receiverID]
+            if rulePrice is not None:
+                ruleCurrency, low, high = rulePrice
+                if price is None or not low <= price <= high or (ruleCurrency is not None and ruleCurrency != currency):
+                    continue
+            if ruleProvince is not None and ruleProvince != province:
+                continue
+            if ruleMunicipality is not None and ruleMunicipality != municipality:
+                continue
+            matched.add(receiverID)
+        return matched
+
+
+
+#TEST CODE
+def test_filter_index(receivers=10000, ads=1000):
+    '''Compara el tiempo de revisar anuncios con el índice y revisando las reglas una por una.'''
+    import time
+    import random
+    rand = random.Random(0)
+    words = ['iphone', 'samsung', 'moto', 'casa', 'laptop', 'split', 'bicicleta', 'televisor', 'nevera', 'xiaomi']
+    provinces = ['La Habana', 'Matanzas', 'Holguín', 'Santiago de Cuba']
+    rules = {}
+    for i in range(receivers):
+        rules['@canal{}'.format(i)] = parse_filter('{} -funda precio:-{} moneda:USD provincia:{}'.format(
+            rand.choice(words), rand.choice([100, 200, 300, 500, 1000]), rand.choice(provinces).replace(' ', '_')))
+    index = FilterIndex(rules)
+    adList = [{'title':'{} {}'.format(rand.choice(words), rand.choice(words)), 'description':'en buen estado',
+               'price':rand.randint(50, 1500), 'currency':'USD', 'provinceName':rand.choice(provinces)} for i in range(ads)]
+    start = time.perf_counter()
+    index.compile()
+    print('compile: {:.1f} ms'.format((time.perf_counter() - start) * 1000))
+    start = time.perf_counter()
+    matches = sum([len(index.match(ad)) for ad in adList])
+    print('index: {:.3f} ms per ad, {:.1f} matches per ad'.format((time.perf_counter() - start) * 1000 / ads, matches / ads))
+    start = time.perf_counter()
+    for ad in adList[:100]:
+        adWords = set(normalize_text(ad['title'] + ' ' + ad['description']))
+        [receiverID for receiverID, rule in rules.items()
+         if all([word in adWords for word in rule['words']]) and not any([word in adWords for word in rule['exclude']])
+         and ad['price'] <= rule['maxPrice'] and normalize_place(ad['provinceName']) == normalize_place(rule['province'])]
+    print('one by one: {:.3f} ms per ad'.format((time.perf_counter() - start) * 1000 / 100))
+
+#test_filter_index()
@@ -0,0 +1,229 @@
+'''Formato de los anuncios que se envían a los receptores.
+Todo el formato es sincrónico porque solo usa CPU. Los emojis del título se obtienen
+con una sola expresión regular compilada a partir de SETVMAS_WORDS_EMOJIS, los teléfonos
+se extraen y normalizan en tiempo lineal y el mensaje se arma con una lista de partes
+que se une una sola vez, en lugar de concatenar cadenas una a una.
+'''
+__version__ = '1.0'
+__author__ = 'Santiago Orellana Perez'
+__created__ = '18/octubre/2026'
+__tested__ = 'Python 3.10'
+
+import re
+import time
+from const import *
+
+# Telegram solo admite mensajes de 4096 caracteres.
+TELEGRAM_MAX_MESSAGE = 4096
+
+
+def compile_emoji_matcher(wordsEmojis):
+    '''Compila una expresión que encuentra, entre las palabras separadas por espacios,
+    las que están en el diccionario de emojis sin importar mayúsculas ni otros blancos.
+    '''
+    words = sorted(wordsEmojis, key=len, reverse=True)
+    alternatives = '|'.join([re.escape(word) for word in words])
+    return re.compile(r'(?<![^ ])[^\S ]*(' + alternatives + r')[^\S ]*(?![^ ])', re.IGNORECASE)
+
+
+EMOJI_MATCHER = compile_emoji_matcher(SETVMAS_WORDS_EMOJIS)
+
+
+def emoji_of_word(word):
+    '''Devuelve el emoji correspondiente a la palabra'''
+    return SETVMAS_WORDS_EMOJIS.get(word.lower().strip(), '')
+
+
+def text_emojis(text, returnText=False):
+    '''Devuelve el texto embellecido con emojis.'''
+    if returnText:
+        return ''.join([emoji_of_word(word) + ' ' + word for word in str(text).split(' ')])
+    emojis = []
+    for match in EMOJI_MATCHER.finditer(str(text)):
+        # La expresión no distingue mayúsculas, pero la palabra debe coincidir al pasarla a minúsculas.
+        emoji = SETVMAS_WORDS_EMOJIS.get(match.group(1).lower())
+        if emoji is not None:
+            emojis.append(emoji)
+    return ''.join(emojis)
+
+
+def normalize_phone(text):
+    '''Se le pasa el número de teléfono y trata de corregirlo y completarlo.
+    Patron para telefonos de Cuba, Fijos: +537xxxxxxx  Moviles: +535xxxxxxx
+    '''
+    phoneText = str(text).replace(' ', '')
+    if len(phoneText) == 7: 
+        return '+535' + phoneText   # Asume que es un celular porque los cubanos al fijo siempre le ponene el 7 delante.
+    if len(phoneText) == 8:
+        return '+53' + phoneText
+    elif len(phoneText) == 9 and phoneText[0] == '3':   # Tiene que ser 3, porque en caso de ser cero, es el codigo antiguo.
+        return '+5' + phoneText
+    elif len(phoneText) == 10 and phoneText[0] == '5' and phoneText[1] == '3':
+        return '+' + phoneText
+    elif len(phoneText) > 10 and phoneText[0] != '+':
+        return '+' + phoneText
+    else:
+        return phoneText
+
+
+def filter_numbers(phoneText):
+    '''Deja solo los dígitos del texto e inserta el caracter / para separar los numeros.'''
+    filtered = []
+    count = 0
+    for char in phoneText:
+        if char.isdigit():
+            filtered.append(char)
+            count += 1
+        elif count > 7:
+            filtered.append('/')
+            count = 0
+    return ''.join(filtered)
+
+
+def get_phone_numbers(text):
+    '''Se le pasa una cadena de texto y trata de encontrar los números de teléfono que contiene.'''
+    phoneText = filter_numbers(str(text))
+    if len(phoneText) > 12:
+        phonesList = phoneText.split('/')
+        if len(phonesList) > 1:                                 # Si se divide por el splitter...
+            # Verifica que cada parte tenga espacio para contener un número de teléfono.
+            result = [normalize_phone(phone) for phone in phonesList if len(phone) > 6]
+            if len(result) > 1:
+                return result
+    return [normalize_phone(phoneText)]
+
+
+def render_ad(adJSON):
+    '''Devuelve el texto HTML del anuncio con emojis y formato, listo para enviar.'''
+    ad = adJSON['ad']
+    title = ad['title']
+    head = '{} <b>{}</b>\n'.format(text_emojis(title), title)
+    if ad['price'] is not None:
+        head = '{}\n{} {} {}\n'.format(head, EMOJI_PRICE, ad['price'], ad['currency'])
+    parts = [head]
+    description = ad['description']
+    if description != title and len(description) > 3:
+        extra = len(description) + len(head) + 50 - TELEGRAM_MAX_MESSAGE
+        if extra > 0:
+            description = description[0:-1*extra]  # Limita los textos que son muy largos.
+        parts.append('\n{}\n'.format(description))
+    if ad['name'] is not None:
+        parts.append('\n{} <b>{}</b>'.format(EMOJI_NAME, ad['name']))
+    if ad['phone'] is not None:
+        phones = get_phone_numbers(ad['phone'])
+        for phoneNumber in phones:
+            parts.append('\n{} {}'.format(EMOJI_PHONE, phoneNumber))
+        if len(phones) > 0 and int(ad['imagesCount']) > 0:
+            for phoneNumber in phones:
+                if phoneNumber.startswith('+535'):
+                    parts.append('\n{} <a href="wa.me/{}">WhatsApp</a>'.format(EMOJI_WHATSAPP, phoneNumber[1:]))
+        parts.append('\n\n{} {}'.format(EMOJI_LOCALIDAD, ad['provinceName']))
+        if ad.get('municipalityName'):
+            parts.append('-' + ad['municipalityName'])
+        if 'tags' in adJSON and len(adJSON['tags']) > 0:
+            parts.append('\n{} {}'.format(EMOJI_TAG, ' '.join(adJSON['tags'])))
+    return ''.join(parts)
+
+
+
+
+#TEST CODE
+def legacy_render_ad(adJSON):
+    '''Formato de los anuncios tal como lo hacía show_messages_ad() antes de este módulo.
+    Solo se utiliza para comprobar que render_ad() produce exactamente el mismo texto.
+    '''
+    def processOne(text):
+        phoneText = str(text).replace(' ', '')
+        if len(phoneText) == 7: 
+            return '+535' + phoneText
+        if len(phoneText) == 8:
+            return '+53' + phoneText
+        elif len(phoneText) == 9 and phoneText[0] == '3':
+            return '+5' + phoneText
+        elif len(phoneText) == 10 and phoneText[0] == '5' and phoneText[1] == '3':
+            return '+' + phoneText
+        elif len(phoneText) > 10 and phoneText[0] != '+':
+            return '+' + phoneText
+        else:
+            return phoneText
+
+    def sequential_filter_numbers(phoneText):
+        filtered = ''
+        count = 0
+        for i in range(len(str(phoneText))):
+            if str(phoneText)[i].isdigit():
+                filtered = filtered + phoneText[i]
+                count += 1
+            elif count > 7:
+                filtered = filtered + '/'
+                count = 0
+        return filtered
+
+    def legacy_phone_numbers(text):
+        phoneText = sequential_filter_numbers(str(text))
+        if len(phoneText) > 12:
+            phonesList = phoneText.rsplit('/')
+            if len(phonesList) > 1:
+                result = []
+                for phone in phonesList:            
+                    if len(phone) > 6:
+                        result.append(processOne(phone))
+                if len(result) > 1:
+                    return result
+        return [processOne(phoneText)]
+
+    def legacy_text_emojis(text):
+        result = ''
+        for word in str(text).rsplit(' '):
+            key = word.lower().rstrip().lstrip()
+            if key in SETVMAS_WORDS_EMOJIS:
+                result = result + SETVMAS_WORDS_EMOJIS[key]
+        return result
+
+    ad = adJSON['ad']
+    msg = '{} <b>{}</b>\n'.format(legacy_text_emojis(ad['title']), ad['title'])
+    if ad['price'] is not None:
+        msg = msg + '\n{} {} {}\n'.format(EMOJI_PRICE, ad['price'], ad['currency'])
+    if ad['description'] != ad['title'] and len(ad['description']) > 3:
+        extra = len(ad['description']) + len(msg) + 50 - 4096
+        if extra >0:
+            description = ad['description'][0:-1*extra]
+        else:
+            description = ad['description']
+        msg = msg + '\n{}\n'.format(description)
+    if ad['name'] is not None:
+        msg = msg + '\n{} <b>{}</b>'.format(EMOJI_NAME, ad['name'])
+    if ad['phone'] is not None:
+        phones = legacy_phone_numbers(ad['phone'])
+        if len(phones) > 0:
+            for phoneNumber in phones:
+                msg = msg + '\n{} {}'.format(EMOJI_PHONE, phoneNumber)
+        if len(phones) > 0 and int(ad['imagesCount']) > 0:
+            for phoneNumber in phones:
+                if phoneNumber.startswith('+535'):
+                    msg = msg + '\n{} <a href="wa.me/{}">WhatsApp</a>'.format(EMOJI_WHATSAPP, phoneNumber[1:])
+        msg = msg + '\n\n{} {}'.format(EMOJI_LOCALIDAD, ad['provinceName'])
+        if 'municipalityName' in ad:
+            msg = msg + '-' + ad['municipalityName']
+        if 'tags' in adJSON:
+            if len(adJSON['tags']) > 0:
+                msg = msg + '\n{} {}'.format(EMOJI_TAG, ' '.join(adJSON['tags']))
+    return msg
+
+
+def test_render_ad(adsJSON, repeat=100):
+    '''Comprueba que render_ad() produce el mismo texto que legacy_render_ad() para cada
+    anuncio (resultados de get_page() con 'ad') y muestra cuántos anuncios formatea por segundo.
+    '''
+    for adJSON in adsJSON:
+        if render_ad(adJSON) != legacy_render_ad(adJSON):
+            print('DIFFERENT render for ad', adJSON['ad'].get('id'))
+            return False
+    for renderer in [legacy_render_ad, render_ad]:
+        start = time.perf_counter()
+        for n in range(repeat):
+            for adJSON in adsJSON:
+                renderer(adJSON)
+        seconds = time.perf_counter() - start
+        print('{}: {} renders/s'.format(renderer.__name__, round(len(adsJSON) * repeat / seconds, 1)))
+    return True
@@ -0,0 +1,98 @@
+'''Localizador de la frontera de anuncios de revolico.com.
+La frontera es el ID más alto cuyo anuncio ya tiene más horas de antigüedad que
+las indicadas. Se encuentra con una búsqueda exponencial (galope) seguida de una
+búsqueda binaria sobre la antigüedad de los anuncios, por lo que converge en
+O(log n) pedidos. Las rachas de IDs sin anuncio se tratan como huecos y no como
+el final del espacio de IDs.
+'''
+__version__ = '1.0'
+__author__ = 'Santiago Orellana Perez'
+__created__ = '18/octubre/2026'
+__tested__ = 'Python 3.10'
+
+# Cantidad de IDs consecutivos sin anuncio que se revisan antes de considerar
+# que se ha pasado la frontera.
+FRONTIER_MAX_GAP = 10
+
+KIND_OLD = 'old'
+KIND_FRESH = 'fresh'
+KIND_EMPTY = 'empty'
+KIND_ERROR = 'error'
+
+
+class FrontierLocator():
+    '''Busca la frontera utilizando la función asincrónica getPage(pageID) del scraper.'''
+    def __init__(self, getPage, maxGap=FRONTIER_MAX_GAP):
+        self.getPage = getPage
+        self.maxGap = maxGap
+        self.probes = 0
+
+
+    async def classify(self, pageID, limitID=None):
+        '''Clasifica el ID indicado según la antigüedad de su anuncio. Si el ID no tiene anuncio,
+        revisa los siguientes (sin llegar a limitID) para saltar los huecos.
+        Devuelve el tipo, el ID donde se encontró el anuncio y el resultado de getPage().
+        '''
+        lastID = pageID + self.maxGap
+        if limitID is not None:
+            lastID = min(lastID, limitID)
+        for probeID in range(pageID, max(lastID, pageID + 1)):
+            self.probes += 1
+            result = await self.getPage(probeID)
+            if 'error' in result:
+                return KIND_ERROR, probeID, result
+            if result['ad'] is not None:
+                if float(result['hours']) > self.targetHours:
+                    return KIND_OLD, probeID, result
+                return KIND_FRESH, probeID, result
+        return KIND_EMPTY, pageID, None
+
+
+    async def locate(self, startID, targetHours):
+        '''Devuelve un diccionario con el ID de la frontera en 'id', su resultado en 'result'
+        y la cantidad de pedidos realizados en 'probes'. Si no se puede localizar, devuelve None.
+        '''
+        self.probes = 0
+        self.targetHours = targetHours
+        kind, foundID, result = await self.classify(startID)
+        if kind == KIND_ERROR:
+            return None
+        if kind == KIND_OLD:
+            # Galope hacia adelante hasta pasar la frontera.
+            low, lowResult = foundID, result
+            step = 1
+            while True:
+                kind, foundID, result = await self.classify(low + step)
+                if kind == KIND_ERROR:
+                    return None
+                if kind != KIND_OLD:
+                    high = low + step
+                    break
+                low, lowResult = foundID, result
+                step *= 2
+        else:
+            # Galope hacia atrás hasta encontrar un anuncio antiguo.
+            high = startID
+            step = 1
+            while True:
+                if high - step < 0:
+                    return None
+                kind, foundID, result = await self.classify(high - step, high)
+                if kind == KIND_ERROR:
+                    return None
+                if kind == KIND_OLD:
+                    low, lowResult = foundID, result
+                    break
+                high = high - step
+                step *= 2
+        # Búsqueda binaria entre el último ID antiguo y el primero que no lo es.
+        while high - low > 1:
+            middle = (low + high) // 2
+            kind, foundID, result = await self.classify(middle, high)
+            if kind == KIND_ERROR:
+                return None
+            if kind == KIND_OLD:
+                low, lowResult = foundID, result
+            else:
+                high = middle
+        return {'id':low, 'result':lowResult, 'probes':self.probes}
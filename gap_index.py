@@ -0,0 +1,124 @@
+'''Índice de los IDs de revolico que se sabe que no tienen anuncio.
+Los IDs que devuelven una página sin anuncio (borrados, nunca asignados o que no son
+anuncios) se guardan como rangos continuos [inicio, fin], por lo que miles de IDs vacíos
+seguidos ocupan una sola entrada. Cada rango vence después de un tiempo y sus IDs se
+vuelven a comprobar. Solo se deben agregar IDs menores que un ID con anuncio, pues los
+IDs posteriores al último publicado todavía pueden recibir anuncios nuevos.
+'''
+__version__ = '1.0'
+__author__ = 'Santiago Orellana Perez'
+__created__ = '18/octubre/2026'
+__tested__ = 'Python 3.10'
+
+import time
+import bisect
+
+# Segundos que un ID vacío se da por conocido antes de volver a comprobarlo.
+GAP_TTL_SECONDS = 6 * 3600
+
+
+class GapIndex():
+    '''Rangos ordenados de IDs vacíos con vencimiento. Las consultas son O(log n) en la cantidad de rangos.'''
+    def __init__(self, ttlSeconds=GAP_TTL_SECONDS):
+        self.ttlSeconds = ttlSeconds
+        self._starts = []
+        self._ends = []
+        self._expires = []
+        self.lookups = 0
+        self.hits = 0
+
+
+    def find(self, pageID):
+        '''Devuelve la posición del rango que contiene el ID, o -1.'''
+        index = bisect.bisect_right(self._starts, pageID) - 1
+        if index >= 0 and pageID <= self._ends[index]:
+            return index
+        return -1
+
+
+    def remove_range(self, index):
+        del self._starts[index]
+        del self._ends[index]
+        del self._expires[index]
+
+
+    def add(self, pageID, now=None):
+        '''Agrega un ID vacío, uniéndolo a los rangos vecinos si son consecutivos.
+        Un rango unido vence cuando vence la más antigua de sus partes.
+        '''
+        if now is None:
+            now = time.time()
+        expires = now + self.ttlSeconds
+        if self.find(pageID) >= 0:
+            return
+        index = bisect.bisect_right(self._starts, pageID)
+        joinLeft = index > 0 and self._ends[index - 1] == pageID - 1
+        joinRight = index < len(self._starts) and self._starts[index] == pageID + 1
+        if joinLeft and joinRight:
+            self._ends[index - 1] = self._ends[index]
+            self._expires[index - 1] = min(self._expires[index - 1], self._expires[index])
+            self.remove_range(index)
+        elif joinLeft:
+            self._ends[index - 1] = pageID
+        elif joinRight:
+            self._starts[index] = pageID
+        else:
+            self._starts.insert(index, pageID)
+            self._ends.insert(index, pageID)
+            self._expires.insert(index, expires)
+
+
+    def discard(self, pageID):
+        '''Quita un ID del índice, partiendo su rango si hace falta.'''
+        index = self.find(pageID)
+        if index < 0:
+            return
+        start, end, expires = self._starts[index], self._ends[index], self._expires[index]
+        self.remove_range(index)
+        if pageID + 1 <= end:
+            self._starts.insert(index, pageID + 1)
+            self._ends.insert(index, end)
+            self._expires.insert(index, expires)
+        if start <= pageID - 1:
+            self._starts.insert(index, start)
+            self._ends.insert(index, pageID - 1)
+            self._expires.insert(index, expires)
+
+
+    def contains(self, pageID, now=None):
+        '''Dice si se sabe que el ID está vacío. Si su rango venció, lo quita y devuelve False.'''
+        if now is None:
+            now = time.time()
+        self.lookups += 1
+        index = self.find(pageID)
+        if index < 0:
+            return False
+        if self._expires[index] <= now:
+            self.remove_range(index)
+            return False
+        self.hits += 1
+        return True
+
+
+    def evict(self, now=None):
+        '''Quita todos los rangos vencidos.'''
+        if now is None:
+            now = time.time()
+        for index in range(len(self._starts) - 1, -1, -1):
+            if self._expires[index] <= now:
+                self.remove_range(index)
+
+
+    def hit_rate(self):
+        '''Devuelve la fracción de consultas que evitaron un pedido.'''
+        if self.lookups == 0:
+            return 0.0
+        return self.hits / self.lookups
+
+
+    def ranges(self):
+        return len(self._starts)
+
+
+    def __len__(self):
+        return sum([end - start + 1 for start, end in zip(self._starts, self._ends)])
@@ -0,0 +1,111 @@
+'''Anuncios retenidos hasta que tengan la antigüedad mínima para ser enviados.
+Cuando el scraper encuentra un anuncio más reciente que maxHours, en lugar de descartarlo
+y volver a descargar la página más tarde, lo guarda aquí junto con el momento en que
+alcanzará esa antigüedad. Los anuncios se mantienen en un montículo ordenado por ese
+momento, por lo que obtener los que ya están listos es O(log n). Se guardan también en
+SQLite para no perderlos al reiniciar el bot.
+'''
+__version__ = '1.0'
+__author__ = 'Santiago Orellana Perez'
+__created__ = '18/octubre/2026'
+__tested__ = 'Python 3.10'
+
+import json
+import time
+import heapq
+import sqlite3
+
+FILE_HOLDING = './holding.db'
+
+# Si es True, antes de entregar un anuncio retenido se comprueba con un pedido HEAD
+# que su página sigue existiendo.
+HOLDING_REVALIDATE = False
+
+
+class HoldingHeap():
+    '''Montículo persistente de anuncios ordenado por el momento en que pueden entregarse.
+    En tableName se puede indicar otra tabla, para guardar varios montículos en el mismo fichero.
+    '''
+    def __init__(self, fileName=FILE_HOLDING, tableName='held'):
+        self.fileName = fileName
+        self.tableName = tableName
+        self.connection = sqlite3.connect(fileName, isolation_level=None)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.execute('''CREATE TABLE IF NOT EXISTS {} (
+            ad_id INTEGER PRIMARY KEY,
+            release_at REAL NOT NULL,
+            held_at REAL NOT NULL,
+            payload TEXT NOT NULL)'''.format(tableName))
+        self._heap = []
+        self._ids = set()
+        self.released = 0
+        self.load()
+
+
+    def load(self):
+        '''Carga los anuncios retenidos desde la base de datos.'''
+        rows = self.connection.execute('SELECT ad_id, release_at FROM {}'.format(self.tableName)).fetchall()
+        self._heap = [(releaseAt, adID) for adID, releaseAt in rows]
+        heapq.heapify(self._heap)
+        self._ids = set([adID for adID, releaseAt in rows])
+
+
+    def push(self, result, maxHours, now=None):
+        '''Retiene el resultado de get_page() hasta que el anuncio tenga maxHours de antigüedad.
+        Devuelve False si el anuncio ya estaba retenido.
+        '''
+        if now is None:
+            now = time.time()
+        adID = int(result['ad']['id'])
+        if adID in self._ids:
+            return False
+        releaseAt = now + max(0.0, float(maxHours) - float(result['hours'])) * 3600
+        self.connection.execute('INSERT OR IGNORE INTO {} (ad_id, release_at, held_at, payload) VALUES (?, ?, ?, ?)'.format(self.tableName),
+                                (adID, releaseAt, now, json.dumps(result)))
+        heapq.heappush(self._heap, (releaseAt, adID))
+        self._ids.add(adID)
+        return True
+
+
+    def pop_ready(self, now=None):
+        '''Saca el anuncio retenido que ya puede entregarse y devuelve su resultado con las
+        horas actualizadas. Si no hay ninguno listo, devuelve None.
+        '''
+        if now is None:
+            now = time.time()
+        while len(self._heap) > 0 and self._heap[0][0] <= now:
+            releaseAt, adID = heapq.heappop(self._heap)
+            self._ids.discard(adID)
+            with self.connection:
+                self.connection.execute('BEGIN IMMEDIATE')
+                row = self.connection.execute('SELECT held_at, payload FROM {} WHERE ad_id = ?'.format(self.tableName),
+                                              (adID,)).fetchone()
+                self.connection.execute('DELETE FROM {} WHERE ad_id = ?'.format(self.tableName), (adID,))
+            if row is None:
+                continue
+            heldAt, payload = row
+            result = json.loads(payload)
+            result['hours'] = float(result['hours']) + (now - heldAt) / 3600
+            self.released += 1
+            return result
+        return None
+
+
+    def seconds_to_next(self, now=None):
+        '''Devuelve los segundos que faltan para que el próximo anuncio pueda entregarse,
+        o None si no hay anuncios retenidos.
+        '''
+        if len(self._heap) == 0:
+            return None
+        if now is None:
+            now = time.time()
+        return max(0.0, self._heap[0][0] - now)
+
+
+    def __len__(self):
+        return len(self._heap)
+
+
+    def close(self):
+        self.connection.close()
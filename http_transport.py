@@ -0,0 +1,214 @@
+'''Capa de transporte HTTP para los pedidos a los sitios de anuncios.
+Mantiene una sesión persistente por cada agente de usuario, de forma que rotar el
+agente de usuario no obliga a abrir conexiones nuevas. Las conexiones se reutilizan
+(keep-alive), todos los pedidos tienen tiempo límite, se negocia compresión y se
+mide el tiempo de cada pedido para saber cuánto se ahorra al reutilizar conexiones.
+'''
+__version__ = '1.0'
+__author__ = 'Santiago Orellana Perez'
+__created__ = '18/octubre/2026'
+__tested__ = 'Python 3.10'
+
+import time
+import requests
+import httpx
+from requests.adapters import HTTPAdapter
+
+# Tiempos límite en segundos para conectar y para esperar la respuesta.
+HTTP_CONNECT_TIMEOUT = 5
+HTTP_READ_TIMEOUT = 15
+
+# Cantidad de conexiones que se mantienen abiertas por cada sesión.
+HTTP_POOL_SIZE = 10
+HTTP_KEEPALIVE_SECONDS = 60
+
+
+def accept_encoding():
+    '''Devuelve las compresiones que se pueden decodificar. Brotli solo se pide si está instalado.'''
+    encodings = ['gzip', 'deflate']
+    try:
+        import brotli
+        encodings.append('br')
+    except ImportError:
+        try:
+            import brotlicffi
+            encodings.append('br')
+        except ImportError:
+            pass
+    return ', '.join(encodings)
+
+
+ACCEPT_ENCODING = accept_encoding()
+
+
+class TransportStats():
+    '''Acumula los tiempos de los pedidos y cuántos de ellos tuvieron que abrir una conexión nueva.'''
+    def __init__(self):
+        self.requests = 0
+        self.newConnections = 0
+        self.seconds = 0.0
+        self.connectSeconds = 0.0
+        self.last = None
+
+
+    def add(self, timing):
+        '''Agrega los tiempos de un pedido.'''
+        self.requests += 1
+        self.seconds += timing['seconds']
+        if timing['newConnection']:
+            self.newConnections += 1
+        self.connectSeconds += timing['connectSeconds']
+        self.last = timing
+
+
+    def as_dict(self):
+        '''Devuelve un resumen de los tiempos acumulados.'''
+        return {
+            'requests':self.requests,
+            'newConnections':self.newConnections,
+            'reusedConnections':self.requests - self.newConnections,
+            'averageSeconds':self.seconds / self.requests if self.requests else 0,
+            'connectSeconds':self.connectSeconds,
+            }
+
+
+class TimedHTTPAdapter(HTTPAdapter):
+    '''HTTPAdapter que acumula en connectSeconds los segundos que tardan en abrirse las
+    conexiones nuevas (incluido el saludo TLS), que requests no informa.
+    '''
+    def __init__(self, *args, **kwargs):
+        self.connectSeconds = 0.0
+        super().__init__(*args, **kwargs)
+
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        adapter = self
+        poolClasses = {}
+        for scheme, poolClass in self.poolmanager.pool_classes_by_scheme.items():
+
+            class TimedConnection(poolClass.ConnectionCls):
+                def connect(self):
+                    start = time.perf_counter()
+                    try:
+                        return super().connect()
+                    finally:
+                        adapter.connectSeconds += time.perf_counter() - start
+
+            poolClasses[scheme] = type('Timed' + poolClass.__name__, (poolClass,), {'ConnectionCls':TimedConnection})
+        self.poolmanager.pool_classes_by_scheme = poolClasses
+
+
+
+class SessionPool():
+    '''Sesiones requests persistentes, una por agente de usuario.'''
+    def __init__(self, poolSize=HTTP_POOL_SIZE, connectTimeout=HTTP_CONNECT_TIMEOUT, readTimeout=HTTP_READ_TIMEOUT):
+        self.poolSize = poolSize
+        self.timeout = (connectTimeout, readTimeout)
+        self.stats = TransportStats()
+        self._sessions = {}
+
+
+    def get_session(self, userAgent):
+        '''Devuelve la sesión del agente de usuario indicado, creándola si no existe.'''
+        session = self._sessions.get(userAgent)
+        if session is None:
+            session = requests.Session()
+            adapter = TimedHTTPAdapter(pool_connections=self.poolSize, pool_maxsize=self.poolSize)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            session.headers.update({'user-agent': userAgent, 'accept-encoding': ACCEPT_ENCODING})
+            self._sessions[userAgent] = session
+        return session
+
+
+    def count_connections(self, session, url):
+        '''Devuelve cuántas conexiones ha abierto la sesión hacia el host de la URL.'''
+        try:
+            pools = session.get_adapter(url).poolmanager.pools
+            return sum([pools[key].num_connections for key in pools.keys()])
+        except Exception:
+            return 0
+
+
+    def get(self, url, userAgent):
+        '''Hace un pedido GET y devuelve la respuesta. Los tiempos quedan en stats.last.'''
+        session = self.get_session(userAgent)
+        adapter = session.get_adapter(url)
+        connections = self.count_connections(session, url)
+        connectSeconds = adapter.connectSeconds
+        start = time.perf_counter()
+        response = session.get(url, timeout=self.timeout)
+        seconds = time.perf_counter() - start
+        newConnection = self.count_connections(session, url) > connections
+        self.stats.add({'seconds':seconds, 'newConnection':newConnection,
+                        'connectSeconds':adapter.connectSeconds - connectSeconds})
+        return response
+
+
+    def close(self):
+        '''Cierra todas las sesiones y sus conexiones.'''
+        for session in self._sessions.values():
+            session.close()
+        self._sessions = {}
+
+
+class AsyncSessionPool():
+    '''Clientes httpx asincrónicos persistentes, uno por agente de usuario.
+    Si se indican presupuestos por sitio (HostBudgets), cada pedido espera su ficha antes de hacerse.
+    '''
+    def __init__(self, poolSize=HTTP_POOL_SIZE, connectTimeout=HTTP_CONNECT_TIMEOUT, readTimeout=HTTP_READ_TIMEOUT, budgets=None):
+        self.limits = httpx.Limits(max_connections=poolSize, max_keepalive_connections=poolSize,
+                                   keepalive_expiry=HTTP_KEEPALIVE_SECONDS)
+        self.timeout = httpx.Timeout(readTimeout, connect=connectTimeout)
+        self.stats = TransportStats()
+        self.budgets = budgets
+        self._clients = {}
+
+
+    def get_client(self, userAgent):
+        '''Devuelve el cliente del agente de usuario indicado, creándolo si no existe.'''
+        client = self._clients.get(userAgent)
+        if client is None:
+            client = httpx.AsyncClient(headers={'user-agent': userAgent, 'accept-encoding': ACCEPT_ENCODING},
+                                       limits=self.limits, timeout=self.timeout)
+            self._clients[userAgent] = client
+        return client
+
+
+    async def get(self, url, userAgent):
+        '''Hace un pedido GET y devuelve la respuesta. Los tiempos quedan en stats.last.'''
+        timing = {'seconds':0.0, 'newConnection':False, 'connectSeconds':0.0}
+        started = {}
+
+        async def trace(eventName, info):
+            # httpcore informa el inicio y fin de la conexión TCP y del saludo TLS.
+            if eventName.endswith('.started'):
+                started[eventName] = time.perf_counter()
+            elif eventName.endswith('.complete') and eventName.startswith('connection.'):
+                timing['newConnection'] = True
+                begin = started.get(eventName.replace('.complete', '.started'))
+                if begin is not None:
+                    timing['connectSeconds'] += time.perf_counter() - begin
+
+        if self.budgets is not None:
+            await self.budgets.acquire(url)
+        start = time.perf_counter()
+        response = await self.get_client(userAgent).get(url, extensions={'trace': trace})
+        timing['seconds'] = time.perf_counter() - start
+        self.stats.add(timing)
+        return response
+
+
+    async def head(self, url, userAgent):
+        '''Hace un pedido HEAD y devuelve la respuesta, sin descargar el contenido.'''
+        if self.budgets is not None:
+            await self.budgets.acquire(url)
+        return await self.get_client(userAgent).head(url)
+
+
+    async def close(self):
+        '''Cierra todos los clientes y sus conexiones.'''
+        for client in self._clients.values():
+            await client.aclose()
+        self._clients = {}
@@ -0,0 +1,99 @@
+'''Motor de ingestión de anuncios de varias fuentes.
+Ejecuta todas las fuentes (subclases de AdSource) en el mismo proceso y en el mismo bucle
+de eventos. Las fuentes comparten un solo transporte HTTP, con sus conexiones persistentes,
+y un presupuesto de pedidos por segundo para cada sitio, de forma que dos fuentes del mismo
+sitio no lo consultan más de lo permitido. Un solo planificador guarda en un montículo el
+momento en que le toca a cada fuente según su next_interval(), y consulta a la vez todas
+las que están listas. Los anuncios salen normalizados, por lo que se envían, indexan y
+enrutan igual sin importar la fuente.
+'''
+__version__ = '1.0'
+__author__ = 'Santiago Orellana Perez'
+__created__ = '18/octubre/2026'
+__tested__ = 'Python 3.10'
+
+import time
+import heapq
+import asyncio
+from rate_limit import HostBudgets
+from http_transport import AsyncSessionPool
+from scheduler import POLL_DEFAULT_SECONDS
+from log_writer import LOG
+
+
+class IngestionEngine():
+    '''Planificador de las fuentes de anuncios con transporte y presupuestos compartidos.'''
+    def __init__(self, sources=(), hostRates=None):
+        self.budgets = HostBudgets(rates=hostRates)
+        self.transport = AsyncSessionPool(budgets=self.budgets)
+        self.sources = []
+        self._due = []
+        for source in sources:
+            self.add_source(source)
+
+
+    def add_source(self, source):
+        '''Agrega una fuente, que se consulta por primera vez en la próxima llamada a poll_due().'''
+        for other in self.sources:
+            if other.sourceNumber == source.sourceNumber and other.sourceName != source.sourceName:
+                raise ValueError('Sources {} and {} use the same number {}.'.format(
+                    other.sourceName, source.sourceName, source.sourceNumber))
+        source.attach(self.transport)
+        self.sources.append(source)
+        heapq.heappush(self._due, (time.monotonic(), len(self.sources) - 1))
+
+
+    def seconds_to_next(self, now=None):
+        '''Devuelve los segundos que faltan para que le toque a la próxima fuente.'''
+        if now is None:
+            now = time.monotonic()
+        if len(self._due) == 0:
+            return POLL_DEFAULT_SECONDS
+        return max(0.0, self._due[0][0] - now)
+
+
+    async def poll_source(self, source):
+        '''Consulta una fuente. Devuelve su resultado y los segundos hasta su próxima consulta.'''
+        try:
+            result = await source.next_ad()
+            interval = source.next_interval()
+        except Exception as e:
+            LOG.write('ERROR', 'Source {} not polled. {}'.format(source.sourceName, str(e)))
+            result = {'error':0}
+            interval = POLL_DEFAULT_SECONDS
+        return result, interval
+
+
+    async def poll_due(self, now=None):
+        '''Consulta a la vez todas las fuentes a las que les toca y las vuelve a programar.
+        Devuelve la lista de (fuente, resultado).
+        '''
+        if now is None:
+            now = time.monotonic()
+        due = []
+        while len(self._due) > 0 and self._due[0][0] <= now:
+            due.append(heapq.heappop(self._due)[1])
+        polls = await asyncio.gather(*[self.poll_source(self.sources[index]) for index in due])
+        done = time.monotonic()
+        results = []
+        for index, (result, interval) in zip(due, polls):
+            heapq.heappush(self._due, (done + interval, index))
+            results.append((self.sources[index], result))
+        return results
+
+
+    async def run(self, handler):
+        '''Consulta las fuentes sin detenerse y pasa cada resultado a la función asincrónica
+        handler(fuente, resultado). Se usa fuera del bot, que llama a poll_due() desde su cola de tareas.
+        '''
+        while True:
+            for source, result in await self.poll_due():
+                await handler(source, result)
+            await asyncio.sleep(self.seconds_to_next())
+
+
+    async def close(self):
+        '''Cierra las fuentes y el transporte compartido.'''
+        for source in self.sources:
+            await source.close()
+        await self.transport.close()
@@ -0,0 +1,123 @@
+'''Registro en disco de los anuncios ya enviados a cada receptor.
+Evita volver a enviar el mismo anuncio al mismo receptor después de reiniciar el bot,
+de una caída o de que el cursor del scraper retroceda. Las consultas son O(1) porque
+los pares (anuncio, receptor) recientes se mantienen en memoria, y el tamaño está
+acotado porque los pares más antiguos que el tiempo indicado se descartan.
+En disco es un fichero de solo agregar que se compacta cuando crece demasiado.
+'''
+__version__ = '1.0'
+__author__ = 'Santiago Orellana Perez'
+__created__ = '18/octubre/2026'
+__tested__ = 'Python 3.10'
+
+import os
+import time
+from collections import OrderedDict
+from log_writer import LOG
+
+FILE_LEDGER = './delivered.txt'
+
+# Horas que se recuerda un envío. Debe ser mayor que el tiempo que puede tardar el
+# cursor del scraper en volver a pasar por un mismo anuncio.
+LEDGER_MAX_AGE_HOURS = 72
+
+# Cantidad mínima de líneas obsoletas en el fichero antes de compactarlo.
+LEDGER_COMPACT_LINES = 10000
+
+
+class DeliveredLedger():
+    '''Conjunto de pares (ID de anuncio, receptor) ya enviados, con expiración por antigüedad.'''
+    def __init__(self, fileName=FILE_LEDGER, maxAgeHours=LEDGER_MAX_AGE_HOURS):
+        self.fileName = fileName
+        self.maxAgeSeconds = maxAgeHours * 3600
+        self._entries = OrderedDict()
+        self._fileLines = 0
+        self._fileOut = None
+        self.load()
+
+
+    def key(self, adID, receiverID):
+        return '{} {}'.format(adID, receiverID)
+
+
+    def load(self):
+        '''Carga los envíos que no han expirado desde el fichero.'''
+        limit = time.time() - self.maxAgeSeconds
+        try:
+            with open(self.fileName, 'r') as fileIn:
+                for line in fileIn:
+                    self._fileLines += 1
+                    parts = line.rstrip('\n').split(' ', 1)
+                    if len(parts) != 2:
+                        continue
+                    try:
+                        seconds = float(parts[0])
+                    except ValueError:
+                        continue
+                    if seconds >= limit:
+                        self._entries[parts[1]] = seconds
+                        self._entries.move_to_end(parts[1])
+        except FileNotFoundError:
+            pass
+
+
+    def contains(self, adID, receiverID):
+        '''Devuelve True si el anuncio ya fue enviado al receptor.'''
+        return self.key(adID, receiverID) in self._entries
+
+
+    def add(self, adID, receiverID):
+        '''Registra que el anuncio fue enviado al receptor.'''
+        key = self.key(adID, receiverID)
+        seconds = time.time()
+        self._entries[key] = seconds
+        self._entries.move_to_end(key)
+        try:
+            if self._fileOut is None:
+                self._fileOut = open(self.fileName, 'a')
+            self._fileOut.write('{} {}\n'.format(round(seconds, 3), key))
+            self._fileOut.flush()
+            self._fileLines += 1
+        except Exception as e:
+            LOG.write('ERROR', 'Ledger file {} not written. {}'.format(self.fileName, str(e)))
+        self.evict(seconds)
+
+
+    def evict(self, now=None):
+        '''Descarta los envíos más antiguos que el tiempo máximo y compacta el fichero si hace falta.'''
+        if now is None:
+            now = time.time()
+        limit = now - self.maxAgeSeconds
+        while self._entries:
+            key, seconds = next(iter(self._entries.items()))
+            if seconds >= limit:
+                break
+            self._entries.popitem(last=False)
+        if self._fileLines - len(self._entries) > max(LEDGER_COMPACT_LINES, len(self._entries)):
+            self.compact()
+
+
+    def compact(self):
+        '''Reescribe el fichero de forma atómica con los envíos que no han expirado.'''
+        try:
+            if self._fileOut is not None:
+                self._fileOut.close()
+                self._fileOut = None
+            temporal = self.fileName + '.tmp'
+            with open(temporal, 'w') as fileOut:
+                for key, seconds in self._entries.items():
+                    fileOut.write('{} {}\n'.format(round(seconds, 3), key))
+            os.replace(temporal, self.fileName)
+            self._fileLines = len(self._entries)
+        except Exception as e:
+            LOG.write('ERROR', 'Ledger file {} not compacted. {}'.format(self.fileName, str(e)))
+
+
+    def __len__(self):
+        return len(self._entries)
+
+
+    def close(self):
+        if self._fileOut is not None:
+            self._fileOut.close()
+            self._fileOut = None
@@ -0,0 +1,175 @@
+'''Escritura de los mensajes de reporte en un hilo aparte.
+Los mensajes se ponen en una cola en memoria y un hilo los escribe por lotes en un
+fichero que se mantiene abierto, vaciando el búfer cada cierto tiempo. Así, reportar un
+mensaje casi no cuesta nada en el bucle de eventos del bot. El fichero cambia cada día
+y también cuando supera un tamaño máximo. Se pueden filtrar los mensajes por nivel y
+escribirlos como líneas JSON.
+'''
+__version__ = '1.0'
+__author__ = 'Santiago Orellana Perez'
+__created__ = '18/octubre/2026'
+__tested__ = 'Python 3.10'
+
+import os
+import json
+import time
+import queue
+import atexit
+import datetime
+import threading
+
+LOG_FILE_PATTERN = './dinamic-grid-bot-{}.log'
+
+# Segundos entre vaciados del búfer al fichero y máximo de mensajes por lote.
+LOG_FLUSH_SECONDS = 1.0
+LOG_BATCH_SIZE = 500
+
+# Tamaño a partir del cual se empieza otro fichero del mismo día.
+LOG_MAX_BYTES = 50 * 1024 * 1024
+
+# Nivel mínimo de los mensajes que se reportan y formato de las líneas.
+LOG_LEVEL = 'DEBUG'
+LOG_JSON = False
+LOG_TO_CONSOLE = True
+
+# Niveles de los tipos de mensajes. Los tipos desconocidos se consideran INFO.
+LOG_LEVELS = {'DEBUG':10, 'DATA':10, 'INFO':20, 'START':20, 'WARNING':30, 'REJECTED':30, 'ERROR':40, 'CRITICAL':50}
+
+
+def create_filename(dateTime, part=0):
+    '''Devuelve el nombre del fichero del día indicado. Se crea un fichero para cada dia.'''
+    name = LOG_FILE_PATTERN.format(dateTime.strftime('%Y-%m-%d'))
+    if part > 0:
+        name = '{}.{}'.format(name, part)
+    return name
+
+
+def level_of(msgType):
+    return LOG_LEVELS.get(str(msgType).upper(), LOG_LEVELS['INFO'])
+
+
+class LogWriter():
+    '''Escribe en un hilo aparte los mensajes que recibe por una cola.'''
+    def __init__(self, level=LOG_LEVEL, asJSON=LOG_JSON, toConsole=LOG_TO_CONSOLE, maxBytes=LOG_MAX_BYTES):
+        self.level = level_of(level)
+        self.asJSON = asJSON
+        self.toConsole = toConsole
+        self.maxBytes = maxBytes
+        self._queue = queue.SimpleQueue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._fileOut = None
+        self._fileDate = None
+        self._filePart = 0
+        self.dropped = 0
+
+
+    def start(self):
+        '''Inicia el hilo de escritura si no está funcionando.'''
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self.run, name='LogWriter', daemon=True)
+                self._thread.start()
+                atexit.register(self.close)
+
+
+    def write(self, msgType, msg, dateTime=None, toFile=True, toConsole=True):
+        '''Pone el mensaje en la cola. No espera a que se escriba.'''
+        if level_of(msgType) < self.level:
+            return
+        if dateTime is None:
+            dateTime = datetime.datetime.now()
+        if self._thread is None:
+            self.start()
+        self._queue.put((dateTime, str(msgType), str(msg), toFile, toConsole and self.toConsole))
+
+
+    def format_line(self, dateTime, msgType, msg):
+        if self.asJSON:
+            return json.dumps({'time':dateTime.isoformat(), 'type':msgType, 'msg':msg}, ensure_ascii=False) + '\n'
+        return '{} {} {}\n'.format(str(dateTime), msgType, msg)
+
+
+    def get_file(self, dateTime):
+        '''Devuelve el fichero abierto que corresponde a la fecha, cambiándolo si hace falta.'''
+        date = dateTime.date()
+        if self._fileOut is not None and (self._fileDate != date or self._fileOut.tell() >= self.maxBytes):
+            self._fileOut.close()
+            self._fileOut = None
+            if self._fileDate != date:
+                self._filePart = 0
+            else:
+                self._filePart += 1
+        if self._fileOut is None:
+            self._fileDate = date
+            self._fileOut = open(create_filename(dateTime, self._filePart), 'a', encoding='utf-8')
+            while self._fileOut.tell() >= self.maxBytes:
+                self._fileOut.close()
+                self._filePart += 1
+                self._fileOut = open(create_filename(dateTime, self._filePart), 'a', encoding='utf-8')
+        return self._fileOut
+
+
+    def write_batch(self, batch):
+        for dateTime, msgType, msg, toFile, toConsole in batch:
+            if toConsole:
+                print(str(dateTime), msgType, msg)
+            if toFile:
+                try:
+                    self.get_file(dateTime).write(self.format_line(dateTime, msgType, msg))
+                except Exception as e:
+                    self.dropped += 1
+                    print(str(dateTime), 'ERROR', 'LogWriter: {}'.format(str(e)))
+
+
+    def run(self):
+        '''Bucle del hilo: espera mensajes, los escribe por lotes y vacía el búfer periódicamente.'''
+        lastFlush = time.monotonic()
+        while True:
+            # Con mensajes llegando sin parar la cola nunca queda vacía, así que se vacía por tiempo.
+            if time.monotonic() - lastFlush >= LOG_FLUSH_SECONDS:
+                self.flush()
+                lastFlush = time.monotonic()
+            try:
+                item = self._queue.get(timeout=LOG_FLUSH_SECONDS)
+            except queue.Empty:
+                self.flush()
+                lastFlush = time.monotonic()
+                continue
+            if item is None:
+                break
+            batch = [item]
+            while len(batch) < LOG_BATCH_SIZE:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    self._queue.put(None)
+                    break
+                batch.append(item)
+            self.write_batch(batch)
+        self.flush()
+
+
+    def flush(self):
+        if self._fileOut is not None:
+            try:
+                self._fileOut.flush()
+            except Exception:
+                pass
+
+
+    def close(self):
+        '''Escribe los mensajes pendientes y cierra el fichero.'''
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+        if self._fileOut is not None:
+            self._fileOut.close()
+            self._fileOut = None
+
+
+# Escritor compartido por todos los módulos, para que los mensajes vayan al mismo fichero.
+LOG = LogWriter()
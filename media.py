@@ -0,0 +1,220 @@
+'''Imágenes de los anuncios: se descargan una sola vez y se suben una sola vez a Telegram.
+Las imágenes descargadas se guardan en una caché local de tamaño limitado que descarta
+las menos usadas. La imagen se sube con el envío al primer receptor y el file_id que
+devuelve Telegram se reutiliza para todos los demás, por lo que Telegram no vuelve a
+pedir la imagen al sitio de anuncios por cada chat. Opcionalmente se envían todas las
+imágenes del anuncio como un álbum.
+'''
+__version__ = '1.0'
+__author__ = 'Santiago Orellana Perez'
+__created__ = '18/octubre/2026'
+__tested__ = 'Python 3.10'
+
+import os
+import asyncio
+import hashlib
+from collections import OrderedDict
+from telegram import InputMediaPhoto
+from http_transport import AsyncSessionPool
+from log_writer import LOG
+
+MEDIA_FOLDER = './media_cache'
+MEDIA_CACHE_BYTES = 200 * 1024 * 1024
+MEDIA_USER_AGENT = 'Mozilla/5.0 (Windows; U; MSIE 9.0; Windows NT 9.0; en-US)'
+
+# Tamaño de la imagen del anuncio que se envía: 'thumb' o 'high'.
+MEDIA_IMAGE_SIZE = 'thumb'
+
+# Si es True se envían todas las imágenes del anuncio como un álbum.
+MEDIA_SEND_ALBUM = False
+
+# Telegram admite hasta 10 imágenes por álbum.
+MEDIA_ALBUM_MAX = 10
+
+# Cantidad de anuncios cuyos file_id se recuerdan, para no volver a subir sus imágenes
+# cuando un envío se reintenta desde la cola.
+MEDIA_FILES_ID_MAX = 2000
+
+
+def read_file(path):
+    with open(path, 'rb') as fileIn:
+        return fileIn.read()
+
+
+def write_file(path, data):
+    with open(path, 'wb') as fileOut:
+        fileOut.write(data)
+
+
+class MediaCache():
+    '''Caché en disco de imágenes descargadas, limitada en bytes y con descarte LRU.
+    Recuerda también los file_id de Telegram de las últimas imágenes subidas.
+    '''
+    def __init__(self, folder=MEDIA_FOLDER, maxBytes=MEDIA_CACHE_BYTES, userAgent=MEDIA_USER_AGENT,
+                 maxFilesID=MEDIA_FILES_ID_MAX):
+        self.folder = folder
+        self.maxBytes = maxBytes
+        self.userAgent = userAgent
+        self.totalBytes = 0
+        self.downloads = 0
+        self.hits = 0
+        self._files = OrderedDict()
+        self._filesID = OrderedDict()
+        self.maxFilesID = maxFilesID
+        self._pending = {}
+        self._transport = None
+        self.load()
+
+
+    def load(self):
+        '''Carga las imágenes que ya están en la carpeta, de la más antigua a la más reciente.'''
+        try:
+            os.makedirs(self.folder, exist_ok=True)
+            paths = [os.path.join(self.folder, name) for name in os.listdir(self.folder)]
+            for path in sorted(paths, key=os.path.getmtime):
+                size = os.path.getsize(path)
+                self._files[os.path.basename(path)] = size
+                self.totalBytes += size
+        except Exception as e:
+            LOG.write('ERROR', 'Media cache {} not loaded. {}'.format(self.folder, str(e)))
+
+
+    def file_name(self, url):
+        return hashlib.sha1(url.encode('utf-8')).hexdigest()
+
+
+    def get_files_id(self, urls):
+        '''Devuelve los file_id de las imágenes de las URLs indicadas si ya se subieron, o None.'''
+        filesID = self._filesID.get(tuple(urls))
+        if filesID is not None:
+            self._filesID.move_to_end(tuple(urls))
+        return filesID
+
+
+    def set_files_id(self, urls, filesID):
+        '''Recuerda los file_id de las imágenes subidas, descartando los menos usados.'''
+        self._filesID[tuple(urls)] = filesID
+        self._filesID.move_to_end(tuple(urls))
+        while len(self._filesID) > self.maxFilesID:
+            self._filesID.popitem(last=False)
+
+
+    def evict(self):
+        '''Borra las imágenes menos usadas hasta que la caché no supere el tamaño máximo.'''
+        while self.totalBytes > self.maxBytes and len(self._files) > 1:
+            name, size = self._files.popitem(last=False)
+            self.totalBytes -= size
+            try:
+                os.remove(os.path.join(self.folder, name))
+            except OSError:
+                pass
+
+
+    async def download(self, url):
+        if self._transport is None:
+            self._transport = AsyncSessionPool()
+        response = await self._transport.get(url, self.userAgent)
+        response.raise_for_status()
+        return response.content
+
+
+    async def get(self, url):
+        '''Devuelve los bytes de la imagen, descargándola solo si no está en la caché.
+        Si varios envíos piden la misma imagen a la vez, se descarga una sola vez.
+        '''
+        name = self.file_name(url)
+        path = os.path.join(self.folder, name)
+        if name in self._files:
+            try:
+                data = await asyncio.to_thread(read_file, path)
+                self._files.move_to_end(name)
+                self.hits += 1
+                return data
+            except OSError:
+                if name in self._files:
+                    self.totalBytes -= self._files.pop(name)
+        pending = self._pending.get(name)
+        if pending is not None:
+            return await pending
+        pending = asyncio.get_running_loop().create_future()
+        self._pending[name] = pending
+        try:
+            data = await self.download(url)
+            self.downloads += 1
+            await asyncio.to_thread(write_file, path, data)
+            self._files[name] = len(data)
+            self.totalBytes += len(data)
+            self.evict()
+            pending.set_result(data)
+            return data
+        except Exception as e:
+            pending.set_exception(e)
+            # Evita el aviso de excepción no recuperada si nadie más esperaba la descarga.
+            pending.exception()
+            raise
+        finally:
+            del self._pending[name]
+
+
+    async def close(self):
+        if self._transport is not None:
+            await self._transport.close()
+            self._transport = None
+
+
+class AdMedia():
+    '''Imágenes de un anuncio. Se suben con el primer envío y luego se reutiliza su file_id,
+    que queda guardado en la caché para los reintentos del mismo anuncio.
+    '''
+    def __init__(self, ad, cache, album=MEDIA_SEND_ALBUM, imageSize=MEDIA_IMAGE_SIZE):
+        self.cache = cache
+        self.album = album
+        self.urls = []
+        for image in ad.get('images', []):
+            url = image.get(imageSize) or image.get('thumb') or image.get('high')
+            if url:
+                self.urls.append(url)
+        if not album:
+            self.urls = self.urls[:1]
+        self.urls = self.urls[:MEDIA_ALBUM_MAX]
+        self.filesID = cache.get_files_id(self.urls)
+        self.uploads = 0
+        self._lock = asyncio.Lock()
+
+
+    async def get_files(self):
+        '''Descarga las imágenes. Si alguna falla, se utiliza su URL para que la pida Telegram.'''
+        files = []
+        for url in self.urls:
+            try:
+                files.append(await self.cache.get(url))
+            except Exception as e:
+                LOG.write('WARNING', 'Image {} not downloaded. {}'.format(url, str(e)))
+                files.append(url)
+        return files
+
+
+    async def send_files(self, bot, chatID, files, caption):
+        '''Envía las imágenes indicadas (bytes, URL o file_id) y devuelve los mensajes enviados.'''
+        if len(files) == 1:
+            return [await bot.send_photo(chatID, files[0], caption=caption, parse_mode = 'HTML')]
+        group = [InputMediaPhoto(files[0], caption=caption, parse_mode = 'HTML')]
+        group = group + [InputMediaPhoto(data) for data in files[1:]]
+        return list(await bot.send_media_group(chatID, group))
+
+
+    async def send(self, bot, chatID, caption):
+        '''Envía las imágenes del anuncio con el texto al chat indicado.'''
+        if self.filesID is None:
+            async with self._lock:
+                if self.filesID is None:
+                    messages = await self.send_files(bot, chatID, await self.get_files(), caption)
+                    self.uploads += 1
+                    try:
+                        self.filesID = [message.photo[-1].file_id for message in messages]
+                        self.cache.set_files_id(self.urls, self.filesID)
+                    except Exception:
+                        self.filesID = None
+                    return messages[0]
+        messages = await self.send_files(bot, chatID, self.filesID, caption)
+        return messages[0]
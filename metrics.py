@@ -0,0 +1,222 @@
+'''Métricas del funcionamiento del bot.
+Contadores e histogramas de latencia para cada etapa (pedido de la página, extracción
+del anuncio, formato, envío y pausas), respuestas HTTP por estado, resultados del
+scraping, envíos por resultado y el retraso entre la publicación de un anuncio y su
+envío. Se publican como texto en formato Prometheus en un servidor HTTP local y se
+resumen con el comando /metrics del bot.
+'''
+__version__ = '1.0'
+__author__ = 'Santiago Orellana Perez'
+__created__ = '18/octubre/2026'
+__tested__ = 'Python 3.10'
+
+import time
+import bisect
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+METRICS_HOST = '127.0.0.1'
+METRICS_PORT = 9108
+
+LATENCY_BUCKETS = [0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30]
+LAG_BUCKETS = [60, 300, 900, 1800, 3600, 7200, 14400, 43200, 86400, 172800]
+
+
+def label_text(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(['{}="{}"'.format(key, value) for key, value in labels]) + '}'
+
+
+class Counter():
+    '''Contador que solo aumenta, con etiquetas opcionales.
+    El servidor de métricas lo lee desde otro hilo, por eso los cambios y las lecturas se
+    hacen con el candado tomado.
+    '''
+    def __init__(self, name, description):
+        self.name = name
+        self.description = description
+        self.values = {}
+        self._lock = threading.Lock()
+
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+
+    def get(self, **labels):
+        return self.values.get(tuple(sorted(labels.items())), 0)
+
+
+    def reset(self):
+        with self._lock:
+            self.values = {}
+
+
+    def snapshot(self):
+        '''Devuelve una copia ordenada de los valores: una lista de (etiquetas, valor).'''
+        with self._lock:
+            return sorted(self.values.items())
+
+
+    def render(self):
+        lines = ['# HELP {} {}'.format(self.name, self.description), '# TYPE {} counter'.format(self.name)]
+        for key, value in self.snapshot():
+            lines.append('{}{} {}'.format(self.name, label_text(key), value))
+        return lines
+
+
+class Histogram():
+    '''Histograma acumulativo por intervalos, con etiquetas opcionales.
+    Igual que Counter, se modifica y se lee con el candado tomado.
+    '''
+    def __init__(self, name, description, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.description = description
+        self.buckets = list(buckets)
+        self.values = {}
+        self._lock = threading.Lock()
+
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            data = self.values.get(key)
+            if data is None:
+                data = {'counts':[0] * (len(self.buckets) + 1), 'sum':0.0, 'count':0}
+                self.values[key] = data
+            data['counts'][index] += 1
+            data['sum'] += value
+            data['count'] += 1
+
+
+    def reset(self):
+        with self._lock:
+            self.values = {}
+
+
+    def snapshot(self):
+        '''Devuelve una copia ordenada de los valores: una lista de (etiquetas, datos).'''
+        with self._lock:
+            return [(key, {'counts':list(data['counts']), 'sum':data['sum'], 'count':data['count']})
+                    for key, data in sorted(self.values.items())]
+
+
+    def time(self, **labels):
+        '''Devuelve un administrador de contexto que mide los segundos que tarda el bloque.'''
+        return Timer(self, labels)
+
+
+    def quantile(self, q, **labels):
+        '''Estima el cuantil q (0 a 1) interpolando dentro del intervalo que lo contiene.'''
+        with self._lock:
+            data = self.values.get(tuple(sorted(labels.items())))
+            if data is None or data['count'] == 0:
+                return None
+            data = {'counts':list(data['counts']), 'count':data['count']}
+        rank = q * data['count']
+        accumulated = 0
+        for index, count in enumerate(data['counts']):
+            if accumulated + count >= rank and count > 0:
+                lower = self.buckets[index - 1] if index > 0 else 0
+                upper = self.buckets[index] if index < len(self.buckets) else self.buckets[-1]
+                return lower + (upper - lower) * (rank - accumulated) / count
+            accumulated += count
+        return self.buckets[-1]
+
+
+    def render(self):
+        lines = ['# HELP {} {}'.format(self.name, self.description), '# TYPE {} histogram'.format(self.name)]
+        for key, data in self.snapshot():
+            accumulated = 0
+            for bound, count in zip(self.buckets + ['+Inf'], data['counts']):
+                accumulated += count
+                lines.append('{}_bucket{} {}'.format(self.name, label_text(key + (('le', bound),)), accumulated))
+            lines.append('{}_sum{} {}'.format(self.name, label_text(key), data['sum']))
+            lines.append('{}_count{} {}'.format(self.name, label_text(key), data['count']))
+        return lines
+
+
+class Timer():
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+
+    def __exit__(self, excType, excValue, traceback):
+        self.histogram.observe(time.perf_counter() - self.start, **self.labels)
+        return False
+
+
+STAGE_SECONDS = Histogram('adfiller_stage_seconds', 'Latency of each stage: fetch, parse, render, fanout, sleep.')
+HTTP_RESPONSES = Counter('adfiller_http_responses_total', 'Ad page responses by status: 200, 404, other codes or error.')
+SCRAPE_RESULTS = Counter('adfiller_scrape_results_total', 'Scrape results: ad, miss (no ad on page), too_fresh (deferred), held, released or expired (holding heap) and gap_skip (known empty ID).')
+SENDS = Counter('adfiller_sends_total', 'Telegram sends by outcome: sent or failed.')
+FRESHNESS_LAG = Histogram('adfiller_freshness_lag_seconds', 'Seconds between updatedOnByUser and delivery.', LAG_BUCKETS)
+
+ALL_METRICS = [STAGE_SECONDS, HTTP_RESPONSES, SCRAPE_RESULTS, SENDS, FRESHNESS_LAG]
+
+
+def render_metrics():
+    '''Devuelve todas las métricas como texto en formato Prometheus.'''
+    lines = []
+    for metric in ALL_METRICS:
+        lines = lines + metric.render()
+    return '\n'.join(lines) + '\n'
+
+
+def reset_metrics():
+    '''Vacía todas las métricas, por ejemplo antes de una medición.'''
+    for metric in ALL_METRICS:
+        metric.reset()
+
+
+def summary_lines():
+    '''Devuelve un resumen legible de las métricas para el comando /metrics.'''
+    lines = []
+    for key, data in STAGE_SECONDS.snapshot():
+        labels = dict(key)
+        lines.append('{}: {} veces, p50 {} ms, p99 {} ms'.format(
+            labels.get('stage'), data['count'],
+            round(STAGE_SECONDS.quantile(0.5, **labels) * 1000, 1), round(STAGE_SECONDS.quantile(0.99, **labels) * 1000, 1)))
+    for counter in [HTTP_RESPONSES, SCRAPE_RESULTS, SENDS]:
+        for key, value in counter.snapshot():
+            lines.append('{} {}: {}'.format(counter.name.replace('adfiller_', '').replace('_total', ''),
+                                            ' '.join([str(value) for name, value in key]), value))
+    lag = FRESHNESS_LAG.quantile(0.5)
+    if lag is not None:
+        lines.append('retraso de entrega: p50 {} min, p99 {} min'.format(round(lag / 60, 1), round(FRESHNESS_LAG.quantile(0.99) / 60, 1)))
+    return lines
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] not in ['/', '/metrics']:
+            self.send_error(404)
+            return
+        body = render_metrics().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server(host=METRICS_HOST, port=METRICS_PORT):
+    '''Inicia en un hilo aparte el servidor HTTP local que publica las métricas.'''
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    thread = threading.Thread(target=server.serve_forever, name='MetricsServer', daemon=True)
+    thread.start()
+    return server
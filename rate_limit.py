@@ -0,0 +1,83 @@
+'''Limitadores de velocidad para los pedidos que hace el bot.
+Se utilizan para no superar la cantidad de pedidos por segundo que se decida
+hacer a los sitios consultados, aunque los pedidos se hagan de forma concurrente.
+'''
+__version__ = '1.0'
+__author__ = 'Santiago Orellana Perez'
+__created__ = '18/octubre/2026'
+__tested__ = 'Python 3.10'
+
+import asyncio
+import time
+from urllib.parse import urlsplit
+
+# Pedidos por segundo y ráfaga máxima que se permiten a cada sitio si no se indica otra cosa.
+HOST_REQUESTS_PER_SECOND = 4
+HOST_BURST = 4
+
+
+class TokenBucket():
+    '''Cubeta de fichas: permite hasta 'capacity' pedidos seguidos y luego 'rate' pedidos por segundo.'''
+    def __init__(self, rate, capacity=1):
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+
+    def refill(self):
+        '''Agrega las fichas acumuladas desde la última actualización.'''
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+
+    def try_acquire(self):
+        '''Toma una ficha si hay disponible. Devuelve 0 si la tomó o los segundos que faltan para tenerla.'''
+        self.refill()
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return 0
+        return (1 - self._tokens) / self.rate
+
+
+    def pause(self, seconds):
+        '''Hace que no haya fichas disponibles durante los segundos indicados.'''
+        self.refill()
+        self._tokens = min(self._tokens, 1 - float(seconds) * self.rate)
+
+
+    async def acquire(self):
+        '''Espera hasta que haya una ficha disponible y la toma.'''
+        async with self._lock:
+            wait = self.try_acquire()
+            while wait > 0:
+                await asyncio.sleep(wait)
+                wait = self.try_acquire()
+
+
+
+class HostBudgets():
+    '''Una cubeta de fichas por sitio, compartida por todas las fuentes y pedidos que lo consultan.
+    En rates se puede indicar una velocidad distinta para algunos sitios: {'www.revolico.com':2}
+    '''
+    def __init__(self, rate=HOST_REQUESTS_PER_SECOND, capacity=HOST_BURST, rates=None):
+        self.rate = rate
+        self.capacity = capacity
+        self.rates = dict(rates or {})
+        self._buckets = {}
+
+
+    def bucket(self, host):
+        '''Devuelve la cubeta del sitio, creándola la primera vez.'''
+        bucket = self._buckets.get(host)
+        if bucket is None:
+            bucket = TokenBucket(self.rates.get(host, self.rate), self.capacity)
+            self._buckets[host] = bucket
+        return bucket
+
+
+    async def acquire(self, url):
+        '''Espera hasta que el sitio de la URL tenga una ficha disponible y la toma.'''
+        await self.bucket(urlsplit(url).hostname or '').acquire()
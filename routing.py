@@ -0,0 +1,110 @@
+'''Índice de enrutamiento de anuncios a receptores.
+Relaciona cada subcategoría de revolico con el conjunto de receptores que deben recibir
+sus anuncios, según las categorías de SetV+ en las que se registró cada receptor.
+Así, encontrar los receptores de un anuncio cuesta lo mismo que la cantidad de receptores
+que lo deben recibir, y un receptor registrado en categorías que se solapan lo recibe una vez.
+Los receptores con filtro (filters.py) solo reciben los anuncios de sus categorías que lo cumplen.
+Los receptores sin filtro de cada subcategoría se calculan una vez por cambio del índice,
+por lo que enrutar un anuncio no recorre todos los receptores de su subcategoría.
+'''
+__version__ = '1.0'
+__author__ = 'Santiago Orellana Perez'
+__created__ = '18/octubre/2026'
+__tested__ = 'Python 3.10'
+
+from const import SETVMAS_CATEGORIES
+from filters import FilterIndex
+
+# Subcategoría que indica que el receptor recibe todos los anuncios.
+ALL_SUBCATEGORIES = 0
+
+
+class RoutingIndex():
+    '''Índice subcategoría -> receptores, que se actualiza al agregar o quitar receptores.'''
+    def __init__(self, receivers=None, filters=None):
+        self._routes = {}
+        self._categories = {}
+        self._version = 0
+        self._cache = {}
+        self._cacheVersion = None
+        self.filters = FilterIndex()
+        if receivers is not None:
+            self.build(receivers, filters)
+
+
+    def build(self, receivers, filters=None):
+        '''Reconstruye el índice completo a partir de la lista de receptores y, si se indica,
+        del diccionario receptor -> regla de filtro.
+        '''
+        self._routes = {}
+        self._categories = {}
+        self._version += 1
+        for receiver in receivers:
+            self.add_receiver(receiver['id'], receiver['category'])
+        if filters is not None:
+            self.filters.build(filters)
+
+
+    def add_receiver(self, receiverID, category):
+        '''Agrega al índice un receptor registrado en una categoría de SetV+.'''
+        if category not in SETVMAS_CATEGORIES:
+            return False
+        self._categories.setdefault(receiverID, []).append(category)
+        self._version += 1
+        for subcategoryID in SETVMAS_CATEGORIES[category]['revolico_categories_id']:
+            # Se cuenta cuántas categorías del receptor contienen la subcategoría.
+            route = self._routes.setdefault(int(subcategoryID), {})
+            route[receiverID] = route.get(receiverID, 0) + 1
+        return True
+
+
+    def remove_receiver(self, receiverID):
+        '''Quita del índice todas las categorías y el filtro de un receptor.'''
+        self.filters.remove(receiverID)
+        self._version += 1
+        for category in self._categories.pop(receiverID, []):
+            for subcategoryID in SETVMAS_CATEGORIES[category]['revolico_categories_id']:
+                route = self._routes.get(int(subcategoryID))
+                if route is None or receiverID not in route:
+                    continue
+                route[receiverID] -= 1
+                if route[receiverID] <= 0:
+                    del route[receiverID]
+                if not route:
+                    del self._routes[int(subcategoryID)]
+
+
+    def cached_route(self, subcategoryID):
+        '''Devuelve los receptores de la subcategoría y los que de ellos no tienen filtro.
+        Se calculan la primera vez que se piden después de un cambio en los receptores o filtros.
+        '''
+        version = (self._version, self.filters.version)
+        if self._cacheVersion != version:
+            self._cache = {}
+            self._cacheVersion = version
+        subcategoryID = int(subcategoryID)
+        entry = self._cache.get(subcategoryID)
+        if entry is None:
+            receivers = set(self._routes.get(subcategoryID, ()))
+            receivers.update(self._routes.get(ALL_SUBCATEGORIES, ()))
+            unfiltered = frozenset([receiverID for receiverID in receivers if not self.filters.has_filter(receiverID)])
+            entry = (frozenset(receivers), unfiltered)
+            self._cache[subcategoryID] = entry
+        return entry
+
+
+    def route(self, subcategoryID):
+        '''Devuelve el conjunto de receptores que deben recibir los anuncios de la subcategoría.'''
+        return set(self.cached_route(subcategoryID)[0])
+
+
+    def route_ad(self, ad):
+        '''Devuelve el conjunto de receptores que deben recibir el anuncio, según su subcategoría
+        y los filtros de los receptores que los tienen.
+        '''
+        receivers, unfiltered = self.cached_route(ad['subcategoryID'])
+        if len(unfiltered) == len(receivers):
+            return set(unfiltered)
+        matched = self.filters.match(ad) & receivers
+        matched.update(unfiltered)
+        return matched
@@ -0,0 +1,113 @@
+'''Planificador adaptativo del scraping.
+Aprende la relación entre los IDs de los anuncios y su hora de publicación a partir
+de las páginas obtenidas con éxito, predice cuándo el próximo ID tendrá la antigüedad
+necesaria para ser enviado y ajusta el intervalo de consulta entre un mínimo y un máximo.
+Así se consulta más seguido en las horas de mayor publicación y mucho menos de madrugada.
+'''
+__version__ = '1.0'
+__author__ = 'Santiago Orellana Perez'
+__created__ = '18/octubre/2026'
+__tested__ = 'Python 3.10'
+
+import time
+from collections import deque
+
+# Intervalos de consulta en segundos.
+POLL_MIN_SECONDS = 2
+POLL_MAX_SECONDS = 120
+POLL_DEFAULT_SECONDS = 10
+
+# Cantidad de observaciones (ID, hora de publicación) que se utilizan para estimar el ritmo.
+POLL_OBSERVATIONS = 200
+
+# Factor por el que se multiplica el intervalo mínimo por cada consulta que no obtuvo anuncio.
+POLL_BACKOFF = 1.5
+POLL_MAX_MISSES = 12
+
+
+class AdaptivePoller():
+    '''Estima el ritmo de publicación de anuncios (IDs por segundo) y calcula el próximo intervalo.'''
+    def __init__(self, minSeconds=POLL_MIN_SECONDS, maxSeconds=POLL_MAX_SECONDS,
+                 defaultSeconds=POLL_DEFAULT_SECONDS, observations=POLL_OBSERVATIONS):
+        self.minSeconds = minSeconds
+        self.maxSeconds = maxSeconds
+        self.defaultSeconds = defaultSeconds
+        self._observations = deque(maxlen=observations)
+        self._misses = 0
+        self.lastInterval = defaultSeconds
+
+
+    def observe(self, adID, hours, now=None):
+        '''Registra un anuncio obtenido con éxito y su antigüedad en horas.'''
+        if now is None:
+            now = time.time()
+        self._observations.append((int(adID), now - float(hours) * 3600))
+
+
+    def record_tick(self, delivered):
+        '''Registra si la última consulta obtuvo un anuncio para enviar.'''
+        if delivered:
+            self._misses = 0
+        else:
+            self._misses = min(self._misses + 1, POLL_MAX_MISSES)
+
+
+    def get_rate(self):
+        '''Devuelve el ritmo estimado en IDs por segundo mediante mínimos cuadrados, o None.'''
+        count = len(self._observations)
+        if count < 2:
+            return None
+        meanTime = sum([seconds for adID, seconds in self._observations]) / count
+        meanID = sum([adID for adID, seconds in self._observations]) / count
+        covariance = sum([(seconds - meanTime) * (adID - meanID) for adID, seconds in self._observations])
+        variance = sum([(seconds - meanTime) ** 2 for adID, seconds in self._observations])
+        if variance <= 0 or covariance <= 0:
+            return None
+        return covariance / variance
+
+
+    def predict_publish_time(self, adID):
+        '''Predice la hora de publicación (segundos desde epoch) del ID indicado, o None.'''
+        rate = self.get_rate()
+        if rate is None:
+            return None
+        lastID, lastSeconds = max(self._observations)
+        return lastSeconds + (int(adID) - lastID) / rate
+
+
+    def predict_id(self, seconds):
+        '''Predice el ID que se publicó en el momento indicado (segundos desde epoch), o None.'''
+        rate = self.get_rate()
+        if rate is None:
+            return None
+        lastID, lastSeconds = max(self._observations)
+        return int(lastID + (float(seconds) - lastSeconds) * rate)
+
+
+    def next_interval(self, nextID, maxHours, now=None):
+        '''Devuelve los segundos que se deben esperar antes de pedir el ID indicado.'''
+        if now is None:
+            now = time.time()
+        publishTime = self.predict_publish_time(nextID)
+        if publishTime is None:
+            interval = self.defaultSeconds
+        else:
+            interval = publishTime + float(maxHours) * 3600 - now
+        # Si la predicción falla varias veces seguidas, se espera cada vez más.
+        interval = max(interval, self.minSeconds * POLL_BACKOFF ** self._misses)
+        self.lastInterval = min(self.maxSeconds, max(self.minSeconds, interval))
+        return self.lastInterval
+
+
+def next_scrape_interval(poller, nextID, maxHours, holding=None):
+    '''Devuelve los segundos que el scraper debe esperar antes de pedir el ID indicado.
+    Si se retienen los anuncios recientes (holding), el próximo ID se pide apenas se publique
+    y se despierta antes si algún anuncio retenido alcanza la antigüedad necesaria.
+    '''
+    if holding is None:
+        return poller.next_interval(nextID, maxHours)
+    interval = poller.next_interval(nextID, 0)
+    secondsToNext = holding.seconds_to_next()
+    if secondsToNext is not None:
+        interval = max(poller.minSeconds, min(interval, secondsToNext))
+    return interval
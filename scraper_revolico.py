@@ -12,12 +12,22 @@ __author__ = 'Santiago A. Orellana Perez'
 __created__ = '8/mayo/2022'
 __tested__ = 'Python 3.10'
 
-import requests
-from bs4 import BeautifulSoup
+import asyncio
 import random
+from collections import deque
 import time
 import datetime
 import json
+import os
+from rate_limit import TokenBucket
+from http_transport import SessionPool, AsyncSessionPool
+from frontier import FrontierLocator
+from scheduler import next_scrape_interval, POLL_DEFAULT_SECONDS
+from ad_source import AdSource
+from holding import HOLDING_REVALIDATE
+from gap_index import GapIndex
+from ad_parser import extract_next_data, extract_next_data_soup, parse_ad_page, parse_ad_batch, ParserPool
+from metrics import STAGE_SECONDS, HTTP_RESPONSES, SCRAPE_RESULTS
 
 URL_REVOLICO_BASE = 'https://www.revolico.com'
 
@@ -209,6 +219,30 @@ CHANGE_INCREMENT = 100
 
 HOURS_FOR_OLD = 24
 
+# Parametros por defecto para el sondeo concurrente de una ventana de IDs.
+# El scraper sondea una ventana cuando va atrasado al menos PROBE_WINDOW_SIZE IDs.
+PROBE_WINDOW_SIZE = 100
+PROBE_MAX_IN_FLIGHT = 8
+PROBE_REQUESTS_PER_SECOND = 4
+
+TIMESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%S.%f%z"
+
+
+def parse_timestamp(text):
+    '''Convierte una fecha de revolico en un datetime sin zona horaria.
+    Utiliza fromisoformat() que es mucho más rápido que strptime() y solo recurre
+    a este último si el formato no es reconocido. En Python 3.10 fromisoformat() no acepta
+    la Z final de las fechas de revolico, por eso se cambia por +00:00, que es lo mismo.
+    '''
+    if text.endswith('Z'):
+        text = text[:-1] + '+00:00'
+    try:
+        dateTime = datetime.datetime.fromisoformat(text)
+    except ValueError:
+        dateTime = datetime.datetime.strptime(text, TIMESTAMP_FORMAT)
+    return dateTime.replace(tzinfo=None)
+
+
 class ScraperRevolico():
     def __init__(self, maxHours=1, debugMode=True, fileName=None, revolicoAdID=None):
         self.debugMode = debugMode
@@ -225,6 +259,8 @@ class ScraperRevolico():
         self._lastSuccessID = self.revolicoAdID
         self._maxNones = 10
         self._countNones = 0
+        self._transport = None
+        self.parser = None
 
     
     def show_message(self, msg):
@@ -265,82 +301,44 @@ class ScraperRevolico():
             return REVOLICO_BASE_ID
 
 
-    def scrape_page_ad(self, pageAsText):
+    def scrape_page_ad(self, pageAsText, adID=None):
         '''Recibe como texto una pagina de anuncio de revolico e intenta obtener los datos
         del anuncio que se encuentran en un JSON al final de la pagina. Si logra obtener los
         datos, los devuelve en una JSON, de lo contrario devuelve None.
         '''
+        if adID is None:
+            adID = self.revolicoAdID
         try:
-            content = BeautifulSoup(pageAsText, 'html.parser')
-            data = content.find_all(id='__NEXT_DATA__')
-            dataAsJSON = json.loads(data[0].get_text())
-            adTypeKey = 'AdType:{}'.format(dataAsJSON['props']['pageProps']['id'])
-            apollo_state = dataAsJSON['props']['pageProps']['__APOLLO_STATE__']
-            if adTypeKey in apollo_state:
-                resultJSON = {}
-                resultJSON['id'] = self.revolicoAdID
-                resultJSON['viewCount'] = apollo_state[adTypeKey]['viewCount']
-                resultJSON['permalink'] = apollo_state[adTypeKey]['permalink']
-                resultJSON['phone'] = apollo_state[adTypeKey]['phone']
-                resultJSON['title'] = apollo_state[adTypeKey]['title']
-                resultJSON['price'] = apollo_state[adTypeKey]['price']
-                resultJSON['currency'] = apollo_state[adTypeKey]['currency']
-                resultJSON['name'] = apollo_state[adTypeKey]['name']
-                resultJSON['status'] = apollo_state[adTypeKey]['status']
-                resultJSON['isAuto'] = apollo_state[adTypeKey]['isAuto']
-                resultJSON['updatedOnToOrder'] = apollo_state[adTypeKey]['updatedOnToOrder']
-                resultJSON['updatedOnByUser'] = apollo_state[adTypeKey]['updatedOnByUser']
-                try:
-                    keyProvince = apollo_state[adTypeKey]['province']['__ref']
-                    if keyProvince:
-                        resultJSON['provinceID'] = apollo_state[keyProvince]['id']
-                        resultJSON['provinceName'] = apollo_state[keyProvince]['name']
-                except Exception as e:
-                    pass
-                try:
-                    keyMunicipality = apollo_state[adTypeKey]['municipality']['__ref']
-                    if keyMunicipality:
-                        resultJSON['municipalityID'] = apollo_state[keyMunicipality]['id']
-                        resultJSON['municipalityName'] = apollo_state[keyMunicipality]['name']
-                except Exception as e:
-                    pass
-                try:
-                    keySubcategory = apollo_state[adTypeKey]['subcategory']['__ref']
-                    if keySubcategory:
-                        resultJSON['subcategoryID'] = apollo_state[keySubcategory]['id']
-                        resultJSON['subcategoryName'] = apollo_state[keySubcategory]['title']
-                        try:
-                            keyParentCategory = apollo_state[keySubcategory]['parentCategory']['__ref']
-                            if keyParentCategory:
-                                resultJSON['categoryID'] = apollo_state[keyParentCategory]['id']
-                                resultJSON['categoryName'] = apollo_state[keyParentCategory]['title']
-                        except:
-                            pass
-                except:
-                    pass
-                resultJSON['description'] = apollo_state[adTypeKey]['description']
-                resultJSON['imagesCount'] = apollo_state[adTypeKey]['imagesCount']
-                if int(resultJSON['imagesCount']) > 0:
-                    try:
-                        resultJSON['images'] = []
-                        imagesList = apollo_state[adTypeKey]['images']['edges']
-                        if imagesList:
-                            for image in imagesList:
-                                imageKey = image['node']['__ref']
-                                images = {}
-                                if 'high' in apollo_state[imageKey]['urls']:
-                                    images['high'] = apollo_state[imageKey]['urls']['high']
-                                if 'thumb' in apollo_state[imageKey]['urls']:
-                                    images['thumb'] = apollo_state[imageKey]['urls']['thumb']
-                                resultJSON['images'].append(images)
-                    except:
-                        pass
-                return resultJSON
+            return parse_ad_page(pageAsText, adID)
         except Exception as e:
-            self.show_message('ERROR scraping page of ad {}. {}'.format(str(self.revolicoAdID), str(e)))
+            self.show_message('ERROR scraping page of ad {}. {}'.format(str(adID), str(e)))
         return None
 
 
+    def scrape_many(self, pages):
+        '''Igual que scrape_page_ad() pero para una lista de páginas [(ID, página), ...].
+        Si se asignó un ParserPool en parser, las páginas se analizan en varios procesos.
+        Devuelve los datos de cada anuncio (o None) en el mismo orden que las páginas.
+        '''
+        pages = list(pages)
+        with STAGE_SECONDS.time(stage='parse_batch'):
+            if self.parser is None:
+                results = parse_ad_batch(pages)
+            else:
+                results = self.parser.scrape_many(pages)
+        return self.check_parsed(pages, results)
+
+
+    def check_parsed(self, pages, results):
+        '''Muestra los errores de un lote analizado y devuelve solo los datos de los anuncios.'''
+        dataJSON = []
+        for (adID, page), (data, error) in zip(pages, results):
+            if error is not None:
+                self.show_message('ERROR scraping page of ad {}. {}'.format(str(adID), error))
+            dataJSON.append(data)
+        return dataJSON
+
+
     def get_random_url(self, pageID):
         '''Devuelve una URl de revolico seleccionada de manera aleatoria.
         La URL se utiliza para hacer el pedido de una pagina a partir de su ID.
@@ -353,55 +351,122 @@ class ScraperRevolico():
         return url
 
 
+    def get_user_agent(self, userAgent=None):
+        '''Devuelve el agente de usuario indicado o uno aleatorio de la lista.'''
+        if userAgent is None:
+            return random.choice(UA_LIST)
+        return userAgent
+
+
+    def get_transport(self):
+        '''Devuelve las sesiones HTTP persistentes, creándolas la primera vez que se utilizan.'''
+        if self._transport is None:
+            self._transport = SessionPool()
+        return self._transport
+
+
+    def close(self):
+        '''Cierra las sesiones HTTP y sus conexiones.'''
+        if self._transport is not None:
+            self._transport.close()
+            self._transport = None
+
+
+    def process_page(self, pageID, statusCode, content, parsed=False):
+        '''Procesa la respuesta obtenida al pedir la página del ID pasado en parametro.
+        Devuelve el mismo diccionario que get_page(), por lo que puede ser utilizado
+        tanto por la versión sincrónica como por la asincrónica del scraper.
+        Si parsed es True, content contiene los datos del anuncio ya extraídos con scrape_many().
+        '''
+        HTTP_RESPONSES.inc(status=str(statusCode))
+        if statusCode == 200:
+            if parsed:
+                dataJSON = content
+            else:
+                with STAGE_SECONDS.time(stage='parse'):
+                    dataJSON = self.scrape_page_ad(content, pageID)
+            if dataJSON is not None:
+                self.show_message(dataJSON)
+                # Calcula el tiempo en horas de la última actualización anuncio.
+                utc = datetime.datetime.utcnow()
+                dtOnByUser = parse_timestamp(dataJSON['updatedOnByUser'])
+                if dataJSON['updatedOnToOrder'] == dataJSON['updatedOnByUser']:
+                    dtOnToOrder = dtOnByUser
+                else:
+                    dtOnToOrder = parse_timestamp(dataJSON['updatedOnToOrder'])
+                deltaAsHoursOnByUser = (utc - dtOnByUser).total_seconds()/(60*60)
+                deltaAsHoursOnToOrder = (utc - dtOnToOrder).total_seconds()/(60*60)
+                deltaAsHours = abs(max([deltaAsHoursOnByUser, deltaAsHoursOnToOrder]))
+                # Conforma etiquetas con la categoría y subcategorías, eliminando redundancias y palabras innnecesarias.
+                words = '{}-{}'.format(dataJSON['subcategoryName'], dataJSON['categoryName']).lower()
+                words = words.replace('autos', 'transporte')
+                for string in ['/', ' a ', ' de ', ' en la ']:
+                    words = words.replace(string, '-')
+                words = words.replace(' ', '-')
+                notShow = ['compra', 'venta', 'otros', 'servicios', 'empleo']
+                tags = [tag for tag in words.rsplit('-') if tag not in notShow and tag != '']
+                return {'ad':dataJSON, 'hours':deltaAsHours, 'tags':tags}
+            else:
+                self.show_message('WARNING no ad page for ID {}'.format(pageID))
+                SCRAPE_RESULTS.inc(result='miss')
+                return {'ad':None}
+        elif statusCode == 404:
+            # El ID no tiene página: es un hueco del espacio de IDs y no un error que se deba
+            # reintentar, así la búsqueda de la frontera y el cursor lo pueden saltar.
+            self.show_message('WARNING no ad page for ID {}'.format(pageID))
+            SCRAPE_RESULTS.inc(result='miss')
+            return {'ad':None}
+        else:
+            self.show_message('ERROR getting ad page. Type:{}'.format(statusCode))
+            return {'error':statusCode}
+
+
+    def process_many(self, responses, dataJSON=None):
+        '''Procesa una lista de respuestas [(ID, código de estado, contenido), ...] analizando
+        juntas todas las páginas con scrape_many(). Si ya se analizaron, sus datos se pasan
+        en dataJSON en el mismo orden que las respuestas con código 200.
+        Devuelve los resultados en el mismo orden que las respuestas.
+        '''
+        responses = list(responses)
+        if dataJSON is None:
+            dataJSON = self.scrape_many([(pageID, content) for pageID, statusCode, content in responses if statusCode == 200])
+        parsed = iter(dataJSON)
+        results = []
+        for pageID, statusCode, content in responses:
+            try:
+                if statusCode == 0:
+                    HTTP_RESPONSES.inc(status='error')
+                    results.append({'error':0})
+                elif statusCode == 200:
+                    results.append(self.process_page(pageID, statusCode, next(parsed), parsed=True))
+                else:
+                    results.append(self.process_page(pageID, statusCode, content))
+            except Exception as e:
+                self.show_message('ERROR processing ad page {}. {}'.format(pageID, str(e)))
+                results.append({'error':0})
+        return results
+
+
     def get_page(self, pageID, userAgent=None):
         '''Pide la página del ID pasado en parametro y devuelve sus datos como JSON en 'ad'.
         Si la página del ID indicado no existe, entonces devuelve None en 'ad'.
         Si se produce un error, devuelve el tipo de error en 'error'.
         '''
-        if userAgent is None:
-            header = {'user-agent': random.choice(UA_LIST)}
-        else:
-            header = {'user-agent': userAgent}
         try:
-            page = requests.get(self.get_random_url(pageID), headers=header)
-            if page.status_code == 200:
-                dataJSON = self.scrape_page_ad(page.content)
-                if dataJSON is not None:
-                    self.show_message(dataJSON)
-                    # Calcula el tiempo en horas de la última actualización anuncio.
-                    utc = datetime.datetime.utcnow()
-                    dtOnByUser = datetime.datetime.strptime(dataJSON['updatedOnByUser'], "%Y-%m-%dT%H:%M:%S.%f%z")
-                    dtOnToOrder = datetime.datetime.strptime(dataJSON['updatedOnToOrder'], "%Y-%m-%dT%H:%M:%S.%f%z")
-                    deltaAsHoursOnByUser = (utc - dtOnByUser.replace(tzinfo=None)).total_seconds()/(60*60)
-                    deltaAsHoursOnToOrder = (utc - dtOnToOrder.replace(tzinfo=None)).total_seconds()/(60*60)
-                    deltaAsHours = abs(max([deltaAsHoursOnByUser, deltaAsHoursOnToOrder]))
-                    # Conforma etiquetas con la categoría y subcategorías, eliminando redundancias y palabras innnecesarias.
-                    words = '{}-{}'.format(dataJSON['subcategoryName'], dataJSON['categoryName']).lower()
-                    words = words.replace('autos', 'transporte')
-                    for string in ['/', ' a ', ' de ', ' en la ']:
-                        words = words.replace(string, '-')
-                    words = words.replace(' ', '-')
-                    notShow = ['compra', 'venta', 'otros', 'servicios', 'empleo']
-                    tags = [tag for tag in words.rsplit('-') if tag not in notShow and tag != '']
-                    return {'ad':dataJSON, 'hours':deltaAsHours, 'tags':tags}
-                else:
-                    self.show_message('WARNING no ad page for ID {}'.format(pageID))
-                    return {'ad':None}
-            else:
-                self.show_message('ERROR getting ad page. Type:{}'.format(page.status_code))
-                return {'error':page.status_code}
+            with STAGE_SECONDS.time(stage='fetch'):
+                page = self.get_transport().get(self.get_random_url(pageID), self.get_user_agent(userAgent))
+            return self.process_page(pageID, page.status_code, page.content)
         except Exception as e:
             self.show_message('ERROR getting ad page. Type:0 Msg:{}'.format(str(e)))
+            HTTP_RESPONSES.inc(status='error')
             return {'error':0}
 
-        
-    def get_next_page(self, useSleep=True, ignoreIfAuto=True, userAgent=None):
-        '''Permite obtener la página siguiente sin tener que indicar el ID.
-        Si la página del ID indicado se encuentra, devuelve sus datos como JSON en 'ad'.
-        Si la página del ID indicado no existe, entonces devuelve None en 'ad'.
-        Si se produce un error, devuelve el tipo de error en 'error'.
+
+    def update_cursor(self, result, ignoreIfAuto=True):
+        '''Actualiza el ID del próximo anuncio a pedir según el resultado obtenido.
+        Devuelve el resultado que debe entregar get_next_page() y si se debe hacer
+        una pausa antes de volver a pedir una página.
         '''
-        result = self.get_page(self.revolicoAdID, userAgent)
         if 'ad' in result:
             if result['ad'] is not None:
                 self._countNones = 0
@@ -415,19 +480,21 @@ class ScraperRevolico():
                         self.show_message('WARNING ID not saved on file.')
                     self.revolicoAdID += int(self._increment)
                     self._increment = round(self._increment * random.choice([1.5, 1.6, 1.7, 1.8, 1.9, 2]))
+                    SCRAPE_RESULTS.inc(result='ad')
                     self.show_message('DATA')
                     self.show_message(json.dumps(result, indent=4))
                     if ignoreIfAuto:
                         if result['ad']['isAuto'] == True:
-                            return {'ad':None}
-                    return result
+                            return {'ad':None}, False
+                    return result, False
                 else:
                     # El anuncio se considera demasiado actual por lo que no se debe devolver ahora.
                     # No se debe incrementar el ID, pues el anuncio debe ser mostrado luego.
                     # Los siguientes incrementos deben realizarse
                     self._increment = int(1)
                     self.revolicoAdID = self._lastSuccessID + 1
-                    return {'ad':None}
+                    SCRAPE_RESULTS.inc(result='too_fresh')
+                    return {'ad':None}, False
                 
             elif result['ad'] is None:
                 if self.revolicoAdID == self._lastSuccessID:
@@ -437,7 +504,7 @@ class ScraperRevolico():
                     # Agrega un nuevo None al contador de Nones para saber si vienen de forma consecutiva.
                     self.revolicoAdID += int(self._increment)
                     self._countNones += 1
-                    return result
+                    return result, False
                 else:
                     # Si ya son muchos Nones, entiende que no es casual, que el ID está
                     # fuera del rango y debe regresar al último ID conocido que estaba
@@ -445,11 +512,387 @@ class ScraperRevolico():
                     self.revolicoAdID = int(self._lastSuccessID)
                     self._countNones = 0
                     self._increment = int(1)
-                    return result
-        if useSleep:
-            time.sleep(random.choice(SLEEP_TIMES))
-        return result
+                    return result, False
+        return result, True
+
         
+    def get_next_page(self, useSleep=True, ignoreIfAuto=True, userAgent=None):
+        '''Permite obtener la página siguiente sin tener que indicar el ID.
+        Si la página del ID indicado se encuentra, devuelve sus datos como JSON en 'ad'.
+        Si la página del ID indicado no existe, entonces devuelve None en 'ad'.
+        Si se produce un error, devuelve el tipo de error en 'error'.
+        '''
+        result, needSleep = self.update_cursor(self.get_page(self.revolicoAdID, userAgent), ignoreIfAuto)
+        if useSleep and needSleep:
+            with STAGE_SECONDS.time(stage='sleep'):
+                time.sleep(random.choice(SLEEP_TIMES))
+        return result
+
+
+
+class AsyncScraperRevolico(ScraperRevolico, AdSource):
+    '''Versión asincrónica del scraper para ser utilizada dentro del bucle de eventos del bot.
+    Los pedidos se hacen con un cliente HTTP no bloqueante y las pausas con asyncio.sleep(),
+    por lo que el bot puede seguir atendiendo comandos mientras se obtiene una página.
+    En lugar de avanzar con incrementos aleatorios, localiza la frontera de anuncios
+    con FrontierLocator y luego avanza de uno en uno.
+    Si se le asigna un HoldingHeap en holding, los anuncios demasiado recientes se retienen
+    allí hasta que tengan la antigüedad necesaria y el cursor sigue avanzando, en lugar
+    de volver a descargar sus páginas más tarde.
+    Los IDs que resultan vacíos se recuerdan en un GapIndex y no se vuelven a pedir hasta
+    que vence su tiempo en el índice.
+    Si shardCount es mayor que 1, el cursor solo pasa por los IDs cuyo resto al dividirlos
+    entre shardCount es shard, de forma que varias instancias se reparten el espacio de IDs.
+    Si el planificador estima que el cursor va atrasado una ventana o más (por ejemplo, al
+    iniciar o en las horas de más publicación), se pone al día pidiendo toda una ventana de
+    IDs a la vez con probe_window() y entrega sus anuncios uno por uno sin esperar.
+    Es la fuente de revolico.com (AdSource) que ejecuta el motor de ingestión.
+    '''
+    sourceName = 'revolico'
+    sourceNumber = 0
+
+    def __init__(self, maxHours=1, debugMode=True, fileName=None, revolicoAdID=None):
+        super().__init__(maxHours, debugMode, fileName, revolicoAdID)
+        self._frontierKnown = False
+        self.frontierProbes = []
+        self.poller = None
+        self.holding = None
+        self.revalidateHeld = HOLDING_REVALIDATE
+        self.gaps = GapIndex()
+        self._pendingGaps = set()
+        self._newIDOnTick = False
+        self._catchUp = deque()
+        self.shardCount = 1
+        self.shard = 0
+
+
+    def owns(self, pageID):
+        '''Dice si el ID pertenece al fragmento del espacio de IDs de este scraper.'''
+        return pageID % self.shardCount == self.shard
+
+
+    def align(self, pageID):
+        '''Devuelve el primer ID del fragmento que es mayor o igual que el indicado.'''
+        return pageID + (self.shard - pageID) % self.shardCount
+
+
+    def next_id(self, pageID):
+        '''Devuelve el ID del fragmento que sigue al indicado.'''
+        return self.align(pageID + 1)
+
+
+    def get_transport(self):
+        '''Devuelve los clientes HTTP asincrónicos, creándolos la primera vez que se utilizan.'''
+        if self._transport is None:
+            self._transport = AsyncSessionPool()
+        return self._transport
+
+
+    async def close(self):
+        '''Cierra los clientes HTTP y sus conexiones, salvo si son del motor de ingestión.'''
+        if self._transport is not None and not self.sharedTransport:
+            await self._transport.close()
+        self._transport = None
+
+
+    async def next_ad(self):
+        '''Implementa AdSource.next_ad() con get_next_page().'''
+        result = self.normalize(await self.get_next_page())
+        if self.poller is not None:
+            # Un anuncio retenido o de auto también es un ID nuevo: la consulta no fue antes de tiempo.
+            self.poller.record_tick(result.get('ad') is not None or self._newIDOnTick)
+        return result
+
+
+    def next_interval(self):
+        '''Implementa AdSource.next_interval() con el planificador adaptativo, si tiene uno.'''
+        if len(self._catchUp) > 0:
+            return 0
+        if self.poller is None:
+            return POLL_DEFAULT_SECONDS
+        return next_scrape_interval(self.poller, self.revolicoAdID, self.maxHours, self.holding)
+
+
+    def record_gaps(self, pageID, result):
+        '''Anota los IDs vacíos. Un ID vacío solo pasa al índice cuando se encuentra un anuncio
+        con un ID mayor, pues hasta entonces puede ser un ID que todavía no se ha publicado.
+        Si el ID resulta tener un anuncio, deja de considerarse vacío.
+        '''
+        if result.get('ad') is None:
+            self._pendingGaps.add(pageID)
+            # Los IDs que quedaron detrás de la ventana del cursor sin confirmarse se olvidan.
+            oldestID = self.revolicoAdID - PROBE_WINDOW_SIZE * self.shardCount
+            for gapID in [gapID for gapID in self._pendingGaps if gapID < oldestID]:
+                self._pendingGaps.discard(gapID)
+        else:
+            self._pendingGaps.discard(pageID)
+            self.gaps.discard(pageID)
+            for gapID in [gapID for gapID in self._pendingGaps if gapID < pageID]:
+                self.gaps.add(gapID)
+                self._pendingGaps.discard(gapID)
+
+
+    async def get_page(self, pageID, userAgent=None):
+        '''Igual que ScraperRevolico.get_page() pero sin bloquear el bucle de eventos.
+        Si se sabe que el ID está vacío, devuelve None en 'ad' sin pedir la página.
+        '''
+        if self.gaps.contains(pageID):
+            SCRAPE_RESULTS.inc(result='gap_skip')
+            return {'ad':None}
+        return await self.fetch_page(pageID, userAgent)
+
+
+    async def fetch_page(self, pageID, userAgent=None):
+        '''Pide la página del ID sin consultar el índice de IDs vacíos.
+        La página se analiza en un hilo aparte para no detener el bucle de eventos.
+        '''
+        try:
+            with STAGE_SECONDS.time(stage='fetch'):
+                page = await self.get_transport().get(self.get_random_url(pageID), self.get_user_agent(userAgent))
+            if page.status_code == 200:
+                with STAGE_SECONDS.time(stage='parse'):
+                    dataJSON = await asyncio.to_thread(self.scrape_page_ad, page.content, pageID)
+                result = self.process_page(pageID, page.status_code, dataJSON, parsed=True)
+            else:
+                result = self.process_page(pageID, page.status_code, page.content)
+            self.accept_result(pageID, result)
+            return result
+        except Exception as e:
+            self.show_message('ERROR getting ad page. Type:0 Msg:{}'.format(str(e)))
+            HTTP_RESPONSES.inc(status='error')
+            return {'error':0}
+
+
+    async def fetch_raw(self, pageID, userAgent=None):
+        '''Pide la página del ID y devuelve (ID, código de estado, contenido) sin analizarla.
+        Si el pedido falla, el código de estado es 0 (process_many() lo devuelve como error).
+        '''
+        try:
+            with STAGE_SECONDS.time(stage='fetch'):
+                page = await self.get_transport().get(self.get_random_url(pageID), self.get_user_agent(userAgent))
+            return pageID, page.status_code, page.content
+        except Exception as e:
+            self.show_message('ERROR getting ad page. Type:0 Msg:{}'.format(str(e)))
+            return pageID, 0, None
+
+
+    def accept_result(self, pageID, result):
+        '''Informa el resultado de una página al planificador y al índice de IDs vacíos.'''
+        if self.poller is not None and result.get('ad') is not None:
+            self.poller.observe(pageID, result['hours'])
+        if 'error' not in result:
+            self.record_gaps(pageID, result)
+
+
+    async def scrape_many(self, pages):
+        '''Igual que ScraperRevolico.scrape_many() pero sin bloquear el bucle de eventos
+        mientras los procesos de parser analizan las páginas. Sin parser, se analizan en un hilo.
+        '''
+        pages = list(pages)
+        with STAGE_SECONDS.time(stage='parse_batch'):
+            if self.parser is None:
+                results = await asyncio.to_thread(parse_ad_batch, pages)
+            else:
+                results = await self.parser.scrape_many_async(pages)
+        return self.check_parsed(pages, results)
+
+
+    async def process_many(self, responses):
+        '''Igual que ScraperRevolico.process_many() pero analizando las páginas sin bloquear
+        el bucle de eventos. Los pedidos fallidos (código 0) se devuelven como error.
+        '''
+        responses = list(responses)
+        dataJSON = await self.scrape_many([(pageID, content) for pageID, statusCode, content in responses if statusCode == 200])
+        return super().process_many(responses, dataJSON)
+
+
+    async def page_exists(self, pageID, userAgent=None):
+        '''Comprueba con un pedido HEAD, sin descargar la página, que el anuncio sigue publicado.
+        Si no se puede comprobar, supone que sí.
+        '''
+        try:
+            response = await self.get_transport().head(self.get_random_url(pageID), self.get_user_agent(userAgent))
+            return response.status_code != 404
+        except Exception as e:
+            self.show_message('WARNING page {} not revalidated. {}'.format(pageID, str(e)))
+            return True
+
+
+    async def release_held(self, userAgent=None):
+        '''Devuelve el próximo anuncio retenido que ya tiene la antigüedad necesaria, o None.'''
+        while True:
+            result = self.holding.pop_ready()
+            if result is None:
+                return None
+            if self.revalidateHeld and not await self.page_exists(result['ad']['id'], userAgent):
+                SCRAPE_RESULTS.inc(result='expired')
+                continue
+            SCRAPE_RESULTS.inc(result='released')
+            return result
+
+
+    async def locate_frontier(self, userAgent=None):
+        '''Localiza la frontera de anuncios a partir del ID actual y coloca allí el cursor.
+        Devuelve el resultado del anuncio de la frontera o None si no se pudo localizar.
+        '''
+        locator = FrontierLocator(lambda pageID: self.get_page(pageID, userAgent))
+        frontier = await locator.locate(self.revolicoAdID, self.maxHours)
+        if frontier is None:
+            self.show_message('WARNING frontier not located after {} probes'.format(locator.probes))
+            return None
+        self.frontierProbes.append(frontier['probes'])
+        self.show_message('INFO frontier {} located with {} probes'.format(frontier['id'], frontier['probes']))
+        self._frontierKnown = True
+        return frontier['result']
+
+
+    def advance_cursor(self, result, ignoreIfAuto=True):
+        '''Avanza el cursor de uno en uno a partir de la frontera.
+        Devuelve el resultado que debe entregar get_next_page() y si se debe hacer
+        una pausa antes de volver a pedir una página.
+        '''
+        if 'ad' not in result:
+            return result, True
+        if result['ad'] is None:
+            self._countNones += 1
+            if self._countNones < self._maxNones:
+                # Es un hueco en el espacio de IDs, se salta.
+                self.revolicoAdID = self.next_id(self.revolicoAdID)
+            elif self.holding is not None:
+                # Con los anuncios recientes retenidos, el cursor está en el último ID publicado.
+                # Se espera allí a que aparezcan IDs nuevos.
+                self.revolicoAdID = self.next_id(int(self._lastSuccessID))
+                self._countNones = 0
+            else:
+                # Demasiados IDs vacíos: hay que volver a localizar la frontera.
+                self.revolicoAdID = int(self._lastSuccessID)
+                self._countNones = 0
+                self._frontierKnown = False
+            return result, False
+        self._countNones = 0
+        if float(result['hours']) <= self.maxHours and self.holding is not None:
+            # El anuncio es demasiado reciente, se retiene hasta que tenga la antigüedad necesaria.
+            if not (ignoreIfAuto and result['ad']['isAuto'] == True):
+                self.holding.push(result, self.maxHours)
+                SCRAPE_RESULTS.inc(result='held')
+            self._newIDOnTick = True
+            self._lastSuccessID = result['ad']['id']
+            if not self.id_to_file(self._lastSuccessID):
+                self.show_message('WARNING ID not saved on file.')
+            self.revolicoAdID = self.next_id(self._lastSuccessID)
+            return {'ad':None}, False
+        if float(result['hours']) <= self.maxHours:
+            # El anuncio es demasiado reciente, se vuelve a pedir más tarde.
+            # Los que quedan de la ventana de puesta al día son aún más recientes.
+            self._catchUp.clear()
+            self.revolicoAdID = self.next_id(self._lastSuccessID)
+            SCRAPE_RESULTS.inc(result='too_fresh')
+            return {'ad':None}, False
+        self._lastSuccessID = result['ad']['id']
+        self._newIDOnTick = True
+        SCRAPE_RESULTS.inc(result='ad')
+        if not self.id_to_file(self._lastSuccessID):
+            self.show_message('WARNING ID not saved on file.')
+        self.revolicoAdID = self.next_id(self._lastSuccessID)
+        if ignoreIfAuto and result['ad']['isAuto'] == True:
+            return {'ad':None}, False
+        return result, False
+
+
+    async def get_next_page(self, useSleep=True, ignoreIfAuto=True, userAgent=None):
+        '''Igual que ScraperRevolico.get_next_page() pero sin bloquear el bucle de eventos.
+        Si hay anuncios retenidos que ya tienen la antigüedad necesaria, devuelve uno de ellos
+        sin pedir ninguna página.
+        '''
+        self._newIDOnTick = False
+        if self.holding is not None:
+            result = await self.release_held(userAgent)
+            if result is not None:
+                return result
+        if not self._frontierKnown:
+            result = await self.locate_frontier(userAgent)
+            if result is None:
+                result = {'error':0}
+            else:
+                self.revolicoAdID = result['ad']['id']
+                if not self.owns(self.revolicoAdID):
+                    # El anuncio de la frontera es de otro fragmento, se sigue desde el próximo ID propio.
+                    self._lastSuccessID = self.revolicoAdID
+                    self.revolicoAdID = self.next_id(self._lastSuccessID)
+                    return {'ad':None}
+        else:
+            if len(self._catchUp) == 0 and self.ids_behind() >= PROBE_WINDOW_SIZE * self.shardCount:
+                # Va atrasado: se pide de una vez la ventana que empieza en el cursor.
+                centerID = self.revolicoAdID + PROBE_WINDOW_SIZE * self.shardCount // 2
+                self._catchUp.extend(await self.probe_window(centerID, userAgent=userAgent))
+            if len(self._catchUp) > 0:
+                result = self._catchUp.popleft()
+            else:
+                # Salta los IDs que se sabe que están vacíos sin gastar pedidos ni ciclos.
+                while self.gaps.contains(self.revolicoAdID):
+                    SCRAPE_RESULTS.inc(result='gap_skip')
+                    self.revolicoAdID = self.next_id(self.revolicoAdID)
+                result = await self.fetch_page(self.revolicoAdID, userAgent)
+        result, needSleep = self.advance_cursor(result, ignoreIfAuto)
+        if useSleep and needSleep:
+            with STAGE_SECONDS.time(stage='sleep'):
+                await asyncio.sleep(random.choice(SLEEP_TIMES))
+        return result
+
+
+    def ids_behind(self, now=None):
+        '''Estima cuántos IDs que ya se pueden pedir hay entre el cursor y el último publicado
+        con la antigüedad necesaria. Devuelve 0 si el planificador no lo puede estimar.
+        '''
+        if self.poller is None:
+            return 0
+        if now is None:
+            now = time.time()
+        # Con los anuncios recientes retenidos, sirve cualquier ID ya publicado.
+        maxHours = 0 if self.holding is not None else self.maxHours
+        lastID = self.poller.predict_id(now - float(maxHours) * 3600)
+        if lastID is None:
+            return 0
+        return max(0, lastID - self.revolicoAdID)
+
+
+    async def probe_window(self, centerID=None, windowSize=PROBE_WINDOW_SIZE, maxInFlight=PROBE_MAX_IN_FLIGHT,
+                           requestsPerSecond=PROBE_REQUESTS_PER_SECOND, userAgent=None):
+        '''Pide de forma concurrente todas las páginas de una ventana de IDs alrededor de centerID.
+        Nunca hay más de maxInFlight pedidos en curso ni se hacen más de requestsPerSecond pedidos
+        por segundo. Devuelve, ordenados por ID, los resultados que contienen un anuncio válido.
+        No modifica el ID del próximo anuncio a pedir. Con fragmentos, la ventana tiene
+        windowSize IDs del fragmento y no pide los de los demás.
+        '''
+        if centerID is None:
+            centerID = self.revolicoAdID
+        width = int(windowSize) * self.shardCount
+        firstID = max(0, int(centerID) - width // 2)
+        semaphore = asyncio.Semaphore(maxInFlight)
+        budget = TokenBucket(requestsPerSecond)
+
+        async def probe(pageID):
+            async with semaphore:
+                await budget.acquire()
+                return await self.fetch_raw(pageID, userAgent)
+
+        # Primero se descargan todas las páginas y luego se analizan juntas con scrape_many().
+        pagesID = []
+        for pageID in range(firstID, firstID + width):
+            if not self.owns(pageID):
+                continue
+            if self.gaps.contains(pageID):
+                SCRAPE_RESULTS.inc(result='gap_skip')
+            else:
+                pagesID.append(pageID)
+        responses = await asyncio.gather(*[probe(pageID) for pageID in pagesID])
+        results = await self.process_many(responses)
+        for pageID, result in zip(pagesID, results):
+            self.accept_result(pageID, result)
+        ads = [result for result in results if result.get('ad') is not None]
+        ads.sort(key=lambda result: result['ad']['id'])
+        return ads
+
 
 
 
@@ -463,7 +906,26 @@ def test_class():
         if data['ad'] is not None:
             print(json.dumps(data, indent=4))
 
+
+
+def bench_extract_next_data(folder, repeat=10):
+    '''Compara la velocidad de extract_next_data() y extract_next_data_soup()
+    sobre las páginas grabadas (*.html) que se encuentran en la carpeta indicada.
+    '''
+    pages = [open(os.path.join(folder, name), 'rb').read() for name in sorted(os.listdir(folder)) if name.endswith('.html')]
+    if len(pages) == 0:
+        print('No recorded pages in', folder)
+        return
+    for extractor in [extract_next_data_soup, extract_next_data]:
+        start = time.perf_counter()
+        for n in range(repeat):
+            for page in pages:
+                extractor(page)
+        seconds = time.perf_counter() - start
+        print('{}: {} pages/s'.format(extractor.__name__, round(len(pages) * repeat / seconds, 1)))
+
 #test_class()
+#bench_extract_next_data('./pages')
 
 
 
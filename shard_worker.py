@@ -0,0 +1,375 @@
+'''Scraping repartido entre varias instancias.
+El espacio de IDs de revolico se divide en SHARD_COUNT fragmentos: el fragmento k tiene
+los IDs cuyo resto al dividirlos entre SHARD_COUNT es k. Cada proceso trabajador toma
+concesiones sobre algunos fragmentos en un fichero SQLite compartido, las renueva mientras
+esté vivo y recorre con un scraper los IDs de cada fragmento que posee. Si un trabajador
+se cae, sus concesiones vencen y los demás toman sus fragmentos, continuando desde el
+último ID que guardó y con sus anuncios retenidos, que se guardan en el mismo fichero de
+concesiones. Todos los trabajadores deben ejecutarse en la misma máquina, pues comparten
+los ficheros SQLite de concesiones, cola de envíos y receptores, y SQLite no es fiable
+sobre sistemas de ficheros de red. Los trabajadores se reparten los fragmentos por partes
+iguales según cuántos estén vivos.
+Los anuncios se agregan a la cola de envíos compartida; el bot los envía desde allí y
+descarta los repetidos, por lo que un anuncio que dos trabajadores obtengan mientras un
+fragmento cambia de dueño se envía una sola vez. Para usarlo, SCRAPE_IN_BOT debe ser
+False en adfiller_bot.py.
+
+Uso: python shard_worker.py --shards 4 --worker-id servidor1
+'''
+__version__ = '1.0'
+__author__ = 'Santiago Orellana Perez'
+__created__ = '18/octubre/2026'
+__tested__ = 'Python 3.10'
+
+import os
+import time
+import socket
+import sqlite3
+import asyncio
+import argparse
+from scraper_revolico import AsyncScraperRevolico, REVOLICO_BASE_ID
+from scheduler import AdaptivePoller, POLL_DEFAULT_SECONDS
+from rate_limit import HostBudgets
+from http_transport import AsyncSessionPool
+from holding import HoldingHeap
+from routing import RoutingIndex
+from state_store import StateStore
+from delivery_queue import DeliveryQueue, DELIVERY_QUEUE_MAX_DEPTH
+from ad_index import AdIndex
+from data_out import enqueue_messages_ad, to_cmd
+
+FILE_SHARDS = './shards.db'
+
+# Tabla del fichero de concesiones con los anuncios retenidos de cada fragmento.
+HOLDING_TABLE_PATTERN = 'held_shard_{}'
+SHARD_COUNT = 4
+
+# Segundos que dura una concesión sin renovarse. Se renueva cada tercio de ese tiempo.
+SHARD_LEASE_SECONDS = 60
+
+# Segundos entre recargas de la lista de receptores desde el almacén de estado.
+SHARD_RELOAD_SECONDS = 60
+
+SHARD_MAX_HOURS = 0.5
+
+
+class ShardLeases():
+    '''Concesiones de los fragmentos del espacio de IDs guardadas en SQLite.'''
+    def __init__(self, fileName=FILE_SHARDS, shardCount=None, workerID=None, leaseSeconds=SHARD_LEASE_SECONDS):
+        self.fileName = fileName
+        self.leaseSeconds = leaseSeconds
+        if workerID is None:
+            workerID = '{}:{}'.format(socket.gethostname(), os.getpid())
+        self.workerID = str(workerID)
+        self.connection = sqlite3.connect(fileName, isolation_level=None)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.execute('''CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL)''')
+        self.connection.execute('''CREATE TABLE IF NOT EXISTS shards (
+            shard INTEGER PRIMARY KEY,
+            owner TEXT,
+            lease_until REAL NOT NULL DEFAULT 0,
+            last_id INTEGER)''')
+        self.connection.execute('''CREATE TABLE IF NOT EXISTS workers (
+            worker_id TEXT PRIMARY KEY,
+            seen REAL NOT NULL)''')
+        # La cantidad de fragmentos se fija al crear el fichero y no se puede cambiar después,
+        # pues cambiaría a qué fragmento pertenece cada ID.
+        with self.connection:
+            self.connection.execute('BEGIN IMMEDIATE')
+            self.connection.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('shard_count', ?)",
+                                    (str(shardCount or SHARD_COUNT),))
+            self.shardCount = int(self.connection.execute("SELECT value FROM meta WHERE key = 'shard_count'").fetchone()[0])
+            if shardCount is not None and shardCount != self.shardCount:
+                raise ValueError('The file {} has {} shards, not {}.'.format(fileName, self.shardCount, shardCount))
+            self.connection.executemany('INSERT OR IGNORE INTO shards (shard) VALUES (?)',
+                                        [(shard,) for shard in range(self.shardCount)])
+
+
+    def heartbeat(self, now=None):
+        '''Registra que este trabajador sigue vivo, olvida a los que dejaron de avisar
+        y devuelve la cantidad de trabajadores vivos.
+        '''
+        if now is None:
+            now = time.time()
+        with self.connection:
+            self.connection.execute('BEGIN IMMEDIATE')
+            self.connection.execute('INSERT OR REPLACE INTO workers (worker_id, seen) VALUES (?, ?)', (self.workerID, now))
+            self.connection.execute('DELETE FROM workers WHERE seen < ?', (now - self.leaseSeconds,))
+            return self.connection.execute('SELECT COUNT(*) FROM workers').fetchone()[0]
+
+
+    def fair_share(self, workers):
+        '''Devuelve cuántos fragmentos le corresponden a cada trabajador.'''
+        return -(-self.shardCount // max(1, workers))
+
+
+    def renew(self, shards, now=None):
+        '''Extiende las concesiones de los fragmentos indicados.
+        Devuelve los que siguen siendo de este trabajador.
+        '''
+        if now is None:
+            now = time.time()
+        owned = []
+        with self.connection:
+            self.connection.execute('BEGIN IMMEDIATE')
+            for shard in shards:
+                cursor = self.connection.execute('UPDATE shards SET lease_until = ? WHERE shard = ? AND owner = ?',
+                                                 (now + self.leaseSeconds, shard, self.workerID))
+                if cursor.rowcount > 0:
+                    owned.append(shard)
+        return owned
+
+
+    def acquire(self, limit, now=None):
+        '''Toma hasta 'limit' fragmentos libres o cuya concesión venció porque su dueño
+        dejó de renovarla. Devuelve la lista de (fragmento, dueño anterior).
+        '''
+        if now is None:
+            now = time.time()
+        if limit <= 0:
+            return []
+        with self.connection:
+            self.connection.execute('BEGIN IMMEDIATE')
+            rows = self.connection.execute(
+                '''SELECT shard, owner FROM shards WHERE owner IS NULL OR lease_until < ?
+                   ORDER BY lease_until, shard LIMIT ?''', (now, limit)).fetchall()
+            self.connection.executemany('UPDATE shards SET owner = ?, lease_until = ? WHERE shard = ?',
+                                        [(self.workerID, now + self.leaseSeconds, shard) for shard, owner in rows])
+        return rows
+
+
+    def release(self, shards):
+        '''Deja libres los fragmentos indicados para que otro trabajador los tome.'''
+        with self.connection:
+            self.connection.execute('BEGIN IMMEDIATE')
+            self.connection.executemany('UPDATE shards SET owner = NULL, lease_until = 0 WHERE shard = ? AND owner = ?',
+                                        [(shard, self.workerID) for shard in shards])
+
+
+    def last_id(self, shard):
+        '''Devuelve el último ID guardado del fragmento, o None.'''
+        row = self.connection.execute('SELECT last_id FROM shards WHERE shard = ?', (shard,)).fetchone()
+        return None if row is None else row[0]
+
+
+    def save_last_id(self, shard, value):
+        '''Guarda el último ID del fragmento. Solo lo guarda el dueño de la concesión,
+        así un trabajador que perdió el fragmento no pisa el avance del nuevo dueño.
+        '''
+        with self.connection:
+            self.connection.execute('BEGIN IMMEDIATE')
+            cursor = self.connection.execute('UPDATE shards SET last_id = ? WHERE shard = ? AND owner = ?',
+                                             (int(value), shard, self.workerID))
+            return cursor.rowcount > 0
+
+
+    def status(self, now=None):
+        '''Devuelve la lista de fragmentos con su dueño, si la concesión está vigente y su último ID.'''
+        if now is None:
+            now = time.time()
+        rows = self.connection.execute('SELECT shard, owner, lease_until, last_id FROM shards ORDER BY shard').fetchall()
+        return [{'shard':shard, 'owner':owner, 'alive':owner is not None and leaseUntil >= now, 'lastID':lastID}
+                for shard, owner, leaseUntil, lastID in rows]
+
+
+    def close(self):
+        self.connection.close()
+
+
+
+class SharedFrontier():
+    '''Frontera de anuncios que comparten los scrapers de los fragmentos de un trabajador.
+    La frontera es la misma para todos los fragmentos, así que se localiza una sola vez.
+    '''
+    def __init__(self):
+        self.result = None
+        self.lock = asyncio.Lock()
+
+
+
+class ShardScraper(AsyncScraperRevolico):
+    '''Scraper de un fragmento. Guarda el último ID en las concesiones en lugar de un fichero.
+    Si se le asigna un SharedFrontier en sharedFrontier, utiliza la frontera que ya localizó
+    otro fragmento mientras esté por delante de su cursor.
+    '''
+    def __init__(self, leases, shard, maxHours=1, debugMode=True):
+        self.leases = leases
+        lastID = leases.last_id(shard)
+        super().__init__(maxHours, debugMode, None, REVOLICO_BASE_ID if lastID is None else int(lastID))
+        self.shardCount = leases.shardCount
+        self.shard = shard
+        self.sharedFrontier = None
+
+
+    async def locate_frontier(self, userAgent=None):
+        '''Igual que AsyncScraperRevolico.locate_frontier(), pero solo busca la frontera si el
+        trabajador no la conoce o si el cursor del fragmento ya la pasó.
+        get_next_page() la lleva luego al próximo ID del fragmento con next_id().
+        '''
+        if self.sharedFrontier is None:
+            return await super().locate_frontier(userAgent)
+        async with self.sharedFrontier.lock:
+            frontier = self.sharedFrontier.result
+            if frontier is None or frontier['ad']['id'] < self.revolicoAdID:
+                frontier = await super().locate_frontier(userAgent)
+                if frontier is None:
+                    return None
+                self.sharedFrontier.result = frontier
+            self._frontierKnown = True
+            return dict(frontier)
+
+
+    def id_to_file(self, value):
+        try:
+            return self.leases.save_last_id(self.shard, value)
+        except Exception as e:
+            self.show_message('ERROR saving ID of shard {}. {}'.format(self.shard, str(e)))
+            return False
+
+
+
+class ShardWorker():
+    '''Toma su parte de los fragmentos y ejecuta un scraper por cada fragmento que posee.'''
+    def __init__(self, leases, maxHours=SHARD_MAX_HOURS, debugMode=False):
+        self.leases = leases
+        self.maxHours = maxHours
+        self.debugMode = debugMode
+        self.frontier = SharedFrontier()
+        self.store = StateStore()
+        self.router = RoutingIndex(self.store.receivers(), self.store.filters())
+        self.queue = DeliveryQueue()
+        self.index = AdIndex()
+        # Los scrapers de todos los fragmentos comparten las conexiones y el presupuesto de pedidos.
+        self.transport = AsyncSessionPool(budgets=HostBudgets())
+        self.tasks = {}
+        self._reloaded = time.time()
+
+
+    def start_shard(self, shard):
+        scraper = ShardScraper(self.leases, shard, self.maxHours, self.debugMode)
+        # Cada fragmento tiene su planificador, pues sus consultas aciertan o fallan por separado.
+        scraper.poller = AdaptivePoller()
+        scraper.sharedFrontier = self.frontier
+        scraper.attach(self.transport)
+        scraper.holding = HoldingHeap(self.leases.fileName, HOLDING_TABLE_PATTERN.format(shard))
+        self.tasks[shard] = asyncio.create_task(self.run_shard(scraper))
+
+
+    async def stop_shards(self, shards):
+        '''Detiene los scrapers de los fragmentos indicados y espera a que terminen.'''
+        tasks = [self.tasks.pop(shard) for shard in shards if shard in self.tasks]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+    async def run_shard(self, scraper):
+        '''Recorre los IDs del fragmento y agrega los anuncios a la cola de envíos.'''
+        try:
+            while True:
+                interval = POLL_DEFAULT_SECONDS
+                try:
+                    depth = self.queue.depth()
+                    if depth > DELIVERY_QUEUE_MAX_DEPTH:
+                        await to_cmd('WARNING', 'Delivery queue is full ({} pending), shard {} delayed.'.format(depth, scraper.shard))
+                    else:
+                        result = await scraper.next_ad()
+                        if result.get('ad') is not None and self.index.add(result['ad']):
+                            await asyncio.to_thread(self.index.flush)
+                        await enqueue_messages_ad(self.queue, self.store.receivers(), result, router=self.router)
+                        interval = scraper.next_interval()
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    await to_cmd('ERROR', 'Shard {} scraping failed. {}'.format(scraper.shard, str(e)))
+                await asyncio.sleep(interval)
+        finally:
+            await scraper.close()
+            scraper.holding.close()
+
+
+    async def rebalance(self):
+        '''Renueva las concesiones propias y toma o deja fragmentos hasta tener su parte.'''
+        workers = self.leases.heartbeat()
+        owned = self.leases.renew(list(self.tasks))
+        lost = [shard for shard in self.tasks if shard not in owned]
+        if len(lost) > 0:
+            await to_cmd('WARNING', 'Leases lost on shards {}.'.format(lost))
+            await self.stop_shards(lost)
+        share = self.leases.fair_share(workers)
+        if len(owned) > share:
+            extra = sorted(owned)[share:]
+            await self.stop_shards(extra)
+            self.leases.release(extra)
+            await to_cmd('INFO', 'Shards {} released for other workers.'.format(extra))
+        else:
+            for shard, previousOwner in self.leases.acquire(share - len(owned)):
+                if previousOwner is not None and previousOwner != self.leases.workerID:
+                    await to_cmd('INFO', 'Shard {} reclaimed from {}.'.format(shard, previousOwner))
+                else:
+                    await to_cmd('INFO', 'Shard {} acquired.'.format(shard))
+                self.start_shard(shard)
+
+
+    def reload(self):
+        '''Recarga los receptores y sus filtros, que el bot modifica con /new, /del y /filter.'''
+        self.store.load()
+        self.router.build(self.store.receivers(), self.store.filters())
+        self._reloaded = time.time()
+
+
+    async def run(self):
+        '''Bucle principal del trabajador. Termina al cancelarse, dejando libres sus fragmentos.'''
+        try:
+            while True:
+                await self.rebalance()
+                if time.time() - self._reloaded >= SHARD_RELOAD_SECONDS:
+                    try:
+                        self.reload()
+                    except Exception as e:
+                        await to_cmd('WARNING', 'Failed to reload receivers. {}'.format(str(e)))
+                await asyncio.sleep(self.leases.leaseSeconds / 3)
+        finally:
+            shards = list(self.tasks)
+            await self.stop_shards(shards)
+            self.leases.release(shards)
+            await self.close()
+
+
+    async def close(self):
+        await self.transport.close()
+        self.index.close()
+        self.queue.close()
+        self.store.close()
+        self.leases.close()
+
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Trabajador de scraping de un fragmento del espacio de IDs de revolico.')
+    parser.add_argument('--shards', type=int, default=None, help='Cantidad de fragmentos (solo al crear el fichero de concesiones).')
+    parser.add_argument('--worker-id', default=None, help='Nombre del trabajador. Por defecto, equipo:proceso.')
+    parser.add_argument('--file', default=FILE_SHARDS, help='Fichero SQLite compartido de concesiones.')
+    parser.add_argument('--lease', type=float, default=SHARD_LEASE_SECONDS, help='Segundos que dura una concesión.')
+    parser.add_argument('--max-hours', type=float, default=SHARD_MAX_HOURS, help='Antigüedad mínima de los anuncios.')
+    parser.add_argument('--debug', action='store_true', help='Muestra los mensajes del scraper.')
+    args = parser.parse_args()
+
+    try:
+        leases = ShardLeases(args.file, args.shards, args.worker_id, args.lease)
+    except ValueError as e:
+        print(str(e))
+        return
+    print('Worker {} on {} shards.'.format(leases.workerID, leases.shardCount))
+    worker = ShardWorker(leases, args.max_hours, args.debug)
+    try:
+        asyncio.run(worker.run())
+    except KeyboardInterrupt:
+        print('Stopped. The shards of this worker were released.')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,180 @@
+'''Detector de anuncios repetidos.
+Los vendedores vuelven a publicar el mismo anuncio con otro ID varias veces al día.
+Cada anuncio se resume en una huella SimHash de 64 bits calculada con las tejas
+(grupos de palabras consecutivas) del título y la descripción normalizados. Dos anuncios
+se consideran el mismo si sus huellas difieren en pocos bits y comparten teléfono.
+Las huellas se indexan por bandas de bits, por lo que cada consulta solo compara
+contra unos pocos candidatos aunque haya cientos de miles de anuncios en la ventana.
+Además, un anuncio con el mismo teléfono y el mismo título que otro reciente también
+se considera repetido, aunque la descripción haya cambiado. Los anuncios sin teléfono
+nunca se consideran repetidos, pues muchos usan los mismos textos de plantilla.
+'''
+__version__ = '1.0'
+__author__ = 'Santiago Orellana Perez'
+__created__ = '18/octubre/2026'
+__tested__ = 'Python 3.10'
+
+import re
+import time
+import unicodedata
+from collections import deque
+
+# Horas durante las que se recuerda un anuncio para detectar sus repeticiones.
+REPOST_WINDOW_HOURS = 24
+
+# Máxima cantidad de bits diferentes entre las huellas de dos anuncios repetidos.
+# Con 4 bandas de 16 bits, dos huellas que difieren en 3 bits o menos comparten al menos una banda.
+REPOST_MAX_DISTANCE = 3
+SIMHASH_BANDS = 4
+SIMHASH_BAND_BITS = 16
+SIMHASH_MASK = (1 << 64) - 1
+
+# Cantidad de palabras por teja y máximo de tejas que se utilizan por anuncio.
+SHINGLE_WORDS = 3
+SHINGLE_MAX = 128
+
+WORDS_PATTERN = re.compile(r'\w+')
+
+# Para sumar los 64 bits de cada huella en paralelo, cada bit se coloca en su propio
+# carril de 8 bits de un entero grande. Las tablas dan ese entero para cada byte.
+# Los carriles no se desbordan porque nunca hay más de SHINGLE_MAX (< 256) tejas.
+LANE_BITS = 8
+LANE_MASK = (1 << LANE_BITS) - 1
+SPREAD_TABLES = [[sum([((value >> bit) & 1) << ((byte * 8 + bit) * LANE_BITS) for bit in range(8)])
+                  for value in range(256)] for byte in range(8)]
+
+
+def normalize_text(text):
+    '''Devuelve las palabras del texto en minúsculas y sin acentos.'''
+    text = str(text).lower()
+    if not text.isascii():
+        text = unicodedata.normalize('NFKD', text)
+        text = ''.join([char for char in text if not unicodedata.combining(char)])
+    return WORDS_PATTERN.findall(text)
+
+
+def shingles(words):
+    '''Devuelve las tejas de palabras consecutivas del texto.'''
+    if len(words) < SHINGLE_WORDS:
+        return [' '.join(words)] if words else []
+    return [' '.join(words[i:i + SHINGLE_WORDS]) for i in range(min(len(words) - SHINGLE_WORDS + 1, SHINGLE_MAX))]
+
+
+def simhash(features):
+    '''Calcula la huella SimHash de 64 bits de la lista de tejas.
+    Un bit de la huella vale 1 si más de la mitad de las tejas tienen ese bit en 1.
+    '''
+    t0, t1, t2, t3, t4, t5, t6, t7 = SPREAD_TABLES
+    total = 0
+    for feature in features:
+        value = hash(feature)
+        total += (t0[value & 255] + t1[value >> 8 & 255] + t2[value >> 16 & 255] + t3[value >> 24 & 255] +
+                  t4[value >> 32 & 255] + t5[value >> 40 & 255] + t6[value >> 48 & 255] + t7[value >> 56 & 255])
+    half = len(features) // 2
+    fingerprint = 0
+    for bit in range(64):
+        if (total >> (bit * LANE_BITS) & LANE_MASK) > half:
+            fingerprint |= 1 << bit
+    return fingerprint
+
+
+def normalize_phones(phones):
+    '''Devuelve los teléfonos con solo sus últimos 8 dígitos, para ignorar prefijos.'''
+    result = set()
+    for phone in phones:
+        digits = ''.join([char for char in str(phone) if char.isdigit()])
+        if len(digits) >= 7:
+            result.add(digits[-8:])
+    return frozenset(result)
+
+
+class RepostIndex():
+    '''Índice de huellas de los anuncios recientes con ventana deslizante de tiempo.'''
+    def __init__(self, windowHours=REPOST_WINDOW_HOURS, maxDistance=REPOST_MAX_DISTANCE):
+        self.windowSeconds = windowHours * 3600
+        self.maxDistance = maxDistance
+        self._entries = {}
+        self._bands = {}
+        self._titles = {}
+        self._window = deque()
+        self.savedSends = 0
+        self.reposts = 0
+
+
+    def fingerprint(self, titleWords, ad):
+        '''Calcula la huella del título y la descripción del anuncio.'''
+        return simhash(shingles(titleWords + normalize_text(ad.get('description') or '')))
+
+
+    def title_keys(self, titleWords, phoneKeys):
+        '''Devuelve las claves (teléfono, título) del anuncio.'''
+        title = ' '.join(titleWords)
+        return [(phone, title) for phone in phoneKeys]
+
+
+    def band_keys(self, fingerprint):
+        mask = (1 << SIMHASH_BAND_BITS) - 1
+        return [(band, fingerprint >> (band * SIMHASH_BAND_BITS) & mask) for band in range(SIMHASH_BANDS)]
+
+
+    def evict(self, now):
+        '''Olvida los anuncios que salieron de la ventana de tiempo.'''
+        limit = now - self.windowSeconds
+        while self._window and self._window[0][0] < limit:
+            seconds, adID = self._window.popleft()
+            entry = self._entries.pop(adID, None)
+            if entry is None:
+                continue
+            for key in self.band_keys(entry[0]):
+                bucket = self._bands.get(key)
+                if bucket is not None:
+                    bucket.discard(adID)
+                    if not bucket:
+                        del self._bands[key]
+            for key in entry[2]:
+                if self._titles.get(key) == adID:
+                    del self._titles[key]
+
+
+    def check_and_add(self, ad, phones, now=None):
+        '''Agrega el anuncio al índice y devuelve el ID del anuncio del que es repetición, o None.'''
+        if now is None:
+            now = time.time()
+        self.evict(now)
+        adID = ad['id']
+        if adID in self._entries:
+            return None
+        titleWords = normalize_text(ad.get('title') or '')
+        fingerprint = self.fingerprint(titleWords, ad)
+        phoneKeys = normalize_phones(phones)
+        titleKeys = self.title_keys(titleWords, phoneKeys)
+        repostOf = None
+        for key in titleKeys:
+            if key in self._titles:
+                repostOf = self._titles[key]
+                break
+        keys = self.band_keys(fingerprint)
+        for key in keys:
+            if repostOf is not None:
+                break
+            for candidateID in self._bands.get(key, ()):
+                candidateFingerprint, candidatePhones, candidateTitles = self._entries[candidateID]
+                if bin(candidateFingerprint ^ fingerprint).count('1') > self.maxDistance:
+                    continue
+                # Deben compartir algún teléfono: dos anuncios sin teléfono no son repeticiones.
+                if phoneKeys & candidatePhones:
+                    repostOf = candidateID
+                    break
+        self._entries[adID] = (fingerprint, phoneKeys, titleKeys)
+        self._window.append((now, adID))
+        for key in keys:
+            self._bands.setdefault(key, set()).add(adID)
+        for key in titleKeys:
+            self._titles[key] = adID
+        if repostOf is not None:
+            self.reposts += 1
+        return repostOf
+
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,222 @@
+'''Almacén del estado del bot: receptores de publicidad, sus filtros y administradores.
+Los datos se guardan en SQLite (modo WAL), por lo que cada alta o baja es una transacción
+atómica y no hace falta reescribir un fichero completo. En memoria se mantienen índices
+para las consultas frecuentes: el conjunto de IDs de administradores (con IDs enteros,
+igual que los que entrega Telegram) y los receptores agrupados por categoría.
+La lista de receptores se entrega como una instantánea inmutable (tupla) que se reemplaza
+en cada cambio, así quien la esté recorriendo nunca la ve modificarse a medias.
+Si la base de datos está vacía, importa los ficheros receivers.txt y admins.txt anteriores.
+'''
+__version__ = '1.0'
+__author__ = 'Santiago Orellana Perez'
+__created__ = '18/octubre/2026'
+__tested__ = 'Python 3.10'
+
+import os
+import json
+import sqlite3
+
+FILE_STATE = './state.db'
+
+
+class StateStore():
+    '''Receptores y administradores guardados en SQLite con índices en memoria.'''
+    def __init__(self, fileName=FILE_STATE):
+        self.fileName = fileName
+        self.connection = sqlite3.connect(fileName, isolation_level=None)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.execute('''CREATE TABLE IF NOT EXISTS receivers (
+            receiver TEXT NOT NULL,
+            category TEXT NOT NULL,
+            PRIMARY KEY (receiver, category))''')
+        self.connection.execute('CREATE INDEX IF NOT EXISTS receivers_category ON receivers (category)')
+        self.connection.execute('''CREATE TABLE IF NOT EXISTS filters (
+            receiver TEXT PRIMARY KEY,
+            rule TEXT NOT NULL)''')
+        self.connection.execute('''CREATE TABLE IF NOT EXISTS admins (
+            admin_id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL)''')
+        self._receivers = ()
+        self._byCategory = {}
+        self._filters = {}
+        self._admins = {}
+        self.load()
+
+
+    def load(self):
+        '''Carga los índices en memoria desde la base de datos.'''
+        rows = self.connection.execute('SELECT receiver, category FROM receivers ORDER BY rowid').fetchall()
+        self.set_receivers(tuple([{'id':receiver, 'category':category} for receiver, category in rows]))
+        rows = self.connection.execute('SELECT receiver, rule FROM filters').fetchall()
+        self._filters = dict([(receiver, json.loads(rule)) for receiver, rule in rows])
+        self._admins = dict(self.connection.execute('SELECT admin_id, name FROM admins').fetchall())
+
+
+    def set_receivers(self, receivers):
+        '''Reemplaza la instantánea de receptores y su índice por categoría.'''
+        byCategory = {}
+        for receiver in receivers:
+            byCategory.setdefault(receiver['category'], []).append(receiver)
+        self._byCategory = dict([(category, tuple(items)) for category, items in byCategory.items()])
+        self._receivers = receivers
+
+
+    def migrate(self, fileReceivers, fileAdmins):
+        '''Importa las listas de los ficheros JSON de una línea utilizados antes, solo si la
+        tabla correspondiente está vacía. Los ficheros no se modifican.
+        Devuelve la cantidad de receptores y de administradores importados.
+        '''
+        countReceivers = 0
+        countAdmins = 0
+        if len(self._receivers) == 0 and os.path.exists(fileReceivers):
+            with open(fileReceivers, 'r') as fileIn:
+                line = fileIn.readline()
+            if line.strip() != '':
+                rows = [(str(receiver['id']), str(receiver['category'])) for receiver in json.loads(line)]
+                with self.connection:
+                    self.connection.execute('BEGIN IMMEDIATE')
+                    countReceivers = self.connection.executemany(
+                        'INSERT OR IGNORE INTO receivers (receiver, category) VALUES (?, ?)', rows).rowcount
+        if len(self._admins) == 0 and os.path.exists(fileAdmins):
+            with open(fileAdmins, 'r') as fileIn:
+                line = fileIn.readline()
+            if line.strip() != '':
+                rows = []
+                for admin in json.loads(line):
+                    adminID = self.to_user_id(admin['id'])
+                    if adminID is not None:
+                        rows.append((adminID, str(admin.get('name', ''))))
+                with self.connection:
+                    self.connection.execute('BEGIN IMMEDIATE')
+                    countAdmins = self.connection.executemany(
+                        'INSERT OR REPLACE INTO admins (admin_id, name) VALUES (?, ?)', rows).rowcount
+        if countReceivers > 0 or countAdmins > 0:
+            self.load()
+        return countReceivers, countAdmins
+
+
+    @staticmethod
+    def to_user_id(value):
+        '''Convierte el ID de un usuario a entero. Devuelve None si no es un número.'''
+        try:
+            return int(str(value).strip())
+        except ValueError:
+            return None
+
+
+    def receivers(self):
+        '''Devuelve la instantánea actual de receptores. No se debe modificar.'''
+        return self._receivers
+
+
+    def receivers_by_id(self, receiverID):
+        '''Devuelve las entradas (una por categoría) del receptor indicado.'''
+        receiverID = str(receiverID)
+        return tuple([receiver for receiver in self._receivers if receiver['id'] == receiverID])
+
+
+    def receivers_by_category(self, category):
+        '''Devuelve los receptores de la categoría indicada.'''
+        return self._byCategory.get(category, ())
+
+
+    def add_receiver(self, receiverID, category):
+        '''Agrega un receptor a la categoría. Devuelve False si ya estaba.'''
+        receiverID = str(receiverID)
+        with self.connection:
+            self.connection.execute('BEGIN IMMEDIATE')
+            added = self.connection.execute('INSERT OR IGNORE INTO receivers (receiver, category) VALUES (?, ?)',
+                                            (receiverID, category)).rowcount > 0
+        if added:
+            self.set_receivers(self._receivers + ({'id':receiverID, 'category':category},))
+        return added
+
+
+    def remove_receiver(self, receiverID):
+        '''Elimina el receptor de todas sus categorías. Devuelve la cantidad de entradas eliminadas.'''
+        receiverID = str(receiverID)
+        with self.connection:
+            self.connection.execute('BEGIN IMMEDIATE')
+            removed = self.connection.execute('DELETE FROM receivers WHERE receiver = ?', (receiverID,)).rowcount
+            self.connection.execute('DELETE FROM filters WHERE receiver = ?', (receiverID,))
+        if removed > 0:
+            self.set_receivers(tuple([receiver for receiver in self._receivers if receiver['id'] != receiverID]))
+        if receiverID in self._filters:
+            filters = dict(self._filters)
+            del filters[receiverID]
+            self._filters = filters
+        return removed
+
+
+    def filters(self):
+        '''Devuelve el diccionario receptor -> regla de filtro. No se debe modificar.'''
+        return self._filters
+
+
+    def set_filter(self, receiverID, rule):
+        '''Guarda la regla de filtro del receptor, reemplazando la anterior.'''
+        receiverID = str(receiverID)
+        with self.connection:
+            self.connection.execute('BEGIN IMMEDIATE')
+            self.connection.execute('INSERT OR REPLACE INTO filters (receiver, rule) VALUES (?, ?)',
+                                    (receiverID, json.dumps(rule, ensure_ascii=False)))
+        filters = dict(self._filters)
+        filters[receiverID] = rule
+        self._filters = filters
+
+
+    def remove_filter(self, receiverID):
+        '''Quita la regla de filtro del receptor. Devuelve False si no tenía.'''
+        receiverID = str(receiverID)
+        if receiverID not in self._filters:
+            return False
+        with self.connection:
+            self.connection.execute('BEGIN IMMEDIATE')
+            self.connection.execute('DELETE FROM filters WHERE receiver = ?', (receiverID,))
+        filters = dict(self._filters)
+        del filters[receiverID]
+        self._filters = filters
+        return True
+
+
+    def is_admin(self, userID):
+        '''Dice si el usuario es administrador.'''
+        return userID in self._admins
+
+
+    def admins(self):
+        '''Devuelve la lista de administradores.'''
+        return [{'id':adminID, 'name':name} for adminID, name in self._admins.items()]
+
+
+    def add_admin(self, adminID, name):
+        '''Agrega o renombra un administrador. Devuelve False si el ID no es un número.'''
+        adminID = self.to_user_id(adminID)
+        if adminID is None:
+            return False
+        with self.connection:
+            self.connection.execute('BEGIN IMMEDIATE')
+            self.connection.execute('INSERT OR REPLACE INTO admins (admin_id, name) VALUES (?, ?)', (adminID, str(name)))
+        admins = dict(self._admins)
+        admins[adminID] = str(name)
+        self._admins = admins
+        return True
+
+
+    def remove_admin(self, adminID):
+        '''Elimina un administrador. Devuelve False si no existía.'''
+        adminID = self.to_user_id(adminID)
+        if adminID is None or adminID not in self._admins:
+            return False
+        with self.connection:
+            self.connection.execute('BEGIN IMMEDIATE')
+            self.connection.execute('DELETE FROM admins WHERE admin_id = ?', (adminID,))
+        admins = dict(self._admins)
+        del admins[adminID]
+        self._admins = admins
+        return True
+
+
+    def close(self):
+        self.connection.close()